@@ -1,13 +1,21 @@
 # cli/main.py
 
+import sys
 import time
 import logging
-from tqdm import tqdm
+import argparse
 
-from food_lens.agent import analyze_restaurant_allergens
+from food_lens.agent import iter_analyze_restaurant_allergens
+from food_lens.events import ProgressEvent, ItemsEvent, ChangesEvent, ResultEvent
 from food_lens.utils import normalize_restaurant_name
-from food_lens.output import print_dairy_safe_results
+from food_lens.output import print_safe_results
 from food_lens.logging_config import setup_logging
+from food_lens.cache import get_default_cache
+from food_lens.instrumentation import metrics
+from food_lens.llm_client import token_usage
+from food_lens.allergen_matrix import parse_allergens
+from food_lens.batch import run_batch, read_jobs, order_by_jobs, write_output, STAGE_LIMITS
+from food_lens.service_client import get_service_client
 
 
 def get_restaurant_name():
@@ -17,21 +25,80 @@ def get_restaurant_name():
 
 
 def get_allergen_to_avoid():
-    supported = ["dairy", "nuts"]  # Extend this list as needed
-    allergen = input("What allergen should we avoid? (e.g., dairy, nuts, etc.): ").strip().lower()
-    if allergen not in supported:
-        print(f"⚠️ Unsupported allergen: {allergen}. Defaulting to dairy.")
-        return "dairy"
-    return allergen
-
+    allergen = input("What allergens should we avoid? (e.g., dairy, or dairy, egg, sesame): ").strip().lower()
+    try:
+        allergens = parse_allergens(allergen)
+    except ValueError as e:
+        print(f"⚠️ {e}. Defaulting to dairy.")
+        return ["dairy"]
+    if not allergens:
+        print("⚠️ No allergen given. Defaulting to dairy.")
+        return ["dairy"]
+    return allergens
+
+
+def print_event(event):
+    """Print progress and newly found items as the analysis streams them."""
+    if isinstance(event, ProgressEvent):
+        print(event.message)
+    elif isinstance(event, ItemsEvent):
+        for item in event.full_items + event.sub_items:
+            print(f"   + {item}")
+    elif isinstance(event, ChangesEvent):
+        print("🔁 The allergen guide changed since it was last analyzed:")
+        for item in event.became_unsafe:
+            print(f"   ⚠️ no longer safe: {item}")
+        for item in event.became_safe:
+            print(f"   ✅ newly safe: {item}")
+
+
+def run_batch_command(argv):
+    parser = argparse.ArgumentParser(
+        prog="run_cli.py batch",
+        description="Analyze many restaurants × allergen sets from a CSV or JSONL file.",
+    )
+    parser.add_argument("input", help="CSV (restaurant,allergens) or JSONL input file")
+    parser.add_argument("-o", "--output", required=True, help="Output file (.jsonl or .parquet)")
+    for stage, limit in STAGE_LIMITS.items():
+        parser.add_argument(f"--{stage}-workers", type=int, default=limit,
+                            help=f"Concurrent {stage} operations (default: {limit})")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose logging")
+    args = parser.parse_args(argv)
+
+    setup_logging(level=logging.DEBUG if args.verbose else logging.INFO)
+    stage_limits = {stage: getattr(args, f"{stage}_workers") for stage in STAGE_LIMITS}
 
-def show_loading(message="Working...", duration=1.5):
-    steps = 30
-    for _ in tqdm(range(steps), desc=message, ncols=70):
-        time.sleep(duration / steps)
+    start_time = time.time()
+    client = get_service_client()
+    if client:
+        # The service applies its own stage limits; there is no local checkpoint
+        jobs = read_jobs(args.input)
+        records = order_by_jobs(client.run_batch(jobs), jobs)
+        write_output(records, args.output)
+        failed = sum(1 for record in records if record["error"])
+        summary = {"jobs": len(jobs), "completed": len(records) - failed, "failed": failed, "output": args.output}
+    else:
+        summary = run_batch(args.input, args.output, stage_limits=stage_limits)
+    duration = time.time() - start_time
+    print(
+        f"\n✅ Batch finished in {duration:.2f} seconds: {summary['completed']}/{summary['jobs']} jobs written "
+        f"to {summary['output']} ({summary['failed']} failed)."
+    )
+    usage = token_usage()
+    if usage["prompt_tokens"] or usage["saved_prompt_tokens"]:
+        print(
+            f"🧠 LLM tokens: {usage['prompt_tokens'] + usage['completion_tokens']} used, "
+            f"{usage['saved_prompt_tokens'] + usage['saved_completion_tokens']} saved "
+            f"({usage['cache_hits']} cached answers, {usage['dedup_hits']} duplicate prompts)."
+        )
+    logging.debug(f"Metrics: {metrics.snapshot()}")
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        run_batch_command(sys.argv[2:])
+        return
+
     # Ask for log level preference first
     verbose = input("Enable verbose logging? (y/n): ").strip().lower() == "y"
     setup_logging(level=logging.DEBUG if verbose else logging.INFO)
@@ -44,10 +111,22 @@ def main():
     allergen = get_allergen_to_avoid()
 
     start_time = time.time()
-    show_loading("Looking for allergen data")
 
     try:
-        results = analyze_restaurant_allergens(restaurant, allergen=allergen)
+        client = get_service_client()
+        analyze = client.iter_analyze_restaurant_allergens if client else iter_analyze_restaurant_allergens
+        results = None
+        first_item_time = None
+        for event in analyze(restaurant, allergen):
+            if isinstance(event, ResultEvent):
+                results = event.result
+                if event.stale:
+                    print("🔄 Showing the last known analysis while the guide is checked for updates.")
+            else:
+                if isinstance(event, ItemsEvent) and first_item_time is None:
+                    first_item_time = time.time() - start_time
+                    logging.debug(f"First safe item after {first_item_time:.2f} seconds")
+                print_event(event)
 
         if not results:
             print("❌ Could not find or analyze allergen data.")
@@ -57,7 +136,12 @@ def main():
         duration = time.time() - start_time
         print(f"\n✅ Analysis completed in {duration:.2f} seconds.\n")
 
-        print_dairy_safe_results(full_items, sub_items)
+        print_safe_results(full_items, sub_items, allergen)
+        if client:
+            logging.debug(f"Service status: {client.status()}")
+        else:
+            logging.debug(f"Cache stats: {get_default_cache().stats.as_dict()}")
+            logging.debug(f"Metrics: {metrics.snapshot()}")
 
     except Exception as e:
         logging.error("An unexpected error occurred", exc_info=True)
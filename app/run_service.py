@@ -0,0 +1,8 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from food_lens.service import main
+
+if __name__ == "__main__":
+    main()
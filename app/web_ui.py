@@ -3,12 +3,19 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 import streamlit as st
-from food_lens.agent import analyze_restaurant_allergens
+from food_lens.agent import iter_analyze_restaurant_allergens
+from food_lens.events import ProgressEvent, ItemsEvent, ChangesEvent, ResultEvent
+from food_lens.cache import get_default_cache
+from food_lens.allergen_matrix import ALLERGENS
+from food_lens.service_client import get_service_client
 
 
 # ✅ Set page config FIRST
 st.set_page_config(page_title="FoodLens", layout="centered")
 
+# With FOODLENS_SERVICE_URL set, analyses run on the shared service instead of in this script
+client = get_service_client()
+
 # Load custom CSS
 with open("app/style.css") as f:
     st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
@@ -26,40 +33,84 @@ col1, col2 = st.columns([2, 1])
 with col1:
     restaurant = st.text_input("Restaurant name", placeholder="e.g. Panera, Chick-fil-A, McDonald's")
 with col2:
-    allergen = st.selectbox("Allergen to avoid", [
-        "dairy", "egg", "peanuts", "tree nuts", "soy", "wheat", "fish", "shellfish", "sesame"
-    ])
+    allergens = st.multiselect("Allergens to avoid", ALLERGENS, default=["dairy"])
+
+def render_items(placeholder, title, items):
+    with placeholder.container():
+        st.subheader(title)
+        if items:
+            for item in items:
+                st.markdown(f"- {item}")
+        else:
+            st.markdown("_None found._")
+
 
 # --- Analyze on click ---
 if st.button("Find Safe Menu Items"):
     if not restaurant:
         st.warning("Please enter a restaurant name.")
+    elif not allergens:
+        st.warning("Please select at least one allergen.")
     else:
-        with st.spinner("Analyzing allergen data..."):
-            result = analyze_restaurant_allergens(restaurant.strip(), allergen.lower())
+        progress = st.progress(0.0, text="Analyzing allergen data...")
 
         st.divider()
 
-        # --- Results display ---
+        # --- Results display, updated as items stream in ---
         with st.container():
-            if result is None:
-                st.error("No results found or analysis failed. Please try another restaurant.")
-            else:
-                full_items, sub_items = result
-
-                st.subheader("Safe Main Menu Items")
-                if full_items:
-                    for item in full_items:
-                        st.markdown(f"- {item}")
-                else:
-                    st.markdown("_None found._")
-
-                st.subheader("Safe Ingredients / Sides")
-                if sub_items:
-                    for item in sub_items:
-                        st.markdown(f"- {item}")
-                else:
-                    st.markdown("_None found._")
+            error_box = st.empty()
+            full_box = st.empty()
+            sub_box = st.empty()
+
+        analyze = client.iter_analyze_restaurant_allergens if client else iter_analyze_restaurant_allergens
+        full_items, sub_items = [], []
+        result = None
+        try:
+            for event in analyze(restaurant.strip(), allergens):
+                if isinstance(event, ProgressEvent):
+                    fraction = event.current / event.total if event.total else 0.0
+                    progress.progress(min(fraction, 1.0), text=event.message)
+                elif isinstance(event, ItemsEvent):
+                    full_items.extend(event.full_items)
+                    sub_items.extend(event.sub_items)
+                    render_items(full_box, "Safe Main Menu Items", full_items)
+                    render_items(sub_box, "Safe Ingredients / Sides", sub_items)
+                elif isinstance(event, ChangesEvent):
+                    if event.became_unsafe:
+                        st.warning("No longer safe since the guide was updated: " + ", ".join(event.became_unsafe))
+                    if event.became_safe:
+                        st.info("Newly safe since the guide was updated: " + ", ".join(event.became_safe))
+                elif isinstance(event, ResultEvent):
+                    result = event.result
+                    if event.stale:
+                        st.caption("Showing the last known analysis while the guide is checked for updates.")
+        except Exception as e:
+            result = None
+            st.caption(f"Service error: {e}")
+
+        progress.empty()
+
+        if result is None:
+            full_box.empty()
+            sub_box.empty()
+            error_box.error("No results found or analysis failed. Please try another restaurant.")
+        else:
+            # The final result is authoritative; replace the streamed lists with it
+            render_items(full_box, "Safe Main Menu Items", result[0])
+            render_items(sub_box, "Safe Ingredients / Sides", result[1])
+
+# --- Cache statistics ---
+with st.sidebar.expander("Cache statistics"):
+    try:
+        stats = client.status()["cache"] if client else get_default_cache().stats.as_dict()
+    except Exception as e:
+        stats = {}
+        st.markdown(f"_Service unavailable: {e}_")
+    if stats:
+        for namespace, counts in stats.items():
+            st.markdown(f"**{namespace}**: {counts['hits']} hits / {counts['misses']} misses")
+    else:
+        st.markdown("_No lookups yet._")
 
 # --- Footer ---
 st.divider()
@@ -0,0 +1,175 @@
+# benchmarks/corpus.py
+
+import os
+import json
+import random
+from typing import Optional
+
+import fitz
+
+from food_lens.allergen_matrix import AllergenMatrix
+
+MANIFEST = "manifest.json"
+
+# Allergen columns used in generated guides, as they appear in real headers
+COLUMNS = ["Milk", "Egg", "Soy", "Wheat"]
+
+DISHES = ["Salad", "Bowl", "Soup", "Sandwich", "Wrap", "Pizza", "Mac", "Chili"]
+SIDES = ["Dressing", "Sauce", "Bread", "Chips", "Latte", "Lemonade", "Cookie", "Topping"]
+FLAVORS = [
+    "Greek", "Asian", "Garden", "Harvest", "Smoky", "Spicy", "Classic", "Lemon",
+    "Herb", "Roasted", "Tomato", "Citrus", "Maple", "Chipotle", "Basil", "Ginger",
+]
+
+ROWS_PER_PAGE = 30
+LINES_PER_PAGE = 50
+
+
+def make_menu(rng: random.Random, size: int) -> list[tuple[str, list[str]]]:
+    """Return [(item, [contained columns])]; at most two allergens per item."""
+    names = [f"{flavor} {kind}" for flavor in FLAVORS for kind in DISHES + SIDES]
+    rng.shuffle(names)
+    menu = []
+    for name in names[:size]:
+        contains = [column for column in COLUMNS if rng.random() < 0.3][:2]
+        menu.append((name, contains))
+    return menu
+
+
+def menu_tables(menu: list[tuple[str, list[str]]]) -> list[list[list[str]]]:
+    """The menu as allergen tables, one per page, each with a header row."""
+    header = ["Item"] + COLUMNS
+    tables = []
+    for start in range(0, len(menu), ROWS_PER_PAGE):
+        rows = [
+            [name] + ["Yes" if column in contains else "" for column in COLUMNS]
+            for name, contains in menu[start:start + ROWS_PER_PAGE]
+        ]
+        tables.append([header] + rows)
+    return tables
+
+
+def menu_lines(menu: list[tuple[str, list[str]]]) -> list[str]:
+    """The menu as plain text lines, the way untabulated guides list it."""
+    lines = []
+    for name, contains in menu:
+        if contains:
+            lines.append(" | ".join([name] + [f"{column}: Yes" for column in contains]))
+        else:
+            lines.append(f"{name} | No Major Allergens Present")
+    return lines
+
+
+def draw_table(page, rows, x=40, y=40, col_width=80, row_height=18):
+    """Draw a ruled table so table detection picks it up."""
+    widths = [col_width * 2] + [col_width] * (len(rows[0]) - 1)
+    right = x + sum(widths)
+    for r in range(len(rows) + 1):
+        page.draw_line((x, y + r * row_height), (right, y + r * row_height))
+    left = x
+    for width in [0] + widths:
+        left += width
+        page.draw_line((left, y), (left, y + len(rows) * row_height))
+    for r, row in enumerate(rows):
+        left = x
+        for c, cell in enumerate(row):
+            page.insert_text((left + 3, y + r * row_height + 13), cell, fontsize=9)
+            left += widths[c]
+
+
+def write_table_pdf(path: str, menu: list[tuple[str, list[str]]], nutrition_pages: int = 2) -> None:
+    doc = fitz.open()
+    for table in menu_tables(menu):
+        draw_table(doc.new_page(), table)
+    for _ in range(nutrition_pages):
+        page = doc.new_page()
+        page.insert_text((40, 40), "Nutrition information and legal notices", fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def write_text_pdf(path: str, menu: list[tuple[str, list[str]]]) -> None:
+    lines = menu_lines(menu)
+    doc = fitz.open()
+    for start in range(0, len(lines), LINES_PER_PAGE):
+        page = doc.new_page()
+        for i, line in enumerate(lines[start:start + LINES_PER_PAGE]):
+            page.insert_text((40, 40 + i * 14), line, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def write_html(path: str, restaurant: str, menu: list[tuple[str, list[str]]]) -> None:
+    items = "\n".join(f"<li>{line}</li>" for line in menu_lines(menu))
+    html = (
+        f"<html><head><title>{restaurant} Allergens</title></head><body>"
+        f"<header><h1>{restaurant} Allergen Guide</h1><nav>Menu | Locations | Careers</nav></header>"
+        f"<main><ul>\n{items}\n</ul></main>"
+        f"</body></html>"
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+def golden_result(menu: list[tuple[str, list[str]]], allergens: list[str]) -> dict:
+    """Expected (full_items, sub_items) for a query, derived from the menu itself."""
+    matrix = AllergenMatrix.from_tables(menu_tables(menu))
+    full_items, sub_items = matrix.safe_items(allergens)
+    return {"full_items": full_items, "sub_items": sub_items}
+
+
+def generate_corpus(
+    directory: str,
+    restaurants: int = 12,
+    menu_size: int = 80,
+    allergens: Optional[list[str]] = None,
+    seed: int = 7,
+) -> dict:
+    """
+    Write a deterministic corpus of guides and its golden outputs to
+    `directory`. Restaurants rotate through three source kinds: ruled-table
+    PDFs (parsed without the LLM), text-only PDFs and HTML pages (both sent
+    to the LLM).
+    """
+    allergens = allergens or ["dairy"]
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    entries = []
+    kinds = ["pdf_table", "pdf_text", "html"]
+    for i in range(restaurants):
+        restaurant = f"Bench Kitchen {i + 1}"
+        kind = kinds[i % len(kinds)]
+        menu = make_menu(rng, menu_size)
+        slug = f"bench-kitchen-{i + 1}"
+
+        if kind == "pdf_table":
+            filename = f"{slug}-allergens.pdf"
+            write_table_pdf(os.path.join(directory, filename), menu)
+        elif kind == "pdf_text":
+            filename = f"{slug}-allergens.pdf"
+            write_text_pdf(os.path.join(directory, filename), menu)
+        else:
+            filename = f"{slug}-allergens.html"
+            write_html(os.path.join(directory, filename), restaurant, menu)
+
+        entries.append({
+            "restaurant": restaurant,
+            "kind": kind,
+            "file": filename,
+            "golden": golden_result(menu, allergens),
+        })
+
+    manifest = {"allergens": allergens, "restaurants": entries}
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_corpus(directory: str) -> dict:
+    """
+    Load a corpus manifest. Recorded guides can be benchmarked the same way:
+    put the files next to a manifest.json listing restaurant, file and golden.
+    """
+    with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+        return json.load(f)
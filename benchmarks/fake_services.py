@@ -0,0 +1,185 @@
+# benchmarks/fake_services.py
+
+import os
+import re
+import json
+import time
+import threading
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from food_lens.allergen_matrix import ALLERGENS, canonical_allergen, find_allergens
+from food_lens.smart_table_parser import categorize_item
+
+CONTENT_TYPES = {".pdf": "application/pdf", ".html": "text/html; charset=utf-8"}
+
+
+def fake_completion(prompt: str) -> str:
+    """
+    Answer an allergen prompt the way a well-behaved model would: read each
+    "Item | Milk: Yes" / "Item | No Major Allergens Present" line of the
+    guide and list the items free of the prompt's allergen, or every item
+    with its allergens as JSON when the prompt asks for the matrix.
+    """
+    match = re.search(r"safe for someone with an? ([A-Z ]+?) allergy", prompt)
+    allergen = canonical_allergen(match.group(1)) if match else "dairy"
+    guide = prompt.split("----------------------")[1] if prompt.count("----------------------") >= 2 else prompt
+
+    rows = []
+    for line in guide.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) < 2 or not parts[0]:
+            continue
+        contained = {
+            canonical_allergen(part.split(":")[0])
+            for part in parts[1:]
+            if part.lower().endswith(": yes")
+        }
+        rows.append((parts[0], contained))
+
+    if "allergens_listed" in prompt:
+        # "No Major Allergens Present" reports on every allergen
+        listed = ALLERGENS if "no major allergens present" in guide.lower() else sorted(find_allergens(guide))
+        return json.dumps({
+            "allergens_listed": listed,
+            "items": [
+                {"name": name, "category": categorize_item(name), "contains": sorted(contained)}
+                for name, contained in rows
+            ],
+        })
+
+    full_items, sub_items = [], []
+    for name, contained in rows:
+        if allergen in contained:
+            continue
+        (full_items if categorize_item(name) == "full" else sub_items).append(name)
+
+    return "\n".join(
+        ["--- FULL MENU ITEMS ---"] + [f"- {item}" for item in full_items]
+        + ["", "--- INDIVIDUAL SAFE INGREDIENTS ---"] + [f"- {item}" for item in sub_items]
+    )
+
+
+class FakeServices:
+    """
+    One local HTTP server standing in for everything the pipeline talks to:
+    SerpAPI search (/search), the restaurant sites serving the guides
+    (/files/...), and the OpenAI chat completions API (/v1/chat/completions).
+    """
+
+    def __init__(self, corpus_dir: str, manifest: dict, http_latency: float = 0.0, llm_latency: float = 0.0):
+        self.corpus_dir = corpus_dir
+        self.http_latency = http_latency
+        self.llm_latency = llm_latency
+        self.files = {entry["restaurant"].lower(): entry["file"] for entry in manifest["restaurants"]}
+        self.requests: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "FakeServices":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def search_results(self, query: str) -> dict:
+        restaurant = re.sub(r"\s+allergen.*$", "", query).strip().lower()
+        results = [{"link": f"{self.base_url}/files/missing-allergens.pdf"}]  # a dead link, as in real results
+        filename = self.files.get(restaurant)
+        if filename:
+            results.append({"link": f"{self.base_url}/files/{filename}"})
+        return {"organic_results": results}
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, status: int, body: bytes, content_type: str, head: bool = False):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+            def serve_file(self, head: bool):
+                services.count("head" if head else "files")
+                time.sleep(services.http_latency)
+                name = os.path.basename(unquote(urlparse(self.path).path))
+                path = os.path.join(services.corpus_dir, name)
+                if not os.path.isfile(path):
+                    return self.send_body(404, b"Not found", "text/plain", head)
+                with open(path, "rb") as f:
+                    body = f.read()
+                self.send_body(200, body, CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream"), head)
+
+            def do_HEAD(self):
+                if self.path.startswith("/files/"):
+                    return self.serve_file(head=True)
+                self.send_body(404, b"", "text/plain", head=True)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/search":
+                    services.count("search")
+                    time.sleep(services.http_latency)
+                    query = parse_qs(url.query).get("q", [""])[0]
+                    body = json.dumps(services.search_results(query)).encode("utf-8")
+                    return self.send_body(200, body, "application/json")
+                if url.path.startswith("/files/"):
+                    return self.serve_file(head=False)
+                self.send_body(404, b"Not found", "text/plain")
+
+            def do_POST(self):
+                if urlparse(self.path).path != "/v1/chat/completions":
+                    return self.send_body(404, b"Not found", "text/plain")
+                services.count("chat")
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                prompt = "\n".join(message.get("content", "") for message in payload.get("messages", []))
+                time.sleep(services.llm_latency)
+
+                content = fake_completion(prompt)
+                prompt_tokens = (len(prompt) + 3) // 4
+                completion_tokens = (len(content) + 3) // 4
+                body = json.dumps({
+                    "id": "chatcmpl-bench",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": payload.get("model", "bench"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                }).encode("utf-8")
+                self.send_body(200, body, "application/json")
+
+        return Handler
@@ -0,0 +1,257 @@
+# benchmarks/run_benchmark.py
+"""
+Offline benchmark for the full analyze_restaurant_allergens pipeline.
+
+Generates (or loads) a corpus of allergen guides, serves search results,
+guides and chat completions from a local server, runs every restaurant
+through the pipeline and reports per-stage latency, throughput, peak RSS
+and accuracy against the corpus' golden outputs. No network access or API
+keys are needed.
+
+    python benchmarks/run_benchmark.py --restaurants 30 --llm-latency-ms 400 --concurrency 4
+"""
+
+import sys
+import os
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from dataclasses import replace
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from food_lens.agent import analyze_restaurant_allergens
+from food_lens.allergen_matrix import parse_allergens
+from food_lens.cache import BaseCache, NullCache, MemoryCache
+from food_lens.config import AppContext, Settings, set_context
+from food_lens.instrumentation import metrics
+from food_lens.logging_config import setup_logging
+from benchmarks.corpus import MANIFEST, generate_corpus, load_corpus
+from benchmarks.fake_services import FakeServices
+
+# Stages reported, in pipeline order (span names from food_lens.instrumentation)
+STAGES = [
+    "analyze", "search", "search.serpapi", "search.probes", "probe", "download", "download.html",
+    "text_extraction", "tables.page", "preprocess", "llm.chunk", "llm.parse",
+]
+
+
+@contextmanager
+def local_pipeline(base_url: str, index_path: str):
+    """Point search, the LLM client and the restaurant index at local stand-ins for the duration of the block."""
+    settings = replace(
+        Settings.from_env(),
+        restaurant_index_path=index_path,
+        openai_api_key="bench",
+        openai_base_url=f"{base_url}/v1",
+        serpapi_api_key="bench",
+        serpapi_url=f"{base_url}/search",
+        # Account rate limits would dominate the measurement
+        requests_per_minute=10**9,
+        tokens_per_minute=10**12,
+    )
+    previous = set_context(AppContext(settings))
+    try:
+        yield
+    finally:
+        set_context(previous)
+
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def score(result: Optional[tuple], golden: dict) -> dict:
+    """Compare one analysis with its golden output, by item name."""
+    full_items, sub_items = result or ([], [])
+    predicted = set(full_items) | set(sub_items)
+    expected = set(golden["full_items"]) | set(golden["sub_items"])
+    return {
+        "true_positives": len(predicted & expected),
+        "false_positives": len(predicted - expected),
+        "false_negatives": len(expected - predicted),
+        "exact": set(full_items) == set(golden["full_items"]) and set(sub_items) == set(golden["sub_items"]),
+    }
+
+
+def summarize_accuracy(scores: list[dict]) -> dict:
+    tp = sum(s["true_positives"] for s in scores)
+    fp = sum(s["false_positives"] for s in scores)
+    fn = sum(s["false_negatives"] for s in scores)
+    return {
+        "precision": round(tp / (tp + fp), 4) if tp + fp else 1.0,
+        "recall": round(tp / (tp + fn), 4) if tp + fn else 1.0,
+        "exact": sum(s["exact"] for s in scores),
+        "total": len(scores),
+    }
+
+
+def run_corpus(manifest: dict, allergens: list[str], cache: BaseCache, concurrency: int) -> list[dict]:
+    def analyze(entry: dict) -> dict:
+        result = analyze_restaurant_allergens(entry["restaurant"], allergens, cache=cache)
+        return {"restaurant": entry["restaurant"], "kind": entry.get("kind", "unknown"),
+                **score(result, entry["golden"])}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return list(executor.map(analyze, manifest["restaurants"]))
+
+
+def run_benchmark(
+    corpus_dir: Optional[str] = None,
+    restaurants: int = 12,
+    menu_size: int = 80,
+    concurrency: int = 1,
+    http_latency: float = 0.0,
+    llm_latency: float = 0.0,
+    warm: bool = False,
+) -> dict:
+    """
+    Run the pipeline over a corpus and return the report as a dict.
+    Latencies are in milliseconds; http_latency and llm_latency in seconds.
+    With warm=True the corpus is run once to fill a memory cache and only
+    the second, cached pass is measured.
+    """
+    with tempfile.TemporaryDirectory(prefix="foodlens-bench-") as scratch:
+        corpus_dir = corpus_dir or scratch
+        if os.path.exists(os.path.join(corpus_dir, MANIFEST)):
+            manifest = load_corpus(corpus_dir)
+        else:
+            manifest = generate_corpus(corpus_dir, restaurants=restaurants, menu_size=menu_size)
+        allergens = parse_allergens(manifest["allergens"])
+
+        with FakeServices(corpus_dir, manifest, http_latency, llm_latency) as services, \
+                local_pipeline(services.base_url, os.path.join(scratch, "restaurants.idx")):
+            cache = MemoryCache() if warm else NullCache()
+            if warm:
+                run_corpus(manifest, allergens, cache, concurrency)
+            metrics.reset()
+            services.requests.clear()
+
+            started = time.perf_counter()
+            scores = run_corpus(manifest, allergens, cache, concurrency)
+            wall = time.perf_counter() - started
+            requests = dict(services.requests)
+
+    snapshot = metrics.snapshot()
+    stages = {}
+    for name in STAGES:
+        histogram = snapshot["histograms"].get(f"{name}.ms")
+        if histogram:
+            stages[name] = {
+                "count": histogram["count"],
+                "p50_ms": histogram["p50"],
+                "p95_ms": histogram["p95"],
+                "per_second": round(histogram["count"] / wall, 2) if wall else None,
+            }
+
+    by_kind = {}
+    for kind in sorted({s["kind"] for s in scores}):
+        by_kind[kind] = summarize_accuracy([s for s in scores if s["kind"] == kind])
+
+    return {
+        "restaurants": len(scores),
+        "allergens": allergens,
+        "concurrency": concurrency,
+        "warm": warm,
+        "wall_seconds": round(wall, 3),
+        "restaurants_per_second": round(len(scores) / wall, 2) if wall else None,
+        "first_item": snapshot["histograms"].get("analyze.first_item.ms"),
+        "stages": stages,
+        "counters": snapshot["counters"],
+        "service_requests": requests,
+        "peak_rss_mb": peak_rss_mb(),
+        "accuracy": summarize_accuracy(scores),
+        "accuracy_by_kind": by_kind,
+        "misses": [s for s in scores if not s["exact"]],
+    }
+
+
+def format_ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"📊 {report['restaurants']} restaurants ({', '.join(report['allergens'])}) in {report['wall_seconds']:.2f}s "
+        f"— {report['restaurants_per_second']} restaurants/s, concurrency {report['concurrency']}"
+        f"{', warm cache' if report['warm'] else ''}",
+        "",
+        f"{'stage':<18}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'per s':>9}",
+    ]
+    for name, stage in report["stages"].items():
+        lines.append(
+            f"{name:<18}{stage['count']:>7}{format_ms(stage['p50_ms']):>10}"
+            f"{format_ms(stage['p95_ms']):>10}{stage['per_second']:>9}"
+        )
+
+    first_item = report["first_item"] or {}
+    accuracy = report["accuracy"]
+    rss = report["peak_rss_mb"]
+    counters = report["counters"]
+    lines += [
+        "",
+        f"First item: p50 {format_ms(first_item.get('p50'))} ms, p95 {format_ms(first_item.get('p95'))} ms",
+        f"LLM tokens: {counters.get('llm.prompt_tokens', 0)} prompt, {counters.get('llm.completion_tokens', 0)} completion "
+        f"({counters.get('llm.saved_prompt_tokens', 0) + counters.get('llm.saved_completion_tokens', 0)} saved)",
+        f"Service requests: {report['service_requests']}",
+        f"Peak RSS: {rss['self']} MB (child processes {rss['children']} MB)",
+        f"Accuracy: precision {accuracy['precision']}, recall {accuracy['recall']}, "
+        f"{accuracy['exact']}/{accuracy['total']} exact",
+    ]
+    for kind, kind_accuracy in report["accuracy_by_kind"].items():
+        lines.append(
+            f"  {kind:<10} precision {kind_accuracy['precision']}, recall {kind_accuracy['recall']}, "
+            f"{kind_accuracy['exact']}/{kind_accuracy['total']} exact"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the offline FoodLens pipeline benchmark.")
+    parser.add_argument("--corpus", help="Corpus directory; generated there if it has no manifest.json")
+    parser.add_argument("--restaurants", type=int, default=12, help="Restaurants to generate (default: 12)")
+    parser.add_argument("--menu-size", type=int, default=80, help="Items per generated guide (default: 80)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Restaurants analyzed at once (default: 1)")
+    parser.add_argument("--http-latency-ms", type=float, default=0, help="Added latency per search/download request")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="Added latency per chat completion")
+    parser.add_argument("--warm", action="store_true", help="Measure a second pass against a warm cache")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--min-accuracy", type=float, help="Exit non-zero if precision or recall falls below this")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose logging")
+    args = parser.parse_args(argv)
+
+    setup_logging(level=logging.DEBUG if args.verbose else logging.WARNING)
+    report = run_benchmark(
+        corpus_dir=args.corpus,
+        restaurants=args.restaurants,
+        menu_size=args.menu_size,
+        concurrency=args.concurrency,
+        http_latency=args.http_latency_ms / 1000,
+        llm_latency=args.llm_latency_ms / 1000,
+        warm=args.warm,
+    )
+    print(format_report(report))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    accuracy = report["accuracy"]
+    if args.min_accuracy is not None and min(accuracy["precision"], accuracy["recall"]) < args.min_accuracy:
+        print(f"\n❌ Accuracy below {args.min_accuracy}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
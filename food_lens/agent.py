@@ -1,75 +1,610 @@
 # food_lens/agent.py
 
-import fitz
+import time
 import logging
-import pdfplumber
-from food_lens.pdf_parser import extract_tables_from_pdf
-from food_lens.html_parser import extract_text_from_html
-from food_lens.llm_client import ask_gpt_for_safe_items, preprocess_pdf_text
-from food_lens.utils import is_pdf_url, download_file, search_allergen_page
-from food_lens.smart_table_parser import extract_safe_items_from_tables
+from typing import Callable, Iterator, Optional, Union
+from food_lens.document import PdfDocument
+from food_lens.workspace import Workspace
+from food_lens.html_parser import extract_guide_from_html
+from food_lens.config import get_settings
+from food_lens.llm_client import PROMPT_TEMPLATE_MAP, iter_gpt_matrix, iter_gpt_safe_items, preprocess_pdf_text
+from food_lens.http_client import fetch_pdf
+from food_lens.utils import is_pdf_url, search_allergen_page
+from food_lens.allergen_matrix import AllergenMatrix, find_allergens, parse_allergens
+from food_lens.table_normalizer import TableNormalizer
+from food_lens.events import ProgressEvent, ItemsEvent, ChangesEvent, ResultEvent
+from food_lens.incremental import (
+    load_guide, save_guide, log_guide_update, reusable_page_tables, save_page_tables, record_result,
+)
+from food_lens.instrumentation import span, metrics
+from food_lens.restaurant_index import get_restaurant_index
+from food_lens.refresh import RefreshScheduler, get_refresh_scheduler
+from food_lens.speculative import Candidate, Strategy, iter_race, passes_quality, shared
+from food_lens.cache import (
+    BaseCache, get_default_cache, make_key, content_hash, normalize_cache_name, allergen_parts, query_key,
+    SEARCH_TTL, DOWNLOAD_TTL, ANALYSIS_TTL, RESULT_TTL, REVALIDATE_AFTER,
+)
+
+AnalysisEvent = Union[ProgressEvent, ItemsEvent, ChangesEvent, ResultEvent]
 
 
 def extract_text_from_pdf(filepath: str) -> str:
     """Use PyMuPDF to extract all visible text from a PDF."""
-    doc = fitz.open(filepath)
-    text = "\n\n".join([page.get_text("text") for page in doc])
-    doc.close()
-    return text
+    with PdfDocument(filepath) as document:
+        return document.text
 
 
-def analyze_restaurant_allergens(restaurant: str, allergen: str = "dairy"):
-    logging.info(f"Analyzing allergens for: {restaurant.title()} (avoiding: {allergen})")
+def resolve_restaurant(restaurant: str) -> tuple[str, Optional[dict]]:
+    """
+    Map a spelling ("chickfila ", "Chick fil a") to the name a restaurant was
+    first analyzed under, so every spelling shares one search and one cache
+    entry. Returns (name, index record or None). Only exact name keys are
+    resolved; similar names of indexed restaurants are only logged as
+    suggestions, since they may be different chains.
+    """
+    index = get_restaurant_index()
+    record = index.lookup(restaurant) if index else None
+    if record is None:
+        suggestions = index.suggest(restaurant) if index else []
+        if suggestions:
+            logging.info(f"🔎 {restaurant} is not indexed; similar restaurants: {', '.join(suggestions)}")
+        return restaurant, None
+    return record["name"], record
 
-    search_result = search_allergen_page(restaurant)
-    pdf_url = search_result.get("pdf_url")
-    html_url = search_result.get("html_url")
 
+def remember_restaurant(restaurant: str, search_result: dict, result: tuple[list[str], list[str]]) -> None:
+    """Add an analyzed restaurant, its guide and its items to the restaurant index."""
+    index = get_restaurant_index()
+    if index is None or not (search_result.get("pdf_url") or search_result.get("html_url")):
+        return
     try:
-        # Prefer PDF if available
-        if pdf_url:
-            logging.info(f"Found allergen PDF: {pdf_url}")
-            local_path = download_file(pdf_url, "allergen.pdf")
+        index.record(restaurant, search_result.get("pdf_url"), search_result.get("html_url"), result[0] + result[1])
+    except (OSError, ValueError) as e:
+        logging.warning(f"⚠️ Could not update the restaurant index: {e}")
+
+
+def track_result(
+    scheduler: RefreshScheduler, restaurant: str, allergens: list[str], search_result: dict, result, cache: BaseCache
+) -> None:
+    """Have the refresh scheduler keep a fresh analysis up to date, with the validators the guide was served with."""
+    url = search_result.get("pdf_url") or search_result.get("html_url")
+    if search_result.get("pdf_url"):
+        validators = cache.get("download", make_key(url)) or {}
+    else:
+        validators = load_guide(cache, url)
+    scheduler.record(restaurant, allergens, url, result, validators.get("etag"), validators.get("last_modified"))
+
+
+def cached_search(restaurant: str, cache: BaseCache) -> dict:
+    """
+    Find the allergen guide: from the restaurant index for restaurants
+    analyzed within DOWNLOAD_TTL, else from a cached or fresh search.
+    """
+    key = make_key(normalize_cache_name(restaurant))
+    with span("search", restaurant=restaurant) as search:
+        name, record = resolve_restaurant(restaurant)
+        if record and (record.get("pdf_url") or record.get("html_url")) \
+                and time.time() - record.get("updated_at", 0) < DOWNLOAD_TTL:
+            search.set(indexed=True, matched=name, pdf_url=record.get("pdf_url"), html_url=record.get("html_url"))
+            metrics.counter("search.index_hits").inc()
+            return {"restaurant": name, "pdf_url": record.get("pdf_url"), "html_url": record.get("html_url")}
+
+        search_result = cache.get("search", key)
+        search.set(cached=search_result is not None)
+        if search_result is None:
+            search_result = search_allergen_page(restaurant)
+            if search_result.get("pdf_url") or search_result.get("html_url"):
+                cache.set("search", key, search_result, ttl=SEARCH_TTL)
+        search.set(pdf_url=search_result.get("pdf_url"), html_url=search_result.get("html_url"))
+    return search_result
+
+
+def cached_fetch_pdf(url: str, cache: BaseCache, workspace: Optional[Workspace] = None) -> dict:
+    """
+    Download a PDF, reusing the stored copy. Once a stored copy is older than
+    REVALIDATE_AFTER, a conditional GET (ETag / Last-Modified) checks whether
+    it changed, so an unchanged guide is not downloaded again.
+
+    With a workspace, a download too large to keep in memory is spilled to
+    it (see download_source) and not stored in the cache.
+    """
+    key = make_key(url)
+    download = cache.get("download", key)
+
+    if download is not None and time.time() - download.get("validated_at", 0) < REVALIDATE_AFTER:
+        return download
+
+    if download is not None and (download.get("etag") or download.get("last_modified")):
+        fresh = fetch_pdf(
+            url, etag=download.get("etag"), last_modified=download.get("last_modified"), workspace=workspace
+        )
+        if fresh.get("not_modified"):
+            logging.info("⚡ Allergen guide unchanged since last download.")
+            download["validated_at"] = time.time()
+            cache.set("download", key, download, ttl=DOWNLOAD_TTL)
+            return download
+    else:
+        fresh = fetch_pdf(url, workspace=workspace)
+
+    fresh["sha256"] = fresh.get("sha256") or content_hash(fresh["content"])
+    fresh["validated_at"] = time.time()
+    if fresh.get("content") is not None:
+        # The path of a spilled download dies with its workspace, so it is never stored
+        cache.set("download", key, {k: v for k, v in fresh.items() if k != "path"}, ttl=DOWNLOAD_TTL)
+    return fresh
+
+
+def expire_download(cache: BaseCache, url: str) -> None:
+    """Make the next cached_fetch_pdf of `url` revalidate its stored copy, whatever its age."""
+    key = make_key(url)
+    download = cache.get("download", key)
+    if download is not None:
+        download["validated_at"] = 0
+        cache.set("download", key, download, ttl=DOWNLOAD_TTL)
+
+
+def download_source(download: dict) -> Union[bytes, str]:
+    """What to open a download from: the spilled file's path, else the bytes."""
+    return download.get("path") or download["content"]
+
+
+def drain(events):
+    """Run an event generator to completion and return its return value."""
+    while True:
+        try:
+            next(events)
+        except StopIteration as stop:
+            return stop.value
+
+
+class ItemTracker:
+    """Remembers which safe items were already reported so each is streamed once."""
+
+    def __init__(self):
+        self.seen: set[str] = set()
+
+    def new_items(self, full_items: list[str], sub_items: list[str], source: str) -> Optional[ItemsEvent]:
+        new_full = [item for item in dict.fromkeys(full_items) if item not in self.seen]
+        new_sub = [item for item in dict.fromkeys(sub_items) if item not in self.seen]
+        self.seen.update(new_full)
+        self.seen.update(new_sub)
+        if new_full or new_sub:
+            return ItemsEvent(new_full, new_sub, source)
+        return None
+
+
+def iter_gpt_for_all_allergens(
+    text: Union[str, list[str]],
+    allergens: list[str],
+    tracker: ItemTracker,
+    cache: Optional[BaseCache] = None,
+):
+    """
+    Ask GPT which items are safe for all of `allergens`. In "matrix" mode
+    (the default) one pass builds the allergen matrix of the whole guide;
+    in "per_allergen" mode each allergen is asked separately and only items
+    reported safe for all of them are kept. Yields progress per chunk;
+    items are streamed per chunk when known to be final. Returns
+    (full_items, sub_items).
+    """
+    if get_settings().llm_mode == "matrix" or any(allergen not in PROMPT_TEMPLATE_MAP for allergen in allergens):
+        return (yield from iter_gpt_matrix_for_allergens(text, allergens, tracker, cache))
+
+    result = None
+    for allergen in allergens:
+        full_items, sub_items = [], []
+        for i, total, chunk_full, chunk_sub in iter_gpt_safe_items(text, allergen=allergen, cache=cache):
+            yield ProgressEvent("llm", f"🧠 Classified chunk {i + 1}/{total or '?'} ({allergen})", i + 1, total)
+            full_items.extend(chunk_full)
+            sub_items.extend(chunk_sub)
+            if len(allergens) == 1:
+                event = tracker.new_items(chunk_full, chunk_sub, "llm")
+                if event:
+                    yield event
+
+        full_items, sub_items = list(dict.fromkeys(full_items)), list(dict.fromkeys(sub_items))
+        if result is None:
+            result = full_items, sub_items
+        else:
+            more_full, more_sub = set(full_items), set(sub_items)
+            result = (
+                [item for item in result[0] if item in more_full],
+                [item for item in result[1] if item in more_sub],
+            )
+    return result
+
+
+def iter_gpt_matrix_for_allergens(
+    text: Union[str, list[str]],
+    allergens: list[str],
+    tracker: ItemTracker,
+    cache: Optional[BaseCache] = None,
+):
+    """Build the allergen matrix chunk by chunk with iter_gpt_matrix and query it."""
+    matrix = AllergenMatrix()
+    for i, total, chunk_matrix in iter_gpt_matrix(text, cache=cache):
+        yield ProgressEvent("llm", f"🧠 Classified chunk {i + 1}/{total or '?'}", i + 1, total)
+        matrix.merge(chunk_matrix)
+        event = tracker.new_items(*chunk_matrix.safe_items(allergens), "llm")
+        if event:
+            yield event
+    logging.info(f"🧠 GPT matrix: {len(matrix)} items, allergens {', '.join(matrix.allergens) or 'none'}")
+    return matrix.safe_items(allergens)
+
+
+def ask_gpt_for_all_allergens(
+    text: Union[str, list[str]],
+    allergens: list[str],
+    cache: Optional[BaseCache] = None,
+) -> tuple[list[str], list[str]]:
+    """Ask GPT which items are safe for all of `allergens`; see iter_gpt_for_all_allergens."""
+    return drain(iter_gpt_for_all_allergens(text, allergens, ItemTracker(), cache))
+
+
+class PageStream:
+    """
+    A document's pages, extracted and preprocessed one at a time on each
+    iteration and not kept, so GPT requests for a long guide start before
+    its last page is read and memory stays flat.
+    """
+
+    def __init__(self, document: PdfDocument):
+        self.document = document
+
+    def __iter__(self) -> Iterator[str]:
+        return (preprocess_pdf_text(text) for text in self.document.iter_page_texts())
+
+
+def gpt_pages(document: PdfDocument) -> Union[list[str], PageStream]:
+    """The document's pages as GPT input: streamed in streaming mode, else extracted once and kept."""
+    if document.streaming:
+        return PageStream(document)
+    return [preprocess_pdf_text(text) for text in document.page_texts]
+
+
+def iter_pdf_matrix(pdf_url: str, download: dict, document: PdfDocument, allergens: list[str],
+                    cache: BaseCache, tracker: ItemTracker):
+    """
+    Parse the guide's tables once into an allergen matrix shared by every
+    allergen query, streaming safe items page by page. Pages unchanged
+    since the previous version of the guide reuse that version's tables.
+    Returns the matrix.
+    """
+    matrix_key = make_key(pdf_url, download["sha256"])
+    matrix = cache.get("matrix", matrix_key)
+    if matrix is not None:
+        return matrix
+
+    fingerprints = document.page_fingerprints
+    guide = load_guide(cache, pdf_url)
+    log_guide_update(guide, download["sha256"], fingerprints)
+    known = reusable_page_tables(guide, fingerprints, document.detector)
+    if known:
+        logging.info(f"♻️ Reusing tables from {len(known)}/{len(fingerprints)} unchanged pages.")
+
+    logging.info("📄 Extracting structured tables from PDF...")
+    matrix = AllergenMatrix()
+    normalizer = TableNormalizer()
+    total = document.page_count
+    # Kept for reuse by the next version of the guide, unless streaming
+    page_tables = []
+    for page_number, tables in document.iter_tables(known):
+        if not document.streaming:
+            page_tables.append((page_number, tables))
+        # Normalized in page order, so tables continued on the next page join their header
+        for table in normalizer.feed(tables):
+            matrix.add_table(table)
+        yield ProgressEvent("pages", f"📄 Parsed page {page_number + 1}/{total}", page_number + 1, total)
+        if tables and len(matrix):
+            event = tracker.new_items(*matrix.safe_items(allergens), "tables")
+            if event:
+                yield event
+
+    cache.set("matrix", matrix_key, matrix, ttl=ANALYSIS_TTL)
+    if not document.streaming:
+        save_page_tables(cache, pdf_url, download["sha256"], fingerprints, document.detector, page_tables)
+    return matrix
+
 
-            logging.info("📄 Extracting structured tables from PDF...")
-            tables = extract_tables_from_pdf(local_path)
+def build_pdf_matrix(pdf_url: str, download: dict, document: PdfDocument, cache: BaseCache) -> AllergenMatrix:
+    """Parse the guide's tables once into an allergen matrix shared by every allergen query."""
+    return drain(iter_pdf_matrix(pdf_url, download, document, [], cache, ItemTracker()))
 
-            if not tables:
-                logging.warning("⚠️ No tables found in PDF — skipping directly to GPT fallback.")
-                raw_text = extract_text_from_pdf(local_path)
-                cleaned_text = preprocess_pdf_text(raw_text)
-                return ask_gpt_for_safe_items(cleaned_text, allergen=allergen)
 
-            logging.info("🛠️ Parsing structured allergen tables...")
-            full_items, sub_items = extract_safe_items_from_tables(tables, allergen)
+def iter_finish_analysis(url: str, sha256: str, allergens: list[str], result, cache: BaseCache):
+    """Store a fresh analysis and report items whose safety changed since the previous version of the guide."""
+    cache.set("analysis", make_key(url, sha256, *allergen_parts(allergens)), result, ttl=ANALYSIS_TTL)
+    changes = record_result(cache, url, sha256, allergens, result)
+    if changes:
+        yield ChangesEvent(changes["became_safe"], changes["became_unsafe"], url)
+    return result
 
+
+def iter_analyze_pdf(pdf_url: str, allergens: list[str], cache: BaseCache, tracker: ItemTracker):
+    # Scratch files of this analysis only, removed when it ends
+    with Workspace() as workspace:
+        return (yield from iter_analyze_pdf_in(pdf_url, allergens, cache, tracker, workspace))
+
+
+def iter_analyze_pdf_in(pdf_url: str, allergens: list[str], cache: BaseCache, tracker: ItemTracker,
+                        workspace: Workspace):
+    yield ProgressEvent("download", f"⬇️ Downloading {pdf_url}")
+    download = cached_fetch_pdf(pdf_url, cache, workspace)
+    analysis_key = make_key(pdf_url, download["sha256"], *allergen_parts(allergens))
+    cached = cache.get("analysis", analysis_key)
+    if cached is not None:
+        logging.info("⚡ Reusing previous analysis of this allergen guide.")
+        return cached
+
+    # Opened once from the downloaded bytes; tables and text are extracted on demand
+    with PdfDocument(download_source(download)) as document:
+        matrix = yield from iter_pdf_matrix(pdf_url, download, document, allergens, cache, tracker)
+
+        if not len(matrix):
+            logging.warning("⚠️ No allergen tables found in PDF — skipping directly to GPT fallback.")
+            metrics.counter("fallback.no_tables").inc()
+            pages = gpt_pages(document)
+            result = yield from iter_gpt_for_all_allergens(pages, allergens, tracker, cache)
+            return (yield from iter_finish_analysis(pdf_url, download["sha256"], allergens, result, cache))
+
+        full_items, sub_items = matrix.safe_items(allergens)
+
+        if full_items or sub_items:
+            logging.info("✅ Found allergen-safe items using table parser.")
+        else:
+            logging.warning("⚠️ Table parser returned no results. Falling back to GPT...")
+            metrics.counter("fallback.empty_tables").inc()
+            pages = gpt_pages(document)
+            full_items, sub_items = yield from iter_gpt_for_all_allergens(pages, allergens, tracker, cache)
             if full_items or sub_items:
-                logging.info("✅ Found allergen-safe items using table parser.")
-                return full_items, sub_items
+                logging.info("✅ GPT fallback returned results.")
             else:
-                logging.warning("⚠️ Table parser returned no results. Falling back to GPT...")
-                raw_text = extract_text_from_pdf(local_path)
-                cleaned_text = preprocess_pdf_text(raw_text)
-                full_items, sub_items = ask_gpt_for_safe_items(cleaned_text, allergen=allergen)
-                if full_items or sub_items:
-                    logging.info("✅ GPT fallback returned results.")
-                else:
-                    logging.warning("⚠️ GPT fallback also returned no results.")
-                return full_items, sub_items
+                logging.warning("⚠️ GPT fallback also returned no results.")
+
+    return (yield from iter_finish_analysis(pdf_url, download["sha256"], allergens, (full_items, sub_items), cache))
+
+
+def analyze_pdf(pdf_url: str, allergens: list[str], cache: BaseCache):
+    return drain(iter_analyze_pdf(pdf_url, allergens, cache, ItemTracker()))
+
+
+def fetch_html_guide(html_url: str, cache: BaseCache) -> tuple[list[str], list, str]:
+    """Fetch and parse an HTML guide, keeping its validators so the refresh scheduler can revalidate it. Returns (sections, tables, sha256)."""
+    guide = extract_guide_from_html(html_url)
+    if guide["etag"] or guide["last_modified"]:
+        save_guide(cache, html_url, etag=guide["etag"], last_modified=guide["last_modified"])
+    sha256 = content_hash("\n".join(guide["sections"]).encode("utf-8"))
+    return guide["sections"], guide["tables"], sha256
+
+
+def iter_analyze_html(html_url: str, allergens: list[str], cache: BaseCache, tracker: ItemTracker):
+    yield ProgressEvent("download", f"⬇️ Fetching {html_url}")
+    sections, tables, sha256 = fetch_html_guide(html_url, cache)
+    analysis_key = make_key(html_url, sha256, *allergen_parts(allergens))
+    cached = cache.get("analysis", analysis_key)
+    if cached is not None:
+        logging.info("⚡ Reusing previous analysis of this allergen page.")
+        return cached
+
+    # Allergen tables on the page are read directly, like a PDF's
+    matrix = AllergenMatrix.from_tables(tables)
+    full_items, sub_items = matrix.safe_items(allergens)
+    if full_items or sub_items:
+        logging.info(f"✅ Found allergen-safe items in {len(tables)} HTML tables.")
+        event = tracker.new_items(full_items, sub_items, "tables")
+        if event:
+            yield event
+        return (yield from iter_finish_analysis(html_url, sha256, allergens, (full_items, sub_items), cache))
+
+    # Only sections that changed since the last version produce new GPT requests
+    fingerprints = [content_hash(section.encode("utf-8")) for section in sections]
+    log_guide_update(load_guide(cache, html_url), sha256, fingerprints, unit="sections")
+    save_guide(cache, html_url, sha256=sha256, fingerprints=fingerprints)
+    cleaned_sections = [preprocess_pdf_text(section) for section in sections]
+
+    logging.info("🧠 Fallback: Parsing HTML text with GPT...")
+    metrics.counter("fallback.html").inc()
+    result = yield from iter_gpt_for_all_allergens(cleaned_sections, allergens, tracker, cache)
+    return (yield from iter_finish_analysis(html_url, sha256, allergens, result, cache))
+
+
+def analyze_html(html_url: str, allergens: list[str], cache: BaseCache):
+    return drain(iter_analyze_html(html_url, allergens, cache, ItemTracker()))
+
+
+def iter_pdf_tables_candidate(pdf_url: str, allergens: list[str], cache: BaseCache, tracker: ItemTracker):
+    """The deterministic path alone: the guide's allergen tables, no GPT."""
+    with Workspace() as workspace:
+        yield ProgressEvent("download", f"⬇️ Downloading {pdf_url}")
+        download = cached_fetch_pdf(pdf_url, cache, workspace)
+        cached = cache.get("analysis", make_key(pdf_url, download["sha256"], *allergen_parts(allergens)))
+        if cached is not None:
+            return Candidate(pdf_url, download["sha256"], cached, cached=True)
+        with PdfDocument(download_source(download)) as document:
+            matrix = yield from iter_pdf_matrix(pdf_url, download, document, allergens, cache, tracker)
+    return Candidate(pdf_url, download["sha256"], matrix.safe_items(allergens), set(matrix.allergens))
+
+
+def iter_pdf_text_candidate(pdf_url: str, allergens: list[str], cache: BaseCache, tracker: ItemTracker):
+    """The guide's text read by GPT, for PDFs whose tables are missing or unreadable."""
+    with Workspace() as workspace:
+        download = cached_fetch_pdf(pdf_url, cache, workspace)
+        cached = cache.get("analysis", make_key(pdf_url, download["sha256"], *allergen_parts(allergens)))
+        if cached is not None:
+            return Candidate(pdf_url, download["sha256"], cached, cached=True)
+        with PdfDocument(download_source(download)) as document:
+            texts = document.page_texts
+    result = yield from iter_gpt_for_all_allergens([preprocess_pdf_text(text) for text in texts], allergens, tracker, cache)
+    return Candidate(pdf_url, download["sha256"], result, find_allergens("\n".join(texts)))
+
+
+def iter_html_candidate(html_url: str, allergens: list[str], cache: BaseCache, tracker: ItemTracker,
+                        tables_only: bool = False, fetch_guide: Optional[Callable[[], tuple]] = None):
+    """
+    The page's allergen tables (tables_only), or its text read by GPT.
+    `fetch_guide` returns fetch_html_guide's (sections, tables, sha256), so
+    both candidates can share one download of the page.
+    """
+    yield ProgressEvent("download", f"⬇️ Fetching {html_url}")
+    sections, tables, sha256 = fetch_guide() if fetch_guide else fetch_html_guide(html_url, cache)
+    cached = cache.get("analysis", make_key(html_url, sha256, *allergen_parts(allergens)))
+    if cached is not None:
+        return Candidate(html_url, sha256, cached, cached=True)
+    if tables_only:
+        matrix = AllergenMatrix.from_tables(tables)
+        return Candidate(html_url, sha256, matrix.safe_items(allergens), set(matrix.allergens))
+    cleaned_sections = [preprocess_pdf_text(section) for section in sections]
+    result = yield from iter_gpt_for_all_allergens(cleaned_sections, allergens, tracker, cache)
+    return Candidate(html_url, sha256, result, find_allergens("\n".join(sections)))
+
+
+def iter_race_sources(pdf_url: Optional[str], html_url: Optional[str], allergens: list[str], cache: BaseCache):
+    """
+    Speculative mode: the tables of the PDF and of the HTML page, and the
+    text of both read by GPT, are tried concurrently (as the race policy allows) and the first result
+    passing the quality check wins; see speculative.iter_race.
+    """
+    settings = get_settings()
+    strategies = []
+    if pdf_url:
+        strategies.append(Strategy(
+            "pdf.tables", lambda: iter_pdf_tables_candidate(pdf_url, allergens, cache, ItemTracker())
+        ))
+    if html_url:
+        # Both HTML strategies read the same page; it is fetched and parsed once
+        fetch_guide = shared(lambda: fetch_html_guide(html_url, cache))
+        strategies.append(Strategy(
+            "html.tables",
+            lambda: iter_html_candidate(html_url, allergens, cache, ItemTracker(), tables_only=True, fetch_guide=fetch_guide),
+        ))
+        strategies.append(Strategy(
+            "html", lambda: iter_html_candidate(html_url, allergens, cache, ItemTracker(), fetch_guide=fetch_guide),
+            costly=True,
+        ))
+    if pdf_url:
+        strategies.append(Strategy(
+            "pdf.text", lambda: iter_pdf_text_candidate(pdf_url, allergens, cache, ItemTracker()), costly=True
+        ))
+
+    won = yield from iter_race(
+        strategies,
+        lambda candidate: passes_quality(candidate, allergens, settings.race_min_items),
+        policy=settings.race_policy,
+        hedge_ms=settings.race_hedge_ms,
+    )
+    if won is None:
+        raise RuntimeError("Every allergen source failed")
+    _, candidate = won
+    if candidate.cached:
+        return candidate.result
+    return (yield from iter_finish_analysis(candidate.url, candidate.sha256, allergens, candidate.result, cache))
+
+
+def run_analysis(restaurant: str, allergens: list[str], cache: BaseCache, fresh: bool = False) -> Iterator[AnalysisEvent]:
+    """
+    Analyze a restaurant's guide, answering from the last known or cached
+    result when there is one. `fresh` skips both (the refresh scheduler
+    uses it to analyze a changed guide again).
+    """
+    restaurant, _ = resolve_restaurant(restaurant)
+    result_key = query_key(restaurant, allergens)
+    scheduler = get_refresh_scheduler()
+    if not fresh:
+        known = scheduler.lookup(restaurant, allergens) if scheduler else None
+        if known is not None:
+            stale = scheduler.is_due(known)
+            logging.info(f"⚡ Returning the last known allergen analysis{' while it is refreshed' if stale else ''}.")
+            yield ItemsEvent(known.result[0], known.result[1], "cache")
+            yield ResultEvent(known.result, cached=True, stale=stale)
+            return
+
+        cached = cache.get("result", result_key)
+        if cached is not None:
+            logging.info("⚡ Returning cached allergen analysis.")
+            yield ItemsEvent(cached[0], cached[1], "cache")
+            yield ResultEvent(cached, cached=True)
+            return
+
+    tracker = ItemTracker()
+    try:
+        yield ProgressEvent("search", f"🔎 Searching for the {restaurant.title()} allergen guide")
+        search_result = cached_search(restaurant, cache)
+        pdf_url = search_result.get("pdf_url")
+        html_url = search_result.get("html_url")
+
+        if get_settings().source_strategy == "race" and (pdf_url or html_url):
+            result = yield from iter_race_sources(pdf_url, html_url, allergens, cache)
+
+        # Prefer PDF if available
+        elif pdf_url:
+            logging.info(f"Found allergen PDF: {pdf_url}")
+            result = yield from iter_analyze_pdf(pdf_url, allergens, cache, tracker)
 
         # If no PDF, try HTML
-        if html_url:
+        elif html_url:
             logging.info(f"Found allergen HTML: {html_url}")
-            text = extract_text_from_html(html_url)
-            cleaned_text = preprocess_pdf_text(text)
+            result = yield from iter_analyze_html(html_url, allergens, cache, tracker)
 
-            logging.info("🧠 Fallback: Parsing HTML text with GPT...")
-            full_items, sub_items = ask_gpt_for_safe_items(cleaned_text, allergen=allergen)
-            return full_items, sub_items
+        else:
+            logging.warning("❌ No valid allergen source found (PDF or HTML).")
+            yield ResultEvent(None)
+            return
 
-        logging.warning("❌ No valid allergen source found (PDF or HTML).")
-        return None
+        cache.set("result", result_key, result, ttl=RESULT_TTL)
+        remember_restaurant(restaurant, search_result, result)
+        if scheduler and not fresh:
+            track_result(scheduler, restaurant, allergens, search_result, result, cache)
+        event = tracker.new_items(result[0], result[1], "analysis")
+        if event:
+            yield event
+        yield ResultEvent(result)
 
     except Exception as e:
         logging.error(f"Error while processing allergen data: {e}", exc_info=True)
-        return None
+        yield ResultEvent(None)
+
+
+def iter_analyze_restaurant_allergens(
+    restaurant: str,
+    allergen: Union[str, list[str]] = "dairy",
+    cache: Optional[BaseCache] = None,
+) -> Iterator[AnalysisEvent]:
+    """
+    Streaming variant of analyze_restaurant_allergens.
+
+    Yields ProgressEvent as each stage, page or GPT chunk is processed,
+    ItemsEvent as safe items are found, and finally one ResultEvent whose
+    result is authoritative (an early item can still be dropped if a later
+    page marks it as containing the allergen).
+    """
+    allergens = parse_allergens(allergen)
+    logging.info(f"Analyzing allergens for: {restaurant.title()} (avoiding: {', '.join(allergens)})")
+    cache = cache or get_default_cache()
+
+    started = time.perf_counter()
+    first_item_ms = None
+    with span("analyze", restaurant=restaurant, allergens=allergens) as analyze:
+        for event in run_analysis(restaurant, allergens, cache):
+            if isinstance(event, ItemsEvent) and first_item_ms is None:
+                first_item_ms = (time.perf_counter() - started) * 1000
+                metrics.histogram("analyze.first_item.ms").observe(first_item_ms)
+                analyze.set(first_item_ms=first_item_ms)
+            elif isinstance(event, ResultEvent):
+                analyze.set(cached=event.cached, stale=event.stale, found=event.result is not None)
+            yield event
+
+
+def analyze_restaurant_allergens(
+    restaurant: str,
+    allergen: Union[str, list[str]] = "dairy",
+    cache: Optional[BaseCache] = None,
+):
+    """
+    Find menu items safe for `allergen`, which may be a single allergen
+    ("dairy") or several ("dairy, egg" or ["dairy", "egg", "sesame"]).
+    """
+    result = None
+    for event in iter_analyze_restaurant_allergens(restaurant, allergen, cache):
+        if isinstance(event, ResultEvent):
+            result = event.result
+    return result
@@ -0,0 +1,189 @@
+# food_lens/allergen_matrix.py
+
+import re
+from typing import Iterable, List, Optional, Tuple, Union
+
+from food_lens.smart_table_parser import SAFE_VALUES, categorize_item
+
+# Canonical allergen names (the ones offered in the web UI), in bit order
+ALLERGENS = [
+    "dairy", "egg", "peanuts", "tree nuts", "soy", "wheat", "fish", "shellfish", "sesame",
+]
+
+# Header spellings found in allergen guides, mapped to the canonical name
+ALLERGEN_SYNONYMS = {
+    "dairy": ["dairy", "milk", "lactose"],
+    "egg": ["egg", "eggs"],
+    "peanuts": ["peanut", "peanuts"],
+    "tree nuts": ["tree nut", "tree nuts", "treenuts", "nuts"],
+    "soy": ["soy", "soya", "soybean", "soybeans"],
+    "wheat": ["wheat", "gluten"],
+    "fish": ["fish"],
+    "shellfish": ["shellfish", "crustacean", "crustaceans", "mollusc", "molluscs", "mollusk", "mollusks"],
+    "sesame": ["sesame"],
+}
+
+ALLERGEN_BITS = {name: 1 << i for i, name in enumerate(ALLERGENS)}
+
+# Longest spellings first so "tree nuts" wins over "nuts" and "shellfish" over "fish"
+_SYNONYM_PATTERNS = sorted(
+    (
+        (re.compile(rf"\b{re.escape(synonym)}\b"), canonical)
+        for canonical, synonyms in ALLERGEN_SYNONYMS.items()
+        for synonym in synonyms
+    ),
+    key=lambda pair: -len(pair[0].pattern),
+)
+
+
+def canonical_allergen(name: str) -> Optional[str]:
+    """Map a header or user-supplied allergen ('Milk', 'Gluten') to its canonical name."""
+    if not name:
+        return None
+    text = name.strip().lower()
+    for pattern, canonical in _SYNONYM_PATTERNS:
+        if pattern.search(text):
+            return canonical
+    return None
+
+
+def find_allergens(text: str) -> set[str]:
+    """All canonical allergens mentioned anywhere in `text`."""
+    text = text.lower()
+    found = set()
+    for pattern, canonical in _SYNONYM_PATTERNS:
+        if canonical not in found and pattern.search(text):
+            found.add(canonical)
+    return found
+
+
+def parse_allergens(allergens: Union[str, Iterable[str]]) -> List[str]:
+    """Accept 'dairy', 'dairy, egg' or ['dairy', 'egg'] and return canonical names."""
+    if isinstance(allergens, str):
+        allergens = re.split(r"[,;+&]| and ", allergens)
+    resolved = []
+    for allergen in allergens:
+        if not allergen.strip():
+            continue
+        canonical = canonical_allergen(allergen)
+        if canonical is None:
+            raise ValueError(f"Unsupported allergen: {allergen.strip()}")
+        if canonical not in resolved:
+            resolved.append(canonical)
+    return resolved
+
+
+def allergen_mask(allergens: Iterable[str]) -> int:
+    mask = 0
+    for allergen in allergens:
+        mask |= ALLERGEN_BITS[allergen]
+    return mask
+
+
+class AllergenMatrix:
+    """
+    Menu items × allergen columns for one guide, stored as bitmasks.
+
+    For each item, `present` has a bit set for every allergen the guide marks
+    as contained, and `known` has a bit set for every allergen the guide has a
+    column for. An item is safe for a query when none of the queried
+    allergens are present and all of them were actually listed.
+    """
+
+    def __init__(self):
+        self.items: List[str] = []
+        self.categories: List[str] = []
+        self.present: List[int] = []
+        self.known: List[int] = []
+        self._index: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @property
+    def allergens(self) -> List[str]:
+        """Canonical allergens this guide has a column for."""
+        covered = 0
+        for mask in self.known:
+            covered |= mask
+        return [name for name in ALLERGENS if covered & ALLERGEN_BITS[name]]
+
+    def add(self, name: str, present: int, known: int, category: Optional[str] = None) -> None:
+        """Add an item; repeated items merge so any 'contains' mark wins."""
+        index = self._index.get(name)
+        if index is None:
+            self._index[name] = len(self.items)
+            self.items.append(name)
+            self.categories.append(category or categorize_item(name))
+            self.present.append(present)
+            self.known.append(known)
+        else:
+            self.present[index] |= present
+            self.known[index] |= known
+
+    def merge(self, other: "AllergenMatrix") -> None:
+        """Add every item of `other`, e.g. the matrix of the next chunk of a guide."""
+        for name, category, present, known in zip(other.items, other.categories, other.present, other.known):
+            self.add(name, present, known, category=category)
+
+    @classmethod
+    def from_tables(cls, tables: List[List[List[str]]]) -> "AllergenMatrix":
+        """Build from one guide's extracted tables, in page order (normalized first)."""
+        from food_lens.table_normalizer import normalize_tables
+
+        matrix = cls()
+        for table in normalize_tables(tables):
+            matrix.add_table(table)
+        return matrix
+
+    def add_table(self, table: List[List[str]]) -> None:
+        """Add a table whose first row is the header and first column the item name."""
+        if not table or len(table) < 2:
+            return
+
+        headers = table[0]
+        name_col = 0  # assume first column is the name
+        columns = []
+        for i, header in enumerate(headers):
+            if i == name_col:
+                continue
+            canonical = canonical_allergen(header or "")
+            if canonical:
+                columns.append((i, ALLERGEN_BITS[canonical]))
+
+        if not columns:
+            return
+
+        known = 0
+        for _, bit in columns:
+            known |= bit
+        last_col = max(i for i, _ in columns)
+
+        for row in table[1:]:
+            if len(row) <= max(name_col, last_col):
+                continue
+
+            name = (row[name_col] or "").strip()
+            if not name:
+                continue
+
+            present = 0
+            for i, bit in columns:
+                if (row[i] or "").strip().lower() not in SAFE_VALUES:
+                    present |= bit
+            self.add(name, present, known)
+
+    def safe_items(self, allergens: Union[str, Iterable[str]]) -> Tuple[List[str], List[str]]:
+        """Return (full_items, sub_items) free of every allergen in the query."""
+        query = allergen_mask(parse_allergens(allergens))
+        full_items, sub_items = [], []
+
+        for name, category, present, known in zip(self.items, self.categories, self.present, self.known):
+            if present & query or known & query != query:
+                continue
+            if category == "full":
+                full_items.append(name)
+            else:
+                sub_items.append(name)
+
+        return full_items, sub_items
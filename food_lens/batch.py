@@ -0,0 +1,296 @@
+# food_lens/batch.py
+
+import os
+import csv
+import json
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from food_lens.agent import (
+    cached_search, cached_fetch_pdf, download_source, build_pdf_matrix, ask_gpt_for_all_allergens,
+    resolve_restaurant, remember_restaurant,
+)
+from food_lens.allergen_matrix import AllergenMatrix, parse_allergens
+from food_lens.cache import (
+    BaseCache, get_default_cache, make_key, content_hash, normalize_cache_name, allergen_parts, query_key, RESULT_TTL,
+)
+from food_lens.document import PdfDocument
+from food_lens.workspace import Workspace
+from food_lens.html_parser import extract_page_from_html
+from food_lens.incremental import load_guide, save_guide, log_guide_update, record_result
+from food_lens.llm_client import preprocess_pdf_text
+
+# Default concurrency per pipeline stage
+STAGE_LIMITS = {"search": 8, "download": 8, "parse": 2, "llm": 4}
+
+
+def read_jobs(input_path: str) -> list[dict]:
+    """
+    Read batch jobs from CSV (columns: restaurant, allergens) or JSONL
+    ({"restaurant": ..., "allergens": [...] or "dairy, egg"}).
+    Missing allergens default to dairy.
+    """
+    with open(input_path, newline="", encoding="utf-8") as f:
+        if input_path.endswith(".jsonl") or input_path.endswith(".json"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for row in rows:
+        restaurant = (row.get("restaurant") or "").strip()
+        if not restaurant:
+            continue
+        allergens = parse_allergens(row.get("allergens") or row.get("allergen") or "dairy")
+        jobs.append({"restaurant": restaurant, "allergens": allergens})
+    return jobs
+
+
+def job_key(restaurant: str, allergens: list[str]) -> str:
+    return query_key(restaurant, allergens)
+
+
+def read_checkpoint(checkpoint_path: str) -> list[dict]:
+    """Load results written by an earlier, possibly interrupted, run."""
+    if not os.path.exists(checkpoint_path):
+        return []
+    records = []
+    with open(checkpoint_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break  # a torn final line from an interrupted write
+    return records
+
+
+def order_by_jobs(records: list[dict], jobs: list[dict]) -> list[dict]:
+    """One record per distinct job, in input order; jobs without a record are left out."""
+    by_key = {job_key(record["restaurant"], record["allergens"]): record for record in records}
+    keys = dict.fromkeys(job_key(job["restaurant"], job["allergens"]) for job in jobs)
+    return [by_key[key] for key in keys if key in by_key]
+
+
+def write_output(records: list[dict], output_path: str) -> None:
+    if output_path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pq.write_table(pa.Table.from_pylist(records), output_path)
+        return
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+class BatchPipeline:
+    """
+    Runs search → download → parse → LLM for many restaurants at once.
+
+    Each restaurant flows through the stages on a worker thread; a semaphore
+    per stage caps how many restaurants are in that stage at the same time,
+    so stages overlap like a pipeline. Downloads of the same URL are shared
+    while in flight. Each restaurant downloads into a workspace of its own,
+    removed when it is done, so a long run holds no more guides than it has
+    restaurants in progress.
+    """
+
+    def __init__(self, cache: Optional[BaseCache] = None, stage_limits: Optional[dict] = None):
+        self.cache = cache or get_default_cache()
+        limits = {**STAGE_LIMITS, **(stage_limits or {})}
+        self.workers = sum(limits.values())
+        self._stages = {stage: threading.Semaphore(limit) for stage, limit in limits.items()}
+        # Downloads in flight only; finished ones are read from the download cache
+        self._downloads: dict[str, Future] = {}
+        self._downloads_lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        with self._stages[name]:
+            yield
+
+    def download(self, url: str, workspace: Workspace) -> dict:
+        """
+        Download a PDF into `workspace`. Restaurants asking for a URL that is
+        already being downloaded wait for it and share it, unless it was
+        spilled to the downloader's workspace, in which case they fetch
+        their own copy (through the download cache).
+        """
+        with self._downloads_lock:
+            future = self._downloads.get(url)
+            owner = future is None
+            if owner:
+                future = self._downloads[url] = Future()
+
+        if owner:
+            try:
+                with self.stage("download"):
+                    future.set_result(cached_fetch_pdf(url, self.cache, workspace))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._downloads_lock:
+                    self._downloads.pop(url, None)
+            return future.result()
+
+        download = future.result()
+        if download.get("content") is not None:
+            return download
+        with self.stage("download"):
+            return cached_fetch_pdf(url, self.cache, workspace)
+
+    def process_restaurant(self, restaurant: str, allergen_sets: list[list[str]]) -> list[dict]:
+        """Analyze one restaurant for every requested allergen set."""
+        records = [
+            {"restaurant": restaurant, "allergens": allergens, "full_items": [], "sub_items": [],
+             "source_url": None, "method": "none", "error": None}
+            for allergens in allergen_sets
+        ]
+
+        # Scratch files of this restaurant only, removed as soon as it is done
+        with Workspace() as workspace:
+            self.analyze_records(restaurant, records, workspace)
+        return records
+
+    def analyze_records(self, restaurant: str, records: list[dict], workspace: Workspace) -> None:
+        """Fill in one restaurant's records, downloading into `workspace`; errors are recorded, not raised."""
+        try:
+            with self.stage("search"):
+                search_result = cached_search(restaurant, self.cache)
+            pdf_url = search_result.get("pdf_url")
+            html_url = search_result.get("html_url")
+
+            sections = None
+            version = None
+            if pdf_url:
+                download = self.download(pdf_url, workspace)
+                version = download["sha256"]
+                with self.stage("parse"):
+                    with PdfDocument(download_source(download)) as document:
+                        matrix = build_pdf_matrix(pdf_url, download, document, self.cache)
+                        for record in records:
+                            record["source_url"] = pdf_url
+                            if len(matrix):
+                                record["full_items"], record["sub_items"] = matrix.safe_items(record["allergens"])
+                                record["method"] = "tables"
+                        if any(not (r["full_items"] or r["sub_items"]) for r in records):
+                            sections = [preprocess_pdf_text(text) for text in document.page_texts]
+            elif html_url:
+                with self.stage("download"):
+                    raw_sections, tables = extract_page_from_html(html_url)
+                version = content_hash("\n".join(raw_sections).encode("utf-8"))
+                fingerprints = [content_hash(section.encode("utf-8")) for section in raw_sections]
+                log_guide_update(load_guide(self.cache, html_url), version, fingerprints, unit="sections")
+                save_guide(self.cache, html_url, sha256=version, fingerprints=fingerprints)
+                sections = [preprocess_pdf_text(section) for section in raw_sections]
+                matrix = AllergenMatrix.from_tables(tables)
+                for record in records:
+                    record["source_url"] = html_url
+                    if len(matrix):
+                        record["full_items"], record["sub_items"] = matrix.safe_items(record["allergens"])
+                        record["method"] = "tables"
+
+            if sections:
+                for record in records:
+                    if record["full_items"] or record["sub_items"]:
+                        continue
+                    with self.stage("llm"):
+                        record["full_items"], record["sub_items"] = ask_gpt_for_all_allergens(
+                            sections, record["allergens"], self.cache
+                        )
+                    record["method"] = "llm"
+
+            # Logs items whose safety changed since the guide was last analyzed
+            for record in records:
+                if record["source_url"]:
+                    record_result(self.cache, record["source_url"], version, record["allergens"],
+                                  (record["full_items"], record["sub_items"]))
+
+            # Share results with interactive lookups, under the name they resolve to
+            name, _ = resolve_restaurant(restaurant)
+            for record in records:
+                if record["source_url"]:
+                    self.cache.set(
+                        "result",
+                        query_key(name, record["allergens"]),
+                        (record["full_items"], record["sub_items"]),
+                        ttl=RESULT_TTL,
+                    )
+            if any(record["source_url"] for record in records):
+                full_items = [item for record in records for item in record["full_items"]]
+                sub_items = [item for record in records for item in record["sub_items"]]
+                remember_restaurant(name, search_result, (full_items, sub_items))
+
+        except Exception as e:
+            logging.error(f"❌ Batch analysis failed for {restaurant}: {e}")
+            for record in records:
+                record["error"] = str(e)
+
+    def run(self, jobs: list[dict]) -> Iterator[dict]:
+        """Yield one result record per job as restaurants finish (not in input order)."""
+        # Allergen sets keyed like job_key, so "egg, dairy" and "dairy, egg" are analyzed once
+        grouped: dict[str, tuple[str, dict[str, list[str]]]] = {}
+        for job in jobs:
+            name_key = normalize_cache_name(job["restaurant"])
+            restaurant, allergen_sets = grouped.setdefault(name_key, (job["restaurant"], {}))
+            allergen_sets.setdefault(make_key(*allergen_parts(job["allergens"])), job["allergens"])
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(self.process_restaurant, restaurant, list(allergen_sets.values()))
+                for restaurant, allergen_sets in grouped.values()
+            ]
+            for future in as_completed(futures):
+                yield from future.result()
+
+
+def run_batch(
+    input_path: str,
+    output_path: str,
+    cache: Optional[BaseCache] = None,
+    stage_limits: Optional[dict] = None,
+    checkpoint_path: Optional[str] = None,
+) -> dict:
+    """
+    Analyze every (restaurant, allergens) job in input_path and write the
+    results to output_path (.jsonl or .parquet).
+
+    Finished jobs are appended to a checkpoint file as they complete, so
+    rerunning the same command after an interruption only processes what
+    is left. Jobs that failed with an error are retried on the next run.
+    """
+    checkpoint_path = checkpoint_path or f"{output_path}.checkpoint.jsonl"
+    jobs = read_jobs(input_path)
+
+    done = {
+        job_key(record["restaurant"], record["allergens"]): record
+        for record in read_checkpoint(checkpoint_path)
+        if not record.get("error")
+    }
+    pending = [job for job in jobs if job_key(job["restaurant"], job["allergens"]) not in done]
+    logging.info(f"📦 Batch: {len(jobs)} jobs, {len(jobs) - len(pending)} already done, {len(pending)} to run.")
+
+    # Rewrite the checkpoint without failed records so they are retried cleanly
+    with open(checkpoint_path, "w", encoding="utf-8") as checkpoint:
+        for record in done.values():
+            checkpoint.write(json.dumps(record) + "\n")
+
+        pipeline = BatchPipeline(cache=cache, stage_limits=stage_limits)
+        failed = 0
+        for i, record in enumerate(pipeline.run(pending), start=1):
+            checkpoint.write(json.dumps(record) + "\n")
+            checkpoint.flush()
+            if record["error"]:
+                failed += 1
+            else:
+                done[job_key(record["restaurant"], record["allergens"])] = record
+            logging.info(f"✅ [{i}/{len(pending)}] {record['restaurant']} ({', '.join(record['allergens'])})")
+
+    records = order_by_jobs(list(done.values()), jobs)
+    write_output(records, output_path)
+
+    return {"jobs": len(jobs), "completed": len(records), "failed": failed, "output": output_path}
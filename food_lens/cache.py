@@ -0,0 +1,292 @@
+# food_lens/cache.py
+
+import os
+import re
+import time
+import pickle
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Iterable, Optional
+from food_lens.config import load_environment
+from food_lens.instrumentation import metrics
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "foodlens")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+# Default time-to-live per namespace, in seconds
+SEARCH_TTL = 7 * 24 * 3600
+DOWNLOAD_TTL = 30 * 24 * 3600
+ANALYSIS_TTL = 30 * 24 * 3600
+RESULT_TTL = 24 * 3600
+# LLM answers, keyed on everything that determines them (model, prompts, parameters)
+COMPLETION_TTL = 30 * 24 * 3600
+# Stored downloads older than this are revalidated with a conditional GET
+REVALIDATE_AFTER = 24 * 3600
+
+
+def make_key(*parts: Any) -> str:
+    """Build a stable cache key from arbitrary parts."""
+    raw = "\x1f".join("" if part is None else str(part) for part in parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def allergen_parts(allergens: Iterable[str]) -> list[str]:
+    """Allergens as key parts: each once, sorted, so "dairy, egg" and "egg, dairy" share an entry."""
+    return sorted(set(allergens))
+
+
+def query_key(restaurant: str, allergens: Iterable[str]) -> str:
+    """Key of one restaurant and allergen set, shared by the result cache, the service and batch runs."""
+    return make_key(normalize_cache_name(restaurant), *allergen_parts(allergens))
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_cache_name(name: str) -> str:
+    """Collapse case and whitespace so 'Panera ' and 'panera' share an entry."""
+    return re.sub(r"\s+", " ", name.strip().lower())
+
+
+class CacheStats:
+    """Hit/miss counters, tracked per namespace."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+
+    def record(self, namespace: str, hit: bool) -> None:
+        counter = self.hits if hit else self.misses
+        with self._lock:
+            counter[namespace] = counter.get(namespace, 0) + 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            namespaces = sorted(set(self.hits) | set(self.misses))
+            return {
+                ns: {"hits": self.hits.get(ns, 0), "misses": self.misses.get(ns, 0)}
+                for ns in namespaces
+            }
+
+
+class BaseCache:
+    """Interface for result caches. Subclasses implement _get/_set/_delete/clear."""
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        found, value = self._get(namespace, key)
+        self.stats.record(namespace, found)
+        metrics.counter(f"cache.{namespace}.{'hits' if found else 'misses'}").inc()
+        return value if found else default
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        self._set(namespace, key, value, expires_at)
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._delete(namespace, key)
+
+    def _get(self, namespace: str, key: str) -> tuple[bool, Any]:
+        raise NotImplementedError
+
+    def _set(self, namespace: str, key: str, value: Any, expires_at: Optional[float]) -> None:
+        raise NotImplementedError
+
+    def _delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class NullCache(BaseCache):
+    """A cache that never stores anything. Useful to disable caching."""
+
+    def _get(self, namespace, key):
+        return False, None
+
+    def _set(self, namespace, key, value, expires_at):
+        pass
+
+    def _delete(self, namespace, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryCache(BaseCache):
+    """In-process LRU cache bounded by entry count."""
+
+    def __init__(self, max_entries: int = 1024):
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data: dict[tuple[str, str], tuple[Any, Optional[float]]] = {}
+
+    def _get(self, namespace, key):
+        with self._lock:
+            entry = self._data.pop((namespace, key), None)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                return False, None
+            self._data[(namespace, key)] = entry  # re-insert as most recently used
+            return True, value
+
+    def _set(self, namespace, key, value, expires_at):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+            self._data[(namespace, key)] = (value, expires_at)
+            while len(self._data) > self.max_entries:
+                self._data.pop(next(iter(self._data)))
+
+    def _delete(self, namespace, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DiskCache(BaseCache):
+    """
+    SQLite-backed cache shared between processes (CLI, Streamlit, workers).
+    Entries expire after their TTL and the least recently used entries are
+    evicted once the total stored size exceeds max_bytes.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        super().__init__()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / "cache.sqlite3"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at)")
+        self._conn.commit()
+
+    def _get(self, namespace, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row is None:
+                return False, None
+            blob, expires_at = row
+            if expires_at is not None and expires_at < now:
+                self._conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+                self._conn.commit()
+                return False, None
+            self._conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key),
+            )
+            self._conn.commit()
+        try:
+            return True, pickle.loads(blob)
+        except Exception as e:
+            logging.warning(f"⚠️ Dropping unreadable cache entry {namespace}/{key}: {e}")
+            self._delete(namespace, key)
+            return False, None
+
+    def _set(self, namespace, key, value, expires_at):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            logging.debug(f"Not caching {namespace}/{key}: {len(blob)} bytes exceeds cache size")
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, blob, len(blob), expires_at, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        self._conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT namespace, key, size FROM entries ORDER BY accessed_at ASC").fetchall()
+        for namespace, key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            total -= size
+
+    def _delete(self, namespace, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+_default_cache: Optional[BaseCache] = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache() -> BaseCache:
+    """
+    Return the process-wide cache. The CLI and the Streamlit app both resolve
+    to the same on-disk store unless FOODLENS_CACHE_DIR points elsewhere.
+    Set FOODLENS_CACHE=off to disable caching entirely.
+    """
+    global _default_cache
+    load_environment()
+    with _default_lock:
+        if _default_cache is None:
+            if os.getenv("FOODLENS_CACHE", "").lower() in {"0", "off", "false", "no"}:
+                _default_cache = NullCache()
+            else:
+                directory = os.getenv("FOODLENS_CACHE_DIR", DEFAULT_CACHE_DIR)
+                max_bytes = int(os.getenv("FOODLENS_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+                try:
+                    _default_cache = DiskCache(directory, max_bytes=max_bytes)
+                except (OSError, sqlite3.Error) as e:
+                    logging.warning(f"⚠️ Could not open disk cache at {directory} ({e}); using memory cache.")
+                    _default_cache = MemoryCache()
+        return _default_cache
+
+
+def set_default_cache(cache: Optional[BaseCache]) -> None:
+    """Install a custom cache backend (or None to reset to the default)."""
+    global _default_cache
+    with _default_lock:
+        _default_cache = cache
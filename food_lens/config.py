@@ -0,0 +1,188 @@
+# food_lens/config.py
+
+import os
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+
+def load_environment() -> None:
+    """Load .env into os.environ, once per process, on first use rather than at import."""
+    global _env_loaded
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _env_loaded = True
+
+
+def env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in {"1", "true", "yes", "on"}
+
+
+def restaurant_index_path() -> Optional[str]:
+    if os.getenv("FOODLENS_INDEX", "").lower() in {"0", "off", "false", "no"}:
+        return None
+    cache_dir = os.getenv("FOODLENS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "foodlens"))
+    return os.getenv("FOODLENS_INDEX_PATH", os.path.join(cache_dir, "restaurants.idx"))
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Everything FoodLens reads from the environment, resolved in one place."""
+
+    openai_api_key: Optional[str] = None
+    openai_base_url: Optional[str] = None
+    model: str = "gpt-3.5-turbo"
+    # Account limits; override to match your OpenAI tier
+    requests_per_minute: int = 500
+    tokens_per_minute: int = 60000
+    llm_concurrency: int = 4
+    # Guide text sent per request; larger chunks repeat the prompt less often
+    chunk_tokens: int = 1500
+    # "matrix" asks once per chunk for every item's allergens; "per_allergen" asks once per allergen
+    llm_mode: str = "matrix"
+    # Stream pages through text extraction, cleaning and chunking instead of holding the whole guide;
+    # at most stream_window chunks are built ahead of the GPT answers
+    streaming: bool = False
+    stream_window: int = 8
+    serpapi_api_key: Optional[str] = None
+    serpapi_url: str = "https://serpapi.com/search"
+    # "race" tries the PDF tables, HTML page and PDF text concurrently; "sequential" tries them in turn
+    source_strategy: str = "sequential"
+    # "latency" starts every source at once, "cost" only sends GPT requests once the tables failed,
+    # "balanced" gives the tables race_hedge_ms of head start
+    race_policy: str = "balanced"
+    race_hedge_ms: int = 1500
+    # A result is accepted with at least this many safe items from a source listing every queried allergen
+    race_min_items: int = 3
+    pdf_workers: int = 1
+    pdf_early_exit: bool = False
+    # "precise" uses pdfplumber; the default is PyMuPDF's faster table finder
+    pdf_precise_tables: bool = False
+    # Restaurants analyzed before, for fuzzy name lookups without a search; None disables it
+    restaurant_index_path: Optional[str] = None
+    # Downloads larger than these are refused
+    max_pdf_bytes: int = 50 * 1024 * 1024
+    max_html_bytes: int = 10 * 1024 * 1024
+    # Downloads larger than this are spilled from memory to a per-request temp directory under workspace_dir
+    spill_bytes: int = 16 * 1024 * 1024
+    workspace_dir: Optional[str] = None
+    # Serve the last known result of an analyzed restaurant at once, and revalidate its guide in the
+    # background once it is refresh_interval seconds old
+    refresh: bool = False
+    refresh_interval: int = 6 * 3600
+    refresh_workers: int = 2
+    # Analysis service: set service_url to use a running service instead of analyzing in-process
+    service_url: Optional[str] = None
+    service_workers: int = 4
+    service_max_queue: int = 100
+    # Every finished span is appended to this file as a JSON line
+    trace_file: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        load_environment()
+        return cls(
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            openai_base_url=os.getenv("OPENAI_BASE_URL"),
+            model=os.getenv("OPENAI_MODEL", cls.model),
+            requests_per_minute=int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", cls.requests_per_minute)),
+            tokens_per_minute=int(os.getenv("OPENAI_TOKENS_PER_MINUTE", cls.tokens_per_minute)),
+            llm_concurrency=int(os.getenv("FOODLENS_LLM_CONCURRENCY", cls.llm_concurrency)),
+            chunk_tokens=int(os.getenv("FOODLENS_CHUNK_TOKENS", cls.chunk_tokens)),
+            llm_mode=os.getenv("FOODLENS_LLM_MODE", cls.llm_mode).lower(),
+            streaming=env_flag("FOODLENS_STREAMING"),
+            stream_window=int(os.getenv("FOODLENS_STREAM_WINDOW", cls.stream_window)),
+            serpapi_api_key=os.getenv("SERPAPI_API_KEY"),
+            serpapi_url=os.getenv("SERPAPI_URL", cls.serpapi_url),
+            source_strategy=os.getenv("FOODLENS_SOURCES", cls.source_strategy).lower(),
+            race_policy=os.getenv("FOODLENS_RACE_POLICY", cls.race_policy).lower(),
+            race_hedge_ms=int(os.getenv("FOODLENS_RACE_HEDGE_MS", cls.race_hedge_ms)),
+            race_min_items=int(os.getenv("FOODLENS_RACE_MIN_ITEMS", cls.race_min_items)),
+            pdf_workers=int(os.getenv("FOODLENS_PDF_WORKERS", cls.pdf_workers)),
+            pdf_early_exit=env_flag("FOODLENS_PDF_EARLY_EXIT"),
+            pdf_precise_tables=os.getenv("FOODLENS_PDF_TABLES", "").lower() == "precise",
+            restaurant_index_path=restaurant_index_path(),
+            max_pdf_bytes=int(os.getenv("FOODLENS_MAX_PDF_BYTES", cls.max_pdf_bytes)),
+            max_html_bytes=int(os.getenv("FOODLENS_MAX_HTML_BYTES", cls.max_html_bytes)),
+            spill_bytes=int(os.getenv("FOODLENS_SPILL_BYTES", cls.spill_bytes)),
+            workspace_dir=os.getenv("FOODLENS_WORKSPACE_DIR") or None,
+            refresh=env_flag("FOODLENS_REFRESH"),
+            refresh_interval=int(os.getenv("FOODLENS_REFRESH_INTERVAL", cls.refresh_interval)),
+            refresh_workers=int(os.getenv("FOODLENS_REFRESH_WORKERS", cls.refresh_workers)),
+            service_url=os.getenv("FOODLENS_SERVICE_URL") or None,
+            service_workers=int(os.getenv("FOODLENS_SERVICE_WORKERS", cls.service_workers)),
+            service_max_queue=int(os.getenv("FOODLENS_SERVICE_MAX_QUEUE", cls.service_max_queue)),
+            trace_file=os.getenv("FOODLENS_TRACE_FILE") or None,
+        )
+
+
+class AppContext:
+    """
+    Settings plus the clients built from them. Clients are created on first
+    use, so importing FoodLens stays cheap and a missing API key only
+    matters to the code path that needs it.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None):
+        self.settings = settings or Settings.from_env()
+        self._lock = threading.Lock()
+        self._openai_client = None
+        self._rate_limiter = None
+
+    @property
+    def openai_client(self):
+        with self._lock:
+            if self._openai_client is None:
+                from openai import OpenAI
+
+                if not self.settings.openai_api_key:
+                    raise EnvironmentError("OPENAI_API_KEY not set in .env")
+                # Retries are handled in llm_client with tenacity so they also respect the rate limiter
+                self._openai_client = OpenAI(
+                    api_key=self.settings.openai_api_key,
+                    base_url=self.settings.openai_base_url,
+                    max_retries=0,
+                )
+                logging.debug(f"OpenAI client created for {self._openai_client.base_url}")
+            return self._openai_client
+
+    @property
+    def rate_limiter(self):
+        with self._lock:
+            if self._rate_limiter is None:
+                from food_lens.rate_limiter import RateLimiter
+
+                self._rate_limiter = RateLimiter(self.settings.requests_per_minute, self.settings.tokens_per_minute)
+            return self._rate_limiter
+
+
+_context: Optional[AppContext] = None
+_context_lock = threading.Lock()
+
+
+def get_context() -> AppContext:
+    """Return the process-wide context, reading settings from the environment on first call."""
+    global _context
+    with _context_lock:
+        if _context is None:
+            _context = AppContext()
+        return _context
+
+
+def set_context(context: Optional[AppContext]) -> Optional[AppContext]:
+    """Install a context (e.g. with test settings); None resets to the environment. Returns the previous one."""
+    global _context
+    with _context_lock:
+        previous, _context = _context, context
+        return previous
+
+
+def get_settings() -> Settings:
+    return get_context().settings
@@ -0,0 +1,198 @@
+# food_lens/document.py
+
+import hashlib
+import threading
+from functools import cached_property
+from typing import TYPE_CHECKING, Iterator, Optional, Union
+from food_lens.config import get_settings
+from food_lens.pdf_parser import iter_allergen_pages, iter_page_tables, pymupdf_tables
+from food_lens.instrumentation import span
+
+if TYPE_CHECKING:
+    import fitz
+
+# MuPDF is not thread-safe; every PyMuPDF call in this process goes through this lock
+MUPDF_LOCK = threading.RLock()
+
+# MuPDF keeps every object it has loaded until the document is closed, so in
+# streaming mode the document is reopened after this many pages
+REOPEN_EVERY_PAGES = 25
+
+
+class PdfDocument:
+    """
+    A PDF opened once, from downloaded bytes or a path on disk.
+
+    Text and tables are produced lazily on first use and kept for later
+    calls. Tables come from PyMuPDF's table finder by default; pass
+    precise_tables=True to use pdfplumber instead (slower, more exact).
+    With streaming=True, tables are not kept and callers read pages with
+    iter_page_texts, so memory does not grow with the page count.
+    Options left as None come from the environment settings.
+    """
+
+    def __init__(
+        self,
+        source: Union[bytes, str],
+        precise_tables: Optional[bool] = None,
+        workers: Optional[int] = None,
+        stop_after_allergen_tables: Optional[bool] = None,
+        streaming: Optional[bool] = None,
+    ):
+        settings = get_settings()
+        self.source = source
+        self.precise_tables = settings.pdf_precise_tables if precise_tables is None else precise_tables
+        self.workers = settings.pdf_workers if workers is None else workers
+        self.stop_after_allergen_tables = (
+            settings.pdf_early_exit if stop_after_allergen_tables is None else stop_after_allergen_tables
+        )
+        self.streaming = settings.streaming if streaming is None else streaming
+        self._page_tables: Optional[list[tuple[int, list[list[list[str]]]]]] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @cached_property
+    def doc(self) -> "fitz.Document":
+        import fitz
+
+        with MUPDF_LOCK:
+            if isinstance(self.source, bytes):
+                return fitz.open(stream=self.source, filetype="pdf")
+            return fitz.open(self.source)
+
+    def close(self) -> None:
+        if "doc" in self.__dict__:
+            with MUPDF_LOCK:
+                self.doc.close()
+            del self.__dict__["doc"]
+
+    @cached_property
+    def page_count(self) -> int:
+        return self.doc.page_count
+
+    def recycle(self, page_number: int) -> None:
+        """In streaming mode, release what MuPDF has loaded every REOPEN_EVERY_PAGES pages."""
+        if self.streaming and page_number and page_number % REOPEN_EVERY_PAGES == 0:
+            self.close()
+
+    def iter_page_texts(self) -> Iterator[str]:
+        for i in range(self.page_count):
+            with MUPDF_LOCK:
+                self.recycle(i)
+                text = self.doc[i].get_text("text")
+            yield text
+
+    @cached_property
+    def page_texts(self) -> list[str]:
+        with span("text_extraction", pages=self.page_count) as extraction:
+            texts = list(self.iter_page_texts())
+            extraction.set(chars=sum(len(text) for text in texts))
+        return texts
+
+    @cached_property
+    def text(self) -> str:
+        """All visible text, pages separated by blank lines."""
+        return "\n\n".join(self.page_texts)
+
+    @cached_property
+    def page_fingerprints(self) -> list[str]:
+        """
+        One hash per page of its content stream and embedded images, so a
+        page only counts as unchanged when it would draw the same thing
+        (an allergen marked with an icon changes the hash, not the text).
+        """
+        fingerprints = []
+        for i in range(self.page_count):
+            digest = hashlib.sha256()
+            with MUPDF_LOCK:
+                self.recycle(i)
+                page = self.doc[i]
+                digest.update(page.read_contents())
+                for image in page.get_image_info(hashes=True):
+                    digest.update(image.get("digest") or b"")
+            fingerprints.append(digest.hexdigest())
+        return fingerprints
+
+    @property
+    def detector(self) -> str:
+        """Which table finder produced the tables; tables from one are not reused for the other."""
+        return "pdfplumber" if self.precise_tables else "pymupdf"
+
+    def iter_page_tables(
+        self,
+        known: Optional[dict[int, list[list[list[str]]]]] = None,
+    ) -> Iterator[tuple[int, list[list[list[str]]]]]:
+        """
+        Yield (page_number, tables) for every page, in page order. Pages in
+        `known` (e.g. unchanged since a previous version) are not extracted again.
+        With workers > 1, pages are extracted in worker processes with either
+        table finder; otherwise PyMuPDF runs in this process, one page at a
+        time under MUPDF_LOCK.
+        """
+        known = dict(known or {})
+        if self.precise_tables or self.workers > 1:
+            missing = [i for i in range(self.page_count) if i not in known]
+            pages = iter_page_tables(self.source, workers=self.workers, pages=missing, detector=self.detector)
+            try:
+                while True:
+                    # Time each page as it is produced (in-process or by the worker pool)
+                    with span("tables.page", detector=self.detector) as page_span:
+                        page = next(pages, None)
+                        if page is not None:
+                            page_span.set(page=page[0] + 1, tables=len(page[1]))
+                    if page is None:
+                        break
+                    # Known pages before this one go first, to keep page order
+                    while known and min(known) < page[0]:
+                        first = min(known)
+                        yield first, known.pop(first)
+                    yield page
+            finally:
+                pages.close()
+            for i in sorted(known):
+                yield i, known[i]
+            return
+
+        for i in range(self.page_count):
+            if i in known:
+                yield i, known[i]
+                continue
+            with span("tables.page", detector="pymupdf", page=i + 1) as page_span, MUPDF_LOCK:
+                self.recycle(i)
+                tables = pymupdf_tables(self.doc[i])
+                page_span.set(tables=len(tables))
+            yield i, tables
+
+    def iter_tables(
+        self,
+        known: Optional[dict[int, list[list[list[str]]]]] = None,
+    ) -> Iterator[tuple[int, list[list[list[str]]]]]:
+        """
+        Yield (page_number, tables) as pages are processed, stopping early after
+        the allergen tables when configured to. Results are kept (unless
+        streaming), so later calls (and tables()) do not extract again;
+        `known` pages are never extracted.
+        """
+        if self._page_tables is not None:
+            yield from self._page_tables
+            return
+
+        page_tables = []
+        pages = self.iter_page_tables(known)
+        try:
+            for page_number, tables in iter_allergen_pages(pages, self.stop_after_allergen_tables):
+                if not self.streaming:
+                    page_tables.append((page_number, tables))
+                yield page_number, tables
+        finally:
+            pages.close()
+        if not self.streaming:
+            self._page_tables = page_tables
+
+    def tables(self) -> list[list[list[str]]]:
+        """All tables in the document as lists of rows."""
+        return [table for _, tables in self.iter_tables() for table in tables]
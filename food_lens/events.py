@@ -0,0 +1,57 @@
+# food_lens/events.py
+
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+
+@dataclass
+class ProgressEvent:
+    """A pipeline step started or advanced (e.g. stage="pages", current=3, total=12)."""
+    stage: str
+    message: str
+    current: Optional[int] = None
+    total: Optional[int] = None
+
+
+@dataclass
+class ItemsEvent:
+    """Newly found safe items. Each item is reported once per analysis."""
+    full_items: list[str] = field(default_factory=list)
+    sub_items: list[str] = field(default_factory=list)
+    source: str = ""
+
+
+@dataclass
+class ResultEvent:
+    """
+    The final answer: (full_items, sub_items), or None if analysis failed.
+    A stale result is the last known one, served while it is refreshed.
+    """
+    result: Optional[tuple[list[str], list[str]]]
+    cached: bool = False
+    stale: bool = False
+
+
+@dataclass
+class ChangesEvent:
+    """The guide changed since it was last analyzed, and with it which items are safe."""
+    became_safe: list[str] = field(default_factory=list)
+    became_unsafe: list[str] = field(default_factory=list)
+    source_url: str = ""
+
+
+EVENT_TYPES = {"progress": ProgressEvent, "items": ItemsEvent, "changes": ChangesEvent, "result": ResultEvent}
+
+
+def event_to_dict(event) -> dict:
+    """JSON-ready form of an event, tagged with its type."""
+    name = next(name for name, cls in EVENT_TYPES.items() if isinstance(event, cls))
+    return {"type": name, **asdict(event)}
+
+
+def event_from_dict(data: dict):
+    data = dict(data)
+    event = EVENT_TYPES[data.pop("type")](**data)
+    if isinstance(event, ResultEvent) and event.result is not None:
+        event.result = (list(event.result[0]), list(event.result[1]))
+    return event
@@ -1,21 +1,240 @@
 # food_lens/html_parser.py
 
-import requests
-from bs4 import BeautifulSoup
+import re
+from html.parser import HTMLParser
+from typing import Optional
+from food_lens.http_client import fetch_page
 
+HEADINGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+# Marks where a heading starts a new section; never appears in page text
+SECTION_MARK = "\x1e"
+# Elements whose content is never menu text
+SKIPPED = {"script", "style", "noscript", "template", "svg", "nav", "footer", "header", "head", "iframe"}
+# Elements that end a line of text
+BLOCKS = {
+    "p", "div", "li", "ul", "ol", "br", "tr", "table", "section", "article", "main", "dd", "dt", "dl",
+    *HEADINGS,
+}
+
+
+class PageExtractor:
+    """
+    Parser target collecting a page's text and tables in one streaming
+    pass, without building a tree. Content of SKIPPED elements is dropped
+    as it streams by. Text inside <main> is preferred when the page has one.
+    Each table row becomes one line of text ("cell | cell"), and the table
+    itself a list of rows, with colspan and rowspan cells repeated so every
+    row lines up with its header.
+    """
+
+    def __init__(self):
+        self.skip_depth = 0
+        self.main_depth = 0
+        self.lines: list[str] = []
+        self.main_lines: Optional[list[str]] = None
+        self.line: list[str] = []
+        self.tables: list[list[list[str]]] = []
+        # One entry per open table: rows, current row, current cell, rowspans carried {col: [text, rows left]}
+        self.table_stack: list[dict] = []
+
+    # lxml target and HTMLParser callbacks
+    def start(self, tag: str, attrs) -> None:
+        tag = tag.lower()
+        if self.skip_depth or tag in SKIPPED:
+            self.skip_depth += 1 if tag not in VOID else 0
+            return
+        if tag == "main":
+            self.main_depth += 1
+            if self.main_lines is None:
+                self.main_lines = []
+        if tag in HEADINGS:
+            self.end_line()
+            self.emit(SECTION_MARK)
+        elif tag in BLOCKS:
+            self.end_line()
+
+        if tag == "table":
+            self.table_stack.append({"rows": [], "row": None, "cell": None, "spans": {}})
+        elif self.table_stack:
+            table = self.table_stack[-1]
+            if tag == "tr":
+                self.end_row(table)
+                table["row"] = []
+            elif tag in ("td", "th"):
+                if table["row"] is None:
+                    table["row"] = []
+                self.end_cell(table)
+                attrs = dict(attrs)
+                table["cell"] = ([], span_count(attrs.get("colspan")), span_count(attrs.get("rowspan")))
+
+    def end(self, tag: str) -> None:
+        tag = tag.lower()
+        if self.skip_depth:
+            if tag not in VOID:
+                self.skip_depth -= 1
+            return
+        if self.table_stack:
+            table = self.table_stack[-1]
+            if tag in ("td", "th"):
+                self.end_cell(table)
+            elif tag == "tr":
+                self.end_row(table)
+            elif tag == "table":
+                self.end_row(table)
+                self.table_stack.pop()
+                if table["rows"]:
+                    self.tables.append(table["rows"])
+        if tag in BLOCKS:
+            self.end_line()
+        if tag == "main" and self.main_depth:
+            self.end_line()
+            self.main_depth -= 1
+
+    def data(self, text: str) -> None:
+        if self.skip_depth:
+            return
+        if self.table_stack and self.table_stack[-1]["cell"] is not None:
+            self.table_stack[-1]["cell"][0].append(text)
+        elif self.table_stack:
+            return  # whitespace between cells
+        else:
+            for i, part in enumerate(text.split("\n")):
+                if i:
+                    self.end_line()
+                self.line.append(part)
+
+    def close(self) -> None:
+        while self.table_stack:
+            self.end("table")
+        self.end_line()
+
+    # helpers
+    def emit(self, line: str) -> None:
+        self.lines.append(line)
+        if self.main_depth and self.main_lines is not None:
+            self.main_lines.append(line)
+
+    def end_line(self) -> None:
+        text = " ".join("".join(self.line).split())
+        self.line = []
+        if text:
+            self.emit(text)
+
+    def end_cell(self, table: dict) -> None:
+        if table["cell"] is None:
+            return
+        parts, colspan, rowspan = table["cell"]
+        table["cell"] = None
+        text = " ".join(" ".join(parts).split())
+        row = table["row"]
+        self.fill_spans(table, row)
+        for _ in range(colspan):
+            if rowspan > 1:
+                table["spans"][len(row)] = [text, rowspan - 1]
+            row.append(text)
+            self.fill_spans(table, row)
+
+    def fill_spans(self, table: dict, row: list[str]) -> None:
+        """Repeat cells spanning down from earlier rows into this one."""
+        while len(row) in table["spans"]:
+            carried = table["spans"][len(row)]
+            row.append(carried[0])
+            carried[1] -= 1
+            if not carried[1]:
+                del table["spans"][len(row) - 1]
+
+    def end_row(self, table: dict) -> None:
+        self.end_cell(table)
+        row, table["row"] = table["row"], None
+        if row is None:
+            return
+        self.fill_spans(table, row)
+        if any(row):
+            table["rows"].append(row)
+            self.emit(" | ".join(cell for cell in row))
+
+    def sections(self) -> list[str]:
+        lines = self.main_lines if self.main_lines else self.lines
+        sections = []
+        for part in "\n".join(lines).split(SECTION_MARK):
+            cleaned = [line for line in part.splitlines() if line.strip()]
+            if cleaned:
+                sections.append("\n".join(cleaned))
+        return sections
+
+
+VOID = {"br", "img", "hr", "input", "meta", "link", "area", "base", "col", "embed", "source", "track", "wbr"}
 
-def extract_text_from_html(url: str) -> str:
-    response = requests.get(url)
-    if not response.ok:
-        raise RuntimeError(f"Failed to fetch HTML: {url}")
 
-    soup = BeautifulSoup(response.text, "html.parser")
+def span_count(value: Optional[str]) -> int:
+    match = re.match(r"\s*(\d+)", value or "")
+    return max(1, min(int(match.group(1)), 100)) if match else 1
 
-    # Try to extract only main content
-    content = soup.find("main") or soup.find("body") or soup
-    raw_text = content.get_text(separator="\n")
-    
-    lines = [line.strip() for line in raw_text.splitlines()]
-    cleaned = [line for line in lines if line]  # Remove blank lines
 
-    return "\n".join(cleaned)
+class StdlibParser(HTMLParser):
+    """Feeds html.parser events to a PageExtractor, for when lxml is not installed."""
+
+    def __init__(self, target: PageExtractor):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag, attrs)
+        if tag in VOID:
+            self.target.end(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag not in VOID:
+            self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+
+def parse_html(html: str) -> PageExtractor:
+    """Run a PageExtractor over the page, with lxml's C parser when it is installed."""
+    extractor = PageExtractor()
+    try:
+        from lxml import etree
+    except ImportError:
+        parser = StdlibParser(extractor)
+        parser.feed(html)
+        parser.close()
+        extractor.close()
+        return extractor
+
+    # lxml calls close() itself; attributes arrive as a dict
+    parser = etree.HTMLParser(target=extractor, remove_comments=True)
+    parser.feed(html)
+    parser.close()
+    return extractor
+
+
+def extract_guide_from_html(url: str) -> dict:
+    """A page's "sections" and "tables", fetched and parsed once, with the validators ("etag", "last_modified") it was served with."""
+    response = fetch_page(url)
+    page = parse_html(response["text"])
+    return {
+        "sections": page.sections(),
+        "tables": page.tables,
+        "etag": response["etag"],
+        "last_modified": response["last_modified"],
+    }
+
+
+def extract_page_from_html(url: str) -> tuple[list[str], list[list[list[str]]]]:
+    """(sections, tables) of a page, fetched and parsed once."""
+    guide = extract_guide_from_html(url)
+    return guide["sections"], guide["tables"]
+
+
+def extract_sections_from_html(url: str) -> list[str]:
+    """The page's main text split at its headings, one string per section."""
+    return extract_page_from_html(url)[0]
+
+
+def extract_text_from_html(url: str) -> str:
+    return "\n".join(extract_sections_from_html(url))
@@ -0,0 +1,186 @@
+# food_lens/http_client.py
+
+import threading
+import requests
+from typing import TYPE_CHECKING, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from food_lens.config import get_settings
+from food_lens.instrumentation import span
+
+if TYPE_CHECKING:
+    from food_lens.workspace import Workspace
+
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = "Mozilla/5.0 (compatible; FoodLens/1.0)"
+
+
+class PooledSession(requests.Session):
+    """A requests session with pooled keep-alive connections and a default timeout."""
+
+    def __init__(self, pool_size: int = 32, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+        # Retry connection failures only; HTTP errors are left to the caller
+        retries = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.3)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"})
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+_session: Optional[PooledSession] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> PooledSession:
+    """Return the process-wide session shared by search, probes and downloads."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = PooledSession()
+        return _session
+
+
+def conditional_headers(etag: Optional[str] = None, last_modified: Optional[str] = None) -> dict:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def read_capped(response: requests.Response, max_bytes: int, first_bytes: Optional[bytes] = None, sink=None) -> Optional[bytes]:
+    """
+    Read a streamed response body, refusing anything over max_bytes. If
+    first_bytes is given, the body must start with it; the download is
+    aborted as soon as the first chunk shows otherwise. With a `sink`
+    (anything with write()), chunks are written to it and None is returned.
+    """
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise RuntimeError(f"Response too large ({int(length)} bytes, limit {max_bytes}): {response.url}")
+
+    buffer = bytearray()
+    write = buffer.extend if sink is None else sink.write
+    head = b""
+    size = 0
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        write(chunk)
+        size += len(chunk)
+        if first_bytes and len(head) < len(first_bytes):
+            head += chunk[:len(first_bytes) - len(head)]
+            if len(head) >= len(first_bytes) and not head.startswith(first_bytes):
+                raise RuntimeError("Downloaded file is not a valid PDF — server may be returning an HTML page")
+        if size > max_bytes:
+            raise RuntimeError(f"Response exceeded {max_bytes} bytes: {response.url}")
+    return bytes(buffer) if sink is None else None
+
+
+def fetch_pdf(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    workspace: Optional["Workspace"] = None,
+) -> dict:
+    """
+    Download a PDF, streaming it in chunks. Without a workspace the body is
+    returned in memory as "content"; with one it is written to a workspace
+    file, and a large body is returned as a "path" (with content None).
+
+    Pass the etag/last_modified from an earlier download to make a
+    conditional request; if the server answers 304, the result has
+    not_modified=True and no content. max_bytes defaults to the
+    FOODLENS_MAX_PDF_BYTES setting.
+    """
+    max_bytes = max_bytes or get_settings().max_pdf_bytes
+    headers = conditional_headers(etag, last_modified)
+    with span("download", url=url, conditional=bool(headers)) as download, \
+            get_session().get(url, headers=headers, stream=True) as response:
+        download.set(status=response.status_code)
+        if response.status_code == 304:
+            return {"content": None, "etag": etag, "last_modified": last_modified, "not_modified": True}
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to download file: {url}")
+
+        result = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "not_modified": False,
+        }
+        if workspace is None:
+            content = read_capped(response, max_bytes, first_bytes=b"%PDF")
+            head, size = content[:4], len(content)
+            result["content"] = content
+        else:
+            body = workspace.file(".pdf")
+            read_capped(response, max_bytes, first_bytes=b"%PDF", sink=body)
+            body.finish()
+            head, size = body.head(4), body.size
+            result.update(content=body.content, path=body.path, sha256=body.sha256)
+        if not head.startswith(b"%PDF"):
+            raise RuntimeError("Downloaded file is not a valid PDF — server may be returning an HTML page")
+        download.set(bytes=size, spilled=bool(result.get("path")))
+        return result
+
+
+def check_modified(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> dict:
+    """
+    Ask whether a guide changed since an earlier download, without
+    downloading it: a conditional HEAD, or a GET closed before its body for
+    servers that refuse HEAD. Returns modified (True whenever the server
+    cannot tell) and the current etag and last_modified.
+    """
+    headers = conditional_headers(etag, last_modified)
+    session = get_session()
+    with span("revalidate", url=url, conditional=bool(headers)) as revalidate:
+        response = session.head(url, headers=headers, allow_redirects=True)
+        if response.status_code in (405, 501):
+            with session.get(url, headers=headers, stream=True) as response:
+                pass
+        revalidate.set(status=response.status_code)
+
+    if response.status_code == 304:
+        return {"modified": False, "etag": etag, "last_modified": last_modified}
+    if not response.ok:
+        raise RuntimeError(f"Failed to revalidate: {url}")
+    current = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+    # Servers that ignore conditional headers still send validators to compare; the ETag wins when both have one
+    if etag and current["etag"]:
+        unchanged = current["etag"] == etag
+    else:
+        unchanged = bool(last_modified) and current["last_modified"] == last_modified
+    return {"modified": not unchanged, **current}
+
+
+def fetch_page(url: str, max_bytes: Optional[int] = None) -> dict:
+    """
+    Fetch a web page, with the shared session's timeout and a size cap
+    (FOODLENS_MAX_HTML_BYTES). Returns its "text" and the "etag" and
+    "last_modified" to revalidate it with later.
+    """
+    max_bytes = max_bytes or get_settings().max_html_bytes
+    with span("download.html", url=url) as download, get_session().get(url, stream=True) as response:
+        download.set(status=response.status_code)
+        if not response.ok:
+            raise RuntimeError(f"Failed to fetch HTML: {url}")
+        content = read_capped(response, max_bytes)
+        download.set(bytes=len(content))
+        encoding = response.encoding or response.apparent_encoding or "utf-8"
+        return {
+            "text": content.decode(encoding, errors="replace"),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+
+def fetch_text(url: str, max_bytes: Optional[int] = None) -> str:
+    """Fetch a web page as text."""
+    return fetch_page(url, max_bytes)["text"]
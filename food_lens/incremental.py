@@ -0,0 +1,106 @@
+# food_lens/incremental.py
+
+import logging
+from typing import Optional
+from food_lens.cache import BaseCache, make_key, allergen_parts, ANALYSIS_TTL
+from food_lens.instrumentation import metrics
+
+Tables = list[list[list[str]]]
+
+# What is kept per guide URL, across versions of the guide:
+#   sha256        hash of the version analyzed last
+#   fingerprints  one hash per page (PDF) or section (HTML) of that version
+#   detector      table finder that produced page_tables
+#   page_tables   tables of each page of that version, by page fingerprint
+#   results       the last result per allergen set, with the sha256 it came from
+
+
+def load_guide(cache: BaseCache, url: str) -> dict:
+    """What is known about the last analyzed version of the guide at `url` ({} if nothing)."""
+    return cache.get("guide", make_key(url)) or {}
+
+
+def save_guide(cache: BaseCache, url: str, **fields) -> None:
+    guide = load_guide(cache, url)
+    guide.update(fields)
+    cache.set("guide", make_key(url), guide, ttl=ANALYSIS_TTL)
+
+
+def changed_parts(guide: dict, fingerprints: list[str]) -> int:
+    """How many pages/sections have no identical counterpart in the previous version."""
+    previous = set(guide.get("fingerprints", []))
+    return sum(1 for fingerprint in fingerprints if fingerprint not in previous)
+
+
+def reusable_page_tables(guide: dict, fingerprints: list[str], detector: str) -> dict[int, Tables]:
+    """Tables of the pages that are unchanged since the previous version, by page number."""
+    if guide.get("detector") != detector:
+        return {}
+    previous = guide.get("page_tables", {})
+    return {i: previous[fingerprint] for i, fingerprint in enumerate(fingerprints) if fingerprint in previous}
+
+
+def save_page_tables(
+    cache: BaseCache,
+    url: str,
+    sha256: str,
+    fingerprints: list[str],
+    detector: str,
+    page_tables: list[tuple[int, Tables]],
+) -> None:
+    save_guide(
+        cache, url,
+        sha256=sha256,
+        fingerprints=fingerprints,
+        detector=detector,
+        page_tables={fingerprints[page_number]: tables for page_number, tables in page_tables},
+    )
+
+
+def log_guide_update(guide: dict, sha256: str, fingerprints: list[str], unit: str = "pages") -> None:
+    if guide.get("sha256") and guide["sha256"] != sha256:
+        changed = changed_parts(guide, fingerprints)
+        metrics.counter(f"incremental.{unit}_changed").inc(changed)
+        metrics.counter(f"incremental.{unit}_reused").inc(len(fingerprints) - changed)
+        logging.info(f"🔁 Guide updated: {changed}/{len(fingerprints)} {unit} changed since the last analysis.")
+
+
+def diff_results(old: tuple[list[str], list[str]], new: tuple[list[str], list[str]]) -> dict:
+    """Items safe in `new` but not `old` (became_safe) and the reverse (became_unsafe)."""
+    old_items = dict.fromkeys([*old[0], *old[1]])
+    new_items = dict.fromkeys([*new[0], *new[1]])
+    return {
+        "became_safe": [item for item in new_items if item not in old_items],
+        "became_unsafe": [item for item in old_items if item not in new_items],
+    }
+
+
+def record_result(
+    cache: BaseCache,
+    url: str,
+    sha256: str,
+    allergens: list[str],
+    result: tuple[list[str], list[str]],
+) -> Optional[dict]:
+    """
+    Remember the result for this version of the guide. Returns the diff
+    against the previous version's result for the same allergens when the
+    guide has changed and some items changed with it, else None.
+    """
+    guide = load_guide(cache, url)
+    results = dict(guide.get("results", {}))
+    key = make_key(*allergen_parts(allergens))
+    previous = results.get(key)
+    results[key] = {"sha256": sha256, "result": (list(result[0]), list(result[1]))}
+    save_guide(cache, url, results=results)
+
+    if previous is None or previous["sha256"] == sha256:
+        return None
+    changes = diff_results(previous["result"], result)
+    if not (changes["became_safe"] or changes["became_unsafe"]):
+        return None
+    for item in changes["became_unsafe"]:
+        logging.warning(f"⚠️ No longer safe ({', '.join(allergens)}): {item}")
+    for item in changes["became_safe"]:
+        logging.info(f"✅ Newly safe ({', '.join(allergens)}): {item}")
+    return changes
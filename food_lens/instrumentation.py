@@ -0,0 +1,221 @@
+# food_lens/instrumentation.py
+
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from food_lens.config import get_settings
+
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Records observations; keeps a bounded random sample for percentiles."""
+
+    def __init__(self, max_samples: int = 10_000):
+        self._lock = threading.Lock()
+        self.max_samples = max_samples
+        self.samples: list[float] = []
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+            if len(self.samples) < self.max_samples:
+                self.samples.append(value)
+            else:
+                # Reservoir sampling keeps the sample representative
+                i = random.randrange(self.count)
+                if i < self.max_samples:
+                    self.samples[i] = value
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class MetricsRegistry:
+    """In-process counters and histograms, looked up by name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[str, Counter] = {}
+        self.histograms: dict[str, Histogram] = {}
+
+    def counter(self, name: str) -> Counter:
+        with self._lock:
+            return self.counters.setdefault(name, Counter())
+
+    def histogram(self, name: str) -> Histogram:
+        with self._lock:
+            return self.histograms.setdefault(name, Histogram())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+        return {
+            "counters": {name: counter.value for name, counter in sorted(counters.items())},
+            "histograms": {name: histogram.snapshot() for name, histogram in sorted(histograms.items())},
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+metrics = MetricsRegistry()
+
+
+class Span:
+    """One timed pipeline step. Attributes can be added while it runs with set()."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "error": self.error,
+            "attrs": self.attrs,
+        }
+
+
+class JsonLinesExporter:
+    """Appends each finished span to a file as one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("foodlens_span", default=None)
+_exporters: list[Callable[[Span], None]] = []
+_exporters_lock = threading.Lock()
+# Exporter for the FOODLENS_TRACE_FILE setting, replaced when the setting changes
+_trace_exporter: Optional[JsonLinesExporter] = None
+
+
+def trace_file_exporter() -> Optional[JsonLinesExporter]:
+    """The exporter for the current settings' trace_file, or None when tracing to a file is off."""
+    global _trace_exporter
+    path = get_settings().trace_file
+    if not path:
+        return None
+    with _exporters_lock:
+        if _trace_exporter is None or _trace_exporter.path != path:
+            _trace_exporter = JsonLinesExporter(path)
+        return _trace_exporter
+
+
+def add_exporter(exporter: Callable[[Span], None]) -> None:
+    """Call `exporter(span)` for every finished span (e.g. JsonLinesExporter(path))."""
+    with _exporters_lock:
+        _exporters.append(exporter)
+
+
+def remove_exporter(exporter: Callable[[Span], None]) -> None:
+    with _exporters_lock:
+        if exporter in _exporters:
+            _exporters.remove(exporter)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """
+    Time a block as a span nested under the current one. The duration is
+    recorded in the `<name>.ms` histogram and errors in `<name>.errors`.
+    """
+    parent = _current_span.get()
+    current = Span(name, parent.trace_id if parent else uuid.uuid4().hex, parent.span_id if parent else None, attrs)
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        metrics.counter(f"{name}.errors").inc()
+        raise
+    finally:
+        current.duration_ms = (time.perf_counter() - started) * 1000
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            pass  # a generator holding this span was closed from another context
+        metrics.histogram(f"{name}.ms").observe(current.duration_ms)
+        with _exporters_lock:
+            exporters = list(_exporters)
+        trace_exporter = trace_file_exporter()
+        if trace_exporter is not None:
+            exporters.append(trace_exporter)
+        for exporter in exporters:
+            try:
+                exporter(current)
+            except Exception as e:
+                logging.debug(f"Span exporter failed: {e}")
+
+
+def in_current_context(fn: Callable) -> Callable:
+    """Wrap fn so it runs with the caller's span context, e.g. on a worker thread."""
+    context = contextvars.copy_context()
+    # A Context can only be entered by one thread at a time, so run each call in its own copy
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
@@ -1,15 +1,25 @@
 # food_lens/llm_client.py
 
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
-from food_lens.utils import chunk_text, merge_multiline_items
-from food_lens.smart_table_parser import extract_safe_items_from_tables
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Iterator, Optional, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+from food_lens.config import get_context
+from food_lens.utils import (
+    Chunk, chunk_rows, chunk_sections, iter_chunk_sections, split_chunk, count_tokens, merge_multiline_items,
+)
+from food_lens.cache import BaseCache, make_key, content_hash, COMPLETION_TTL
+from food_lens.instrumentation import span, metrics, current_span, in_current_context
+from food_lens.allergen_matrix import ALLERGENS, AllergenMatrix
 
-load_dotenv()
+TEMPERATURE = 0.2
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
+SYSTEM_PROMPT = (
+    "You are an expert food allergen classifier. "
+    "You must treat a blank cell in an allergen column as SAFE (allergen not present), "
+    "not as missing or unknown data. Return only items that are confirmed safe by this rule."
+)
 
 PROMPT_TEMPLATE_MAP = {
     "dairy": """
@@ -49,66 +59,406 @@ Here is the allergen list:
 """
 }
 
+MATRIX_SYSTEM_PROMPT = (
+    "You are an expert food allergen classifier. "
+    "You must treat a blank cell in an allergen column as the allergen NOT being present, "
+    "not as missing or unknown data. Answer with a single JSON object and nothing else."
+)
+
+MATRIX_PROMPT_TEMPLATE = """
+The following content is from a restaurant's allergen guide. List **every menu item** in it with the allergens the guide marks it as containing.
+
+Allergens to report: {allergens}.
+
+Rules:
+- "allergens_listed": the allergens above that this part of the guide reports on (a column or mention for them). If the guide says "No Major Allergens Present" for an item, all of them are reported on.
+- "contains": the allergens marked "Yes", "Contains", "May Contain" or with a mark for the item. A blank cell means NOT present.
+- Some items span multiple lines, like "Asian Sesame with & without Chicken" — treat those as **one item**.
+- "category": "full" for main dishes (salads, bowls, soups, sandwiches, mac & cheese, pizzas, entrees), "sub" for sides, drinks, toppings, sauces, dressings, breads and individual ingredients.
+- Skip headings, legends and footnotes.
+
+Answer with JSON matching this schema:
+{schema}
+
+Here is the allergen list:
+----------------------
+{text}
+----------------------
+"""
+
+# One JSON row per item is longer than a list of names, so matrix answers get more room;
+# a chunk whose answer still does not fit is split and asked again (see iter_chunk_answers)
+MATRIX_MAX_TOKENS = 2000
+
 def preprocess_pdf_text(text: str) -> str:
-    lines = text.splitlines()
-    cleaned_lines = []
-    for line in lines:
-        stripped = line.strip()
-        if not stripped:
-            continue
-        if "CropBox missing" in stripped or "defaulting to MediaBox" in stripped:
-            continue
-        cleaned_lines.append(stripped)
+    with span("preprocess", chars=len(text)):
+        lines = text.splitlines()
+        cleaned_lines = []
+        for line in lines:
+            stripped = line.strip()
+            if not stripped:
+                continue
+            if "CropBox missing" in stripped or "defaulting to MediaBox" in stripped:
+                continue
+            cleaned_lines.append(stripped)
+
+        merged_lines = merge_multiline_items(cleaned_lines)
+        return "\n".join(merged_lines)
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """Retry rate limits, timeouts, connection errors and 5xx responses."""
+    import openai
+
+    if isinstance(exc, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+def completion_key(prompt: str, max_tokens: int, system_prompt: str = SYSTEM_PROMPT, json_mode: bool = False) -> str:
+    """Cache key covering everything that determines an answer: model, both prompts and parameters."""
+    model = get_context().settings.model
+    return make_key(
+        model,
+        content_hash(system_prompt.encode("utf-8")),
+        content_hash(prompt.encode("utf-8")),
+        max_tokens,
+        TEMPERATURE,
+        json_mode,
+    )
+
+
+def record_usage(completion: dict, source: str) -> None:
+    """
+    Count the tokens of one answer: spent when it came from the API ("api"),
+    saved when it came from the cache ("cache") or from an identical
+    request already in flight ("dedup").
+    """
+    prompt_tokens = completion.get("prompt_tokens") or 0
+    completion_tokens = completion.get("completion_tokens") or 0
+    if source == "api":
+        metrics.counter("llm.prompt_tokens").inc(prompt_tokens)
+        metrics.counter("llm.completion_tokens").inc(completion_tokens)
+    else:
+        metrics.counter(f"llm.{source}_hits").inc()
+        metrics.counter("llm.saved_prompt_tokens").inc(prompt_tokens)
+        metrics.counter("llm.saved_completion_tokens").inc(completion_tokens)
+    active = current_span()
+    if active is not None:
+        active.set(source=source, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def token_usage() -> dict:
+    """Tokens spent on and saved from the API so far in this process."""
+    counters = metrics.snapshot()["counters"]
+    return {
+        "prompt_tokens": counters.get("llm.prompt_tokens", 0),
+        "completion_tokens": counters.get("llm.completion_tokens", 0),
+        "saved_prompt_tokens": counters.get("llm.saved_prompt_tokens", 0),
+        "saved_completion_tokens": counters.get("llm.saved_completion_tokens", 0),
+        "cache_hits": counters.get("llm.cache_hits", 0),
+        "dedup_hits": counters.get("llm.dedup_hits", 0),
+    }
+
+
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def complete(
+    prompt: str,
+    max_tokens: int = 1000,
+    cache: Optional[BaseCache] = None,
+    system_prompt: str = SYSTEM_PROMPT,
+    json_mode: bool = False,
+) -> dict:
+    """
+    Answer one prompt as {"text", "prompt_tokens", "completion_tokens",
+    "finish_reason"}.
+    Answers are kept in `cache` under completion_key; concurrent identical
+    prompts are sent once and share the answer. `json_mode` asks the API
+    for a JSON object.
+    """
+    key = completion_key(prompt, max_tokens, system_prompt, json_mode)
+    with span("llm.completion", model=get_context().settings.model):
+        if cache is not None:
+            cached = cache.get("completions", key)
+            if cached is not None:
+                record_usage(cached, "cache")
+                return cached
+
+        with _inflight_lock:
+            future = _inflight.get(key)
+            owner = future is None
+            if owner:
+                future = _inflight[key] = Future()
+        if not owner:
+            completion = future.result()
+            record_usage(completion, "dedup")
+            return completion
+
+        try:
+            completion = send_prompt(prompt, max_tokens, system_prompt=system_prompt, json_mode=json_mode)
+            future.set_result(completion)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+        record_usage(completion, "api")
+        if cache is not None:
+            cache.set("completions", key, completion, ttl=COMPLETION_TTL)
+        return completion
+
 
-    merged_lines = merge_multiline_items(cleaned_lines)
-    return "\n".join(merged_lines)
+def send_prompt(prompt: str, max_tokens: int, system_prompt: str = SYSTEM_PROMPT, json_mode: bool = False) -> dict:
+    """Send one prompt, retrying transient failures with exponential backoff."""
+    from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
 
-def ask_gpt_for_safe_items(text: str, allergen: str = "dairy", max_tokens: int = 1000) -> tuple[list[str], list[str]]:
+    retrying = Retrying(
+        retry=retry_if_exception(is_retryable_error),
+        wait=wait_random_exponential(multiplier=1, max=30),
+        stop=stop_after_attempt(5),
+        reraise=True,
+    )
+    return retrying(request_completion, prompt, max_tokens, system_prompt, json_mode)
+
+
+def request_completion(prompt: str, max_tokens: int, system_prompt: str = SYSTEM_PROMPT, json_mode: bool = False) -> dict:
+    context = get_context()
+    context.rate_limiter.acquire(count_tokens(system_prompt) + count_tokens(prompt) + max_tokens)
+    options = {"response_format": {"type": "json_object"}} if json_mode else {}
+    response = context.openai_client.chat.completions.create(
+        model=context.settings.model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=max_tokens,
+        temperature=TEMPERATURE,
+        **options,
+    )
+    usage = response.usage
+    choice = response.choices[0]
+    return {
+        "text": choice.message.content,
+        "prompt_tokens": usage.prompt_tokens if usage is not None else None,
+        "completion_tokens": usage.completion_tokens if usage is not None else None,
+        # "length" when the answer was cut off at max_tokens
+        "finish_reason": choice.finish_reason,
+    }
+
+
+def iter_chunk_answers(
+    text: Union[str, list[str]],
+    build_prompt: Callable[[str], str],
+    parse: Callable[[str], Any],
+    empty: Callable[[], Any],
+    merge: Callable[[Any, Any], Any],
+    max_tokens: int,
+    concurrency: Optional[int] = None,
+    cache: Optional[BaseCache] = None,
+    system_prompt: str = SYSTEM_PROMPT,
+    json_mode: bool = False,
+    **span_attrs,
+) -> Iterator[tuple[int, int, Any]]:
+    """
+    Yield (chunk_index, chunk_count, parse(answer)) for each chunk, in chunk
+    order; a chunk whose request fails yields a new `empty()`. Chunks run
+    concurrently; each is yielded as soon as it and every chunk before it
+    have finished.
+
+    An answer cut off at max_tokens, or that `parse` rejects with
+    ValueError, is not taken for "no items": the chunk is split in half,
+    each half asked again and the answers combined with `merge`. A single
+    row that still gets no usable answer raises ValueError.
+
+    `text` may be a list of sections (pages) instead, chunked with
+    chunk_sections. Identical chunks are sent once; with a cache, answers
+    are reused across runs, so re-analyzing an updated guide only sends
+    the chunks that changed.
+
+    Any other iterable of sections is consumed lazily: chunks are built
+    only a window of settings.stream_window ahead of the answers, and
+    chunk_count is None since the total is not known up front.
+    """
+    settings = get_context().settings
+    concurrency = concurrency or settings.llm_concurrency
+    streaming = not isinstance(text, (str, list))
+    if isinstance(text, str):
+        chunks = chunk_rows(text, max_tokens=settings.chunk_tokens)
+    elif streaming:
+        chunks = iter_chunk_sections(text, max_tokens=settings.chunk_tokens)
+    else:
+        chunks = chunk_sections(text, max_tokens=settings.chunk_tokens)
+    total = None if streaming else len(chunks)
+    if total == 0:
+        return
+    if total:
+        logging.info(f"\U0001F9E0 Sending {total} chunks, {sum(chunk.tokens for chunk in chunks)} tokens of guide text")
+    window = max(concurrency, settings.stream_window) if streaming else total
+
+    def process_chunk(i: int, chunk: Chunk) -> tuple[Any, Optional[dict]]:
+        logging.info(f"\U0001F9E0 Processing chunk {i+1}/{total or '?'} ({chunk.tokens} tokens)...")
+        logging.debug(f"\n--- RAW TEXT CHUNK ---\n{chunk.text[:1000]}...\n")
+
+        # Use raw text directly instead of markdown
+        prompt = build_prompt(chunk.text.strip())
+
+        with span("llm.chunk", chunk=i + 1, chunks=total, chunk_tokens=chunk.tokens, **span_attrs):
+            try:
+                completion = complete(
+                    prompt, max_tokens=max_tokens, cache=cache, system_prompt=system_prompt, json_mode=json_mode
+                )
+            except Exception as e:
+                metrics.counter("llm.chunk_failures").inc()
+                logging.warning(f"⚠️ GPT request failed for chunk {i+1}: {e}")
+                return empty(), None
+        if completion.get("finish_reason") == "length":
+            problem = f"the answer was cut off at {max_tokens} tokens"
+        else:
+            try:
+                with span("llm.parse"):
+                    return parse(completion["text"]), completion
+            except ValueError as e:
+                metrics.counter("llm.parse_failures").inc()
+                problem = f"the answer could not be parsed ({e})"
+
+        halves = split_chunk(chunk)
+        if not halves:
+            raise ValueError(f"No usable answer for chunk {i+1}: {problem}")
+        metrics.counter("llm.chunk_splits").inc()
+        logging.warning(f"⚠️ Splitting chunk {i+1} in two; {problem}.")
+        answer, _ = process_chunk(i, halves[0])
+        for half in halves[1:]:
+            answer = merge(answer, process_chunk(i, half)[0])
+        return answer, completion
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, window)))
+    run_chunk = in_current_context(process_chunk)
+    # A chunk identical to an earlier one still in the window (a page repeated
+    # in the guide) is not sent again; beyond the window, the cache catches it
+    first_with_text: dict[str, Future] = {}
+    in_window: deque = deque()
+
+    def next_answer() -> tuple[int, Optional[int], Any]:
+        i, future, duplicate, digest = in_window.popleft()
+        answer, completion = future.result()
+        if duplicate and completion is not None:
+            record_usage(completion, "dedup")
+        if streaming and first_with_text.get(digest) is future and all(entry[3] != digest for entry in in_window):
+            del first_with_text[digest]
+        return i, total, answer
+
+    try:
+        for i, chunk in enumerate(chunks):
+            digest = content_hash(chunk.text.encode("utf-8"))
+            future = first_with_text.get(digest)
+            duplicate = future is not None
+            if not duplicate:
+                future = first_with_text[digest] = executor.submit(run_chunk, i, chunk)
+            in_window.append((i, future, duplicate, digest))
+            if len(in_window) >= window:
+                yield next_answer()
+        while in_window:
+            yield next_answer()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_gpt_safe_items(
+    text: Union[str, list[str]],
+    allergen: str = "dairy",
+    max_tokens: int = 1000,
+    concurrency: Optional[int] = None,
+    cache: Optional[BaseCache] = None,
+) -> Iterator[tuple[int, int, list[str], list[str]]]:
+    """
+    Yield (chunk_index, chunk_count, full_items, sub_items) for each chunk,
+    asking for the items safe for one allergen; see iter_chunk_answers.
+    """
     prompt_template = PROMPT_TEMPLATE_MAP.get(allergen)
     if not prompt_template:
         raise ValueError(f"Unsupported allergen: {allergen}")
 
-    chunks = [chunk for chunk in chunk_text(text, size=3500, overlap=200) if chunk.strip()]
+    for i, total, (full_items, sub_items) in iter_chunk_answers(
+        text,
+        lambda chunk_text: prompt_template.replace("{text}", chunk_text),
+        parse_gpt_result,
+        lambda: ([], []),
+        lambda first, second: (first[0] + second[0], first[1] + second[1]),
+        max_tokens,
+        concurrency,
+        cache,
+        allergen=allergen,
+    ):
+        yield i, total, full_items, sub_items
 
-    all_full_items = []
-    all_sub_items = []
 
-    for i, chunk in enumerate(chunks):
-        print(f"\U0001F9E0 Processing chunk {i+1}/{len(chunks)}...")
-        print(f"\n--- RAW TEXT CHUNK ---\n{chunk[:1000]}...\n")
+def matrix_prompt(text: str) -> str:
+    from food_lens.llm_schema import response_schema
 
-        # Use raw text directly instead of markdown
-        merged_text = chunk.strip()
-        prompt = prompt_template.replace("{text}", merged_text)
+    return (
+        MATRIX_PROMPT_TEMPLATE
+        .replace("{allergens}", ", ".join(ALLERGENS))
+        .replace("{schema}", response_schema())
+        .replace("{text}", text)
+    )
 
-        try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": (
-                        "You are an expert food allergen classifier. "
-                        "You must treat a blank cell in an allergen column as SAFE (allergen not present), "
-                        "not as missing or unknown data. Return only items that are confirmed safe by this rule."
-                    )},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=max_tokens,
-                temperature=0.2,
-            )
-            result = response.choices[0].message.content
-            full_items, sub_items = parse_gpt_result(result)
-            all_full_items.extend(full_items)
-            all_sub_items.extend(sub_items)
-        except Exception as e:
-            print(f"⚠️ GPT request failed for chunk {i+1}: {e}")
-
-    if not all_full_items and not all_sub_items:
-        try:
-            fallback_full, fallback_sub = extract_safe_items_from_tables([], allergen)
-            all_full_items = list(dict.fromkeys(fallback_full))
-            all_sub_items = list(dict.fromkeys(fallback_sub))
-        except Exception as e:
-            print(f"⚠️ Fallback parser failed: {e}")
+
+def parse_matrix_answer(result: str) -> AllergenMatrix:
+    """The matrix of one chunk's JSON answer; ValueError if it is not usable."""
+    from food_lens.llm_schema import parse_matrix_result
+
+    return parse_matrix_result(result).to_matrix()
+
+
+def merge_matrices(first: AllergenMatrix, second: AllergenMatrix) -> AllergenMatrix:
+    first.merge(second)
+    return first
+
+
+def iter_gpt_matrix(
+    text: Union[str, list[str]],
+    max_tokens: int = MATRIX_MAX_TOKENS,
+    concurrency: Optional[int] = None,
+    cache: Optional[BaseCache] = None,
+) -> Iterator[tuple[int, int, AllergenMatrix]]:
+    """
+    Yield (chunk_index, chunk_count, matrix) for each chunk: one request per
+    chunk returns every item with a flag per allergen (as JSON validated
+    with pydantic), so a single pass answers any combination of the nine
+    allergens. See iter_chunk_answers.
+    """
+    yield from iter_chunk_answers(
+        text,
+        matrix_prompt,
+        parse_matrix_answer,
+        AllergenMatrix,
+        merge_matrices,
+        max_tokens,
+        concurrency,
+        cache,
+        system_prompt=MATRIX_SYSTEM_PROMPT,
+        json_mode=True,
+        allergen="all",
+    )
+
+
+def ask_gpt_for_safe_items(
+    text: Union[str, list[str]],
+    allergen: str = "dairy",
+    max_tokens: int = 1000,
+    concurrency: Optional[int] = None,
+    cache: Optional[BaseCache] = None,
+) -> tuple[list[str], list[str]]:
+    all_full_items = []
+    all_sub_items = []
+
+    # Results are merged in chunk order so output does not depend on completion order
+    for _, _, full_items, sub_items in iter_gpt_safe_items(text, allergen, max_tokens, concurrency, cache):
+        all_full_items.extend(full_items)
+        all_sub_items.extend(sub_items)
 
     return list(dict.fromkeys(all_full_items)), list(dict.fromkeys(all_sub_items))
 
@@ -0,0 +1,91 @@
+# food_lens/llm_schema.py
+
+import re
+import json
+import logging
+from typing import Any, Literal
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from food_lens.allergen_matrix import AllergenMatrix, allergen_mask, canonical_allergen
+
+
+def canonical_list(value: Any) -> list[str]:
+    """Canonical allergen names from whatever the model wrote ('Milk', 'tree nut'); others are dropped."""
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    names = [canonical_allergen(name) for name in value if isinstance(name, str)]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+class MenuItemRow(BaseModel):
+    """One menu item and the allergens the guide marks it as containing."""
+
+    name: str = Field(min_length=1)
+    category: Literal["full", "sub"] = "sub"
+    contains: list[str] = Field(default_factory=list)
+
+    @field_validator("category", mode="before")
+    @classmethod
+    def _category(cls, value: Any) -> str:
+        return "full" if isinstance(value, str) and value.strip().lower() == "full" else "sub"
+
+    @field_validator("contains", mode="before")
+    @classmethod
+    def _contains(cls, value: Any) -> list[str]:
+        return canonical_list(value)
+
+
+class MenuMatrixResponse(BaseModel):
+    """
+    The model's answer for one chunk of a guide. allergens_listed are the
+    allergens the guide reports on: an item is only known to be free of an
+    allergen the guide lists.
+    """
+
+    allergens_listed: list[str] = Field(default_factory=list)
+    items: list[MenuItemRow] = Field(default_factory=list)
+
+    @field_validator("allergens_listed", mode="before")
+    @classmethod
+    def _listed(cls, value: Any) -> list[str]:
+        return canonical_list(value)
+
+    def to_matrix(self) -> AllergenMatrix:
+        matrix = AllergenMatrix()
+        listed = allergen_mask(self.allergens_listed)
+        for item in self.items:
+            present = allergen_mask(item.contains)
+            # An allergen marked as contained is reported on, listed or not
+            matrix.add(item.name.strip(), present, listed | present, category=item.category)
+        return matrix
+
+
+def response_schema() -> str:
+    return json.dumps(MenuMatrixResponse.model_json_schema(), separators=(",", ":"))
+
+
+def parse_matrix_result(result: str) -> MenuMatrixResponse:
+    """
+    Parse the model's JSON answer. Items that fail validation are dropped
+    one by one rather than losing the chunk; an answer that is not JSON at
+    all raises ValueError.
+    """
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", result.strip())
+    try:
+        return MenuMatrixResponse.model_validate_json(text)
+    except ValidationError:
+        pass
+
+    data = json.loads(text)  # ValueError if this is not JSON
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object with 'items'")
+    items = []
+    for item in data.get("items") or []:
+        try:
+            items.append(MenuItemRow.model_validate(item))
+        except ValidationError as e:
+            logging.debug(f"Dropping invalid item {item!r}: {e}")
+    return MenuMatrixResponse(allergens_listed=data.get("allergens_listed"), items=items)
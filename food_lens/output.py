@@ -1,7 +1,15 @@
 # food_lens/output.py
 
-def print_dairy_safe_results(full_items: list[str], sub_items: list[str]) -> None:
-    print("🟢 Dairy-safe menu items:")
+def safe_heading(allergens: list[str]) -> str:
+    """"Dairy-safe", "Dairy- and egg-safe", "Dairy-, egg- and sesame-safe"."""
+    names = [allergens[0].capitalize(), *allergens[1:]] if allergens else ["Allergen"]
+    if len(names) == 1:
+        return f"{names[0]}-safe"
+    return f"{'-, '.join(names[:-1])}- and {names[-1]}-safe"
+
+
+def print_safe_results(full_items: list[str], sub_items: list[str], allergens: list[str]) -> None:
+    print(f"🟢 {safe_heading(allergens)} menu items:")
     for item in full_items:
         print(f" - {item}")
 
@@ -1,25 +1,195 @@
 # food_lens/pdf_parser.py
 
-import pdfplumber
+import io
 import logging
+import multiprocessing
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Union
+from concurrent.futures import ProcessPoolExecutor
+from food_lens.table_normalizer import find_header
+
+if TYPE_CHECKING:
+    import fitz
 
 # Suppress general pdfminer warnings
 logging.getLogger("pdfminer").setLevel(logging.ERROR)
 logging.getLogger("pdfminer.layout").setLevel(logging.ERROR)
 
-def extract_tables_from_pdf(filepath: str) -> list[list[list[str]]]:
-    """Extracts all tables from every page as lists of rows."""
-    all_tables = []
-
-    with pdfplumber.open(filepath) as pdf:
-        for page in pdf.pages:
-            tables = page.extract_tables()
-            for table in tables:
-                # Clean each cell
-                cleaned = [
-                    [cell.strip() if cell else "" for cell in row]
-                    for row in table
-                ]
-                all_tables.append(cleaned)
-
-    return all_tables
+PAGES_PER_TASK = 4
+
+
+def clean_table(table: list[list[Optional[str]]]) -> list[list[str]]:
+    return [
+        [cell.strip() if cell else "" for cell in row]
+        for row in table
+    ]
+
+
+def open_pdf(source: Union[str, bytes]):
+    """Open a PDF with pdfplumber from a path or from in-memory bytes."""
+    import pdfplumber
+
+    return pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+
+def pymupdf_tables(page: "fitz.Page") -> list[list[list[str]]]:
+    """Tables on one page from PyMuPDF's table finder; a page it fails on has none."""
+    try:
+        return [clean_table(table.extract()) for table in page.find_tables().tables]
+    except Exception as e:
+        logging.debug(f"Table detection failed on page {page.number + 1}: {e}")
+        return []
+
+
+@contextmanager
+def open_page_tables(source: Union[str, bytes], detector: str = "pdfplumber"):
+    """Open a PDF and give (page_count, tables_of(page_number)) for "pdfplumber" or "pymupdf" tables."""
+    if detector == "pymupdf":
+        import fitz
+
+        doc = fitz.open(stream=source, filetype="pdf") if isinstance(source, bytes) else fitz.open(source)
+        try:
+            yield doc.page_count, lambda i: pymupdf_tables(doc[i])
+        finally:
+            doc.close()
+        return
+
+    with open_pdf(source) as pdf:
+        yield len(pdf.pages), lambda i: [clean_table(table) for table in pdf.pages[i].extract_tables()]
+
+
+def count_pages(source: Union[str, bytes], detector: str = "pdfplumber") -> int:
+    with open_page_tables(source, detector) as (page_count, _):
+        return page_count
+
+
+# The PDF a worker process extracts from, sent once when the worker starts
+_worker_source: Union[str, bytes, None] = None
+
+
+def init_worker(source: Union[str, bytes]) -> None:
+    global _worker_source
+    _worker_source = source
+
+
+def extract_pages(page_numbers: list[int], detector: str = "pdfplumber") -> list[list[list[list[str]]]]:
+    """Extract tables for the given pages of the worker's PDF. Runs inside worker processes."""
+    with open_page_tables(_worker_source, detector) as (page_count, tables_of):
+        return [tables_of(i) for i in page_numbers if i < page_count]
+
+
+def pool_context(detector: str):
+    """
+    Worker processes for PyMuPDF are started fresh rather than forked, since
+    a fork can copy MuPDF's state halfway through a call on another thread.
+    """
+    if detector != "pymupdf":
+        return None
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def iter_page_tables(
+    source: Union[str, bytes],
+    workers: int = 1,
+    pages: Optional[Iterable[int]] = None,
+    detector: str = "pdfplumber",
+) -> Iterator[tuple[int, list[list[list[str]]]]]:
+    """
+    Yield (page_number, tables) for every page (or only `pages`), in page order.
+
+    With workers > 1 pages are sharded across a process pool; only a few
+    shards are in flight at once, and closing the generator early cancels
+    the rest. Each worker receives the PDF once, when it starts, and only
+    page numbers after that.
+    """
+    if workers <= 1:
+        with open_page_tables(source, detector) as (page_count, tables_of):
+            for i in range(page_count) if pages is None else sorted(pages):
+                yield i, tables_of(i)
+        return
+
+    numbers = list(range(count_pages(source, detector))) if pages is None else sorted(pages)
+    shards = [numbers[start:start + PAGES_PER_TASK] for start in range(0, len(numbers), PAGES_PER_TASK)]
+    executor = ProcessPoolExecutor(
+        max_workers=min(workers, len(shards)) or 1,
+        mp_context=pool_context(detector),
+        initializer=init_worker,
+        initargs=(source,),
+    )
+    in_flight = []
+    next_shard = 0
+
+    try:
+        while in_flight or next_shard < len(shards):
+            while next_shard < len(shards) and len(in_flight) < workers * 2:
+                shard = shards[next_shard]
+                in_flight.append((shard, executor.submit(extract_pages, shard, detector)))
+                next_shard += 1
+
+            shard, future = in_flight.pop(0)
+            yield from zip(shard, future.result())
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def has_allergen_header(table: list[list[str]]) -> bool:
+    return bool(table) and find_header(table) is not None
+
+
+def iter_allergen_pages(
+    pages: Iterable[tuple[int, list[list[list[str]]]]],
+    stop_after_allergen_tables: bool = False,
+    trailing_pages: int = 2,
+) -> Iterator[tuple[int, list[list[list[str]]]]]:
+    """
+    Pass (page_number, tables) pairs through.
+
+    With stop_after_allergen_tables, iteration stops once allergen tables
+    have been seen and the next `trailing_pages` pages contain neither an
+    allergen header nor a continuation of the last allergen table.
+    """
+    seen_allergen_table = False
+    allergen_width = None
+    pages_without_allergens = 0
+
+    for page_number, tables in pages:
+        yield page_number, tables
+
+        if not stop_after_allergen_tables:
+            continue
+
+        page_has_allergens = False
+        for table in tables:
+            if has_allergen_header(table):
+                page_has_allergens = True
+                allergen_width = len(table[0])
+            elif allergen_width and table and len(table[0]) == allergen_width:
+                page_has_allergens = True  # continuation of the previous page's table
+
+        if page_has_allergens:
+            seen_allergen_table = True
+            pages_without_allergens = 0
+        elif seen_allergen_table:
+            pages_without_allergens += 1
+            if pages_without_allergens >= trailing_pages:
+                logging.info(f"⏭️ Allergen tables ended; skipping pages after {page_number + 1}.")
+                return
+
+
+def extract_tables_from_pdf(
+    source: Union[str, bytes],
+    workers: int = 1,
+    stop_after_allergen_tables: bool = False,
+    trailing_pages: int = 2,
+) -> list[list[list[str]]]:
+    """Extracts all tables from every page as lists of rows, using pdfplumber."""
+    pages = iter_page_tables(source, workers=workers)
+    try:
+        return [
+            table
+            for _, tables in iter_allergen_pages(pages, stop_after_allergen_tables, trailing_pages)
+            for table in tables
+        ]
+    finally:
+        pages.close()
@@ -0,0 +1,276 @@
+# food_lens/refresh.py
+
+import time
+import logging
+import threading
+from dataclasses import asdict, dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from food_lens.cache import BaseCache, get_default_cache, query_key, ANALYSIS_TTL
+from food_lens.config import get_settings
+from food_lens.events import ChangesEvent, ResultEvent
+from food_lens.http_client import check_modified
+from food_lens.instrumentation import span, metrics, in_current_context
+
+# A tracked query is forgotten once nobody has asked for it for this long; refreshes do not count
+TRACKED_TTL = ANALYSIS_TTL
+# Most refreshes the background loop starts per pass
+MAX_PER_PASS = 20
+
+
+@dataclass
+class TrackedQuery:
+    """An analyzed restaurant and allergen set: its guide, last result, and when the guide was last validated."""
+    restaurant: str
+    allergens: list[str]
+    url: str
+    result: tuple[list[str], list[str]]
+    validated_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    hits: int = 0
+    # When someone last asked for it (a lookup or an analysis), as opposed to when it was refreshed
+    last_requested_at: float = 0.0
+
+
+class RefreshScheduler:
+    """
+    Stale-while-revalidate for analyzed restaurants. Each analysis is
+    tracked with its guide's URL and when that URL was last validated. A
+    tracked query is answered from its last result at once; when that is
+    older than `interval`, a refresh starts in the background. A refresh
+    asks the server whether the guide changed (conditional HEAD) and only
+    runs the pipeline again if it did.
+
+    start() also runs a loop refreshing due queries before anyone asks,
+    most queried first, so popular restaurants are rarely served stale.
+    """
+
+    def __init__(self, cache: Optional[BaseCache] = None, interval: Optional[float] = None, workers: Optional[int] = None):
+        settings = get_settings()
+        self.cache = cache or get_default_cache()
+        self.interval = settings.refresh_interval if interval is None else interval
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or settings.refresh_workers, thread_name_prefix="foodlens-refresh"
+        )
+        self.tracked: dict[str, TrackedQuery] = {}
+        self.refreshing: set[str] = set()
+        self.lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self, key: str) -> Optional[TrackedQuery]:
+        with self.lock:
+            query = self.tracked.get(key)
+        if query is None:
+            # Tracked by an earlier process sharing the cache
+            data = self.cache.get("refresh", key)
+            if data is None:
+                return None
+            with self.lock:
+                query = self.tracked.setdefault(key, TrackedQuery(**data))
+        if self.is_expired(query):
+            self.forget(key)
+            return None
+        return query
+
+    def save(self, key: str, query: TrackedQuery) -> None:
+        """Store a query until TRACKED_TTL after it was last requested, however recently it was refreshed."""
+        remaining = TRACKED_TTL - (time.time() - query.last_requested_at)
+        if remaining <= 0:
+            self.forget(key)
+            return
+        self.cache.set("refresh", key, asdict(query), ttl=remaining)
+
+    def forget(self, key: str) -> None:
+        with self.lock:
+            forgotten = self.tracked.pop(key, None)
+        self.cache.delete("refresh", key)
+        if forgotten is not None:
+            metrics.counter("refresh.forgotten").inc()
+            logging.debug(f"Stopped refreshing {forgotten.restaurant}; nobody asked for it in {TRACKED_TTL} s.")
+
+    def is_due(self, query: TrackedQuery, now: Optional[float] = None) -> bool:
+        return (now or time.time()) - query.validated_at >= self.interval
+
+    def is_expired(self, query: TrackedQuery, now: Optional[float] = None) -> bool:
+        return (now or time.time()) - query.last_requested_at >= TRACKED_TTL
+
+    def lookup(self, restaurant: str, allergens: list[str]) -> Optional[TrackedQuery]:
+        """The last known result of a query, or None if it is not tracked. Starts a refresh when one is due."""
+        key = query_key(restaurant, allergens)
+        query = self.load(key)
+        if query is None:
+            return None
+        with self.lock:
+            query.hits += 1
+            query.last_requested_at = time.time()
+        self.save(key, query)
+        stale = self.is_due(query)
+        metrics.counter("refresh.served_stale" if stale else "refresh.served_fresh").inc()
+        if stale:
+            self.submit(key)
+        return query
+
+    def record(
+        self,
+        restaurant: str,
+        allergens: list[str],
+        url: str,
+        result: tuple[list[str], list[str]],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        requested: bool = True,
+    ) -> None:
+        """
+        Track a fresh analysis of `url`, keeping the query's popularity.
+        `requested` is False for a background refresh, which leaves the time
+        the query was last requested, and so how long it is kept, unchanged.
+        """
+        key = query_key(restaurant, allergens)
+        now = time.time()
+        with self.lock:
+            previous = self.tracked.get(key)
+            query = TrackedQuery(
+                restaurant, list(allergens), url, result, now, etag, last_modified,
+                hits=previous.hits if previous else 0,
+                last_requested_at=now if requested or previous is None else previous.last_requested_at,
+            )
+            self.tracked[key] = query
+        self.save(key, query)
+
+    def submit(self, key: str) -> bool:
+        """Start refreshing a query unless it already is. Returns whether a refresh was started."""
+        with self.lock:
+            if key in self.refreshing:
+                return False
+            self.refreshing.add(key)
+        try:
+            self.executor.submit(in_current_context(self.refresh), key)
+        except RuntimeError:  # shut down
+            with self.lock:
+                self.refreshing.discard(key)
+            return False
+        return True
+
+    def refresh(self, key: str) -> bool:
+        """Revalidate one query's guide and analyze it again if it changed. Returns whether it changed."""
+        try:
+            query = self.load(key)
+            if query is None:
+                return False
+            with span("refresh", restaurant=query.restaurant, url=query.url) as refresh:
+                check = check_modified(query.url, query.etag, query.last_modified)
+                refresh.set(modified=check["modified"])
+                if not check["modified"]:
+                    metrics.counter("refresh.unchanged").inc()
+                    query.validated_at = time.time()
+                    self.save(key, query)
+                    return False
+
+                metrics.counter("refresh.changed").inc()
+                logging.info(f"🔄 Refreshing the {query.restaurant.title()} analysis; its guide may have changed.")
+                result = self.reanalyze(query)
+                if result is None:
+                    raise RuntimeError("the analysis found no result")
+                self.record(
+                    query.restaurant, query.allergens, query.url, result, check["etag"], check["last_modified"],
+                    requested=False,
+                )
+                return True
+        except Exception as e:
+            # The last result keeps being served, and the next lookup or pass tries again
+            metrics.counter("refresh.errors").inc()
+            logging.warning(f"⚠️ Could not refresh {key}: {e}")
+            return False
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def reanalyze(self, query: TrackedQuery) -> Optional[tuple[list[str], list[str]]]:
+        from food_lens.agent import expire_download, run_analysis
+
+        # Make the download check the server again instead of trusting the stored copy
+        expire_download(self.cache, query.url)
+        result = None
+        for event in run_analysis(query.restaurant, query.allergens, self.cache, fresh=True):
+            if isinstance(event, ChangesEvent):
+                logging.info(
+                    f"🔄 {query.restaurant.title()}: {len(event.became_unsafe)} items became unsafe, "
+                    f"{len(event.became_safe)} became safe."
+                )
+            elif isinstance(event, ResultEvent):
+                result = event.result
+        return result
+
+    def refresh_due(self, now: Optional[float] = None) -> int:
+        """
+        Forget queries nobody asked for within TRACKED_TTL, and start
+        refreshes for due ones, most queried first. Returns how many were started.
+        """
+        with self.lock:
+            queries = list(self.tracked.items())
+        for key, query in queries:
+            if self.is_expired(query, now):
+                self.forget(key)
+        queries = [(key, query) for key, query in queries if not self.is_expired(query, now)]
+        due = sorted((pair for pair in queries if self.is_due(pair[1], now)), key=lambda pair: -pair[1].hits)
+        return sum(self.submit(key) for key, _ in due[:MAX_PER_PASS])
+
+    def start(self, tick: Optional[float] = None) -> None:
+        """Refresh due queries every `tick` seconds (at most a minute) on a background thread."""
+        tick = tick or min(60.0, max(1.0, self.interval))
+
+        def run():
+            while not self._stopped.wait(tick):
+                self.refresh_due()
+
+        self._thread = threading.Thread(target=run, name="foodlens-refresh-loop", daemon=True)
+        self._thread.start()
+        logging.info(f"🔄 Refreshing analyzed restaurants every {self.interval:.0f} s.")
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def wait(self, timeout: float = 30) -> bool:
+        """Block until no refresh is running; returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.refreshing:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def status(self) -> dict:
+        with self.lock:
+            queries = list(self.tracked.values())
+            refreshing = len(self.refreshing)
+        return {
+            "tracked": len(queries),
+            "due": sum(1 for query in queries if self.is_due(query)),
+            "refreshing": refreshing,
+            "interval": self.interval,
+        }
+
+
+_default_scheduler: Optional[RefreshScheduler] = None
+_default_lock = threading.Lock()
+
+
+def get_refresh_scheduler() -> Optional[RefreshScheduler]:
+    """The installed scheduler, else a process-wide one when FOODLENS_REFRESH is on, else None."""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None and get_settings().refresh:
+            _default_scheduler = RefreshScheduler()
+        return _default_scheduler
+
+
+def set_refresh_scheduler(scheduler: Optional[RefreshScheduler]) -> Optional[RefreshScheduler]:
+    """Install a scheduler (e.g. with the service's cache), or None to reset. Returns the previous one."""
+    global _default_scheduler
+    with _default_lock:
+        previous, _default_scheduler = _default_scheduler, scheduler
+        return previous
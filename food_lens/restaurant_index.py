@@ -0,0 +1,400 @@
+# food_lens/restaurant_index.py
+
+import os
+import re
+import json
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from typing import Iterable, Optional
+from food_lens.config import get_settings
+
+# Index file layout (little-endian):
+#   header   magic, version, record count, trigram count, then the byte offset of each section
+#   keys     u64[records] sorted name-key hashes, u32[records] record id for each
+#   grams    u32[trigrams] sorted trigram hashes, u32[trigrams] record id for each
+#   sizes    u16[records] trigram count per record
+#   offsets  u32[records + 1] start of each record in the records section
+#   records  one UTF-8 JSON object per record
+MAGIC = b"FLIX"
+# Version 2: name keys keep words such as "kitchen" and "grill"
+VERSION = 2
+HEADER = struct.Struct("<4sIII6Q")
+
+# Minimum trigram similarity (Dice coefficient) for a name to be suggested.
+# Suggestions are never resolved automatically: a wrong match would show
+# another restaurant's guide.
+FUZZY_THRESHOLD = 0.7
+
+# Words that never tell one restaurant from another. Words like "kitchen" or
+# "grill" stay: "Burger Kitchen" is not "BurgerFi".
+STOP_WORDS = {"the", "restaurant", "restaurants", "inc", "co"}
+# An unchanged restaurant is not written back to the index more often than this
+REWRITE_AFTER = 24 * 3600
+# Journaled restaurants are folded into the index file once there are this many
+COMPACT_EVERY = 256
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers in one process are still serialized by the thread lock
+    fcntl = None
+
+
+def normalize_name(name: str) -> str:
+    """'Chick-fil-A®' -> 'chick fil a'; accents, punctuation and case are dropped."""
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    text = text.replace("'", "").replace("&", " and ")
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+
+def name_key(name: str) -> str:
+    """Spacing-insensitive key: 'Chick-fil-A', 'chick fil a' and 'chickfila' share one."""
+    words = normalize_name(name).split()
+    significant = [word for word in words if word not in STOP_WORDS] or words
+    return "".join(significant)
+
+
+def trigrams(key: str) -> set[str]:
+    padded = f"$${key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def gram_hash(gram: str) -> int:
+    return zlib.crc32(gram.encode("utf-8"))
+
+
+def key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def build_index(records: Iterable[dict]) -> bytes:
+    """Serialize records ({"name", "key", ...}) into the index file format."""
+    records = list(records)
+    blobs = [json.dumps(record, separators=(",", ":")).encode("utf-8") for record in records]
+
+    keys = sorted((key_hash(record["key"]), i) for i, record in enumerate(records))
+    grams = sorted(
+        (gram_hash(gram), i) for i, record in enumerate(records) for gram in trigrams(record["key"])
+    )
+    sizes = [min(len(trigrams(record["key"])), 0xFFFF) for record in records]
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+
+    n, g = len(records), len(grams)
+    sections = [
+        struct.pack(f"<{n}Q", *(h for h, _ in keys)),
+        struct.pack(f"<{n}I", *(i for _, i in keys)),
+        struct.pack(f"<{g}I", *(h for h, _ in grams)),
+        struct.pack(f"<{g}I", *(i for _, i in grams)),
+        struct.pack(f"<{n}H", *sizes),
+        struct.pack(f"<{n + 1}I", *offsets),
+    ]
+    starts, position = [], HEADER.size
+    for section in sections:
+        # Keep every section 8-byte aligned so memoryview.cast works on it
+        position += -position % 8
+        starts.append(position)
+        position += len(section)
+
+    out = bytearray(HEADER.pack(MAGIC, VERSION, n, g, *starts))
+    for start, section in zip(starts, sections):
+        out.extend(b"\0" * (start - len(out)))
+        out.extend(section)
+    out.extend(b"".join(blobs))
+    return bytes(out)
+
+
+class RestaurantIndex:
+    """
+    Read-only view of an index file, memory-mapped so opening it costs no
+    parsing. Exact lookups binary-search the sorted key hashes; fuzzy ones
+    count shared trigrams through the sorted trigram table.
+    """
+
+    def __init__(self, data):
+        self._data = data
+        view = memoryview(data)
+        magic, version, self.count, gram_count, *starts = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a FoodLens restaurant index")
+        n, g = self.count, gram_count
+        key_start, key_ids_start, gram_start, gram_ids_start, sizes_start, offsets_start = starts
+        self._key_hashes = view[key_start:key_start + 8 * n].cast("Q")
+        self._key_ids = view[key_ids_start:key_ids_start + 4 * n].cast("I")
+        self._gram_hashes = view[gram_start:gram_start + 4 * g].cast("I")
+        self._gram_ids = view[gram_ids_start:gram_ids_start + 4 * g].cast("I")
+        self._sizes = view[sizes_start:sizes_start + 2 * n].cast("H")
+        self._offsets = view[offsets_start:offsets_start + 4 * (n + 1)].cast("I")
+        self._records_start = offsets_start + 4 * (n + 1)
+
+    @classmethod
+    def open(cls, path: str) -> "RestaurantIndex":
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls(build_index([]))
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def record(self, i: int) -> dict:
+        start = self._records_start + self._offsets[i]
+        end = self._records_start + self._offsets[i + 1]
+        return json.loads(bytes(self._data[start:end]))
+
+    def records(self) -> list[dict]:
+        return [self.record(i) for i in range(self.count)]
+
+    def get(self, name: str) -> Optional[dict]:
+        """Exact match on the normalized name key."""
+        key = name_key(name)
+        if not key:
+            return None
+        h = key_hash(key)
+        lo = bisect_left(self._key_hashes, h)
+        for position in range(lo, bisect_right(self._key_hashes, h, lo)):
+            record = self.record(self._key_ids[position])
+            if record["key"] == key:
+                return record
+        return None
+
+    def search(self, name: str, limit: int = 5, threshold: float = FUZZY_THRESHOLD) -> list[tuple[float, dict]]:
+        """Fuzzy matches as (similarity, record), best first."""
+        key = name_key(name)
+        if not key:
+            return []
+        query = trigrams(key)
+        shared: dict[int, int] = {}
+        for gram in query:
+            h = gram_hash(gram)
+            lo = bisect_left(self._gram_hashes, h)
+            for position in range(lo, bisect_right(self._gram_hashes, h, lo)):
+                record_id = self._gram_ids[position]
+                shared[record_id] = shared.get(record_id, 0) + 1
+
+        scored = sorted(
+            ((2 * count / (len(query) + self._sizes[record_id]), record_id) for record_id, count in shared.items()),
+            reverse=True,
+        )
+        numbers = re.findall(r"\d+", key)
+        matches = []
+        for score, record_id in scored:
+            if score < threshold or len(matches) == limit:
+                break
+            record = self.record(record_id)
+            # "Store 12" is not "Store 1", however similar the rest of the name
+            if re.findall(r"\d+", record["key"]) == numbers:
+                matches.append((round(score, 3), record))
+        return matches
+
+    def lookup(self, name: str) -> Optional[dict]:
+        """
+        The indexed restaurant `name` refers to. Only exact key matches count
+        ("chick fil a" for "Chick-fil-A"); similar names, which may be
+        other chains, are left to suggest().
+        """
+        return self.get(name)
+
+    def suggest(self, name: str, limit: int = 3) -> list[str]:
+        """Names of indexed restaurants similar to `name`, best first, for "did you mean" prompts."""
+        return [record["name"] for _, record in self.search(name, limit=limit) if record["key"] != name_key(name)]
+
+
+class RestaurantIndexStore:
+    """
+    The on-disk index shared by the CLI, web UI and service. Lookups use the
+    memory-mapped file. Recording a restaurant appends one line to a journal
+    next to it ({path}.log), read back incrementally by every process; once
+    it holds COMPACT_EVERY updates it is folded into a new index file,
+    replaced atomically, so a long batch does not rewrite the whole index
+    per restaurant. Writers in other processes are kept out with a lock
+    file, so none of them drops another's record.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.journal_path = f"{path}.log"
+        self._lock = threading.Lock()
+        self._main: Optional[RestaurantIndex] = None
+        self._main_version: Optional[tuple] = None
+        self._merged: Optional[tuple[tuple, RestaurantIndex]] = None
+        self._journal: dict[str, dict] = {}
+        self._journal_lines = 0
+        self._journal_position: tuple = (None, 0)  # (inode, bytes read)
+
+    def refresh(self) -> tuple[RestaurantIndex, dict[str, dict]]:
+        """(the index file, the latest journaled record per key), as changed by any process."""
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self) -> tuple[RestaurantIndex, dict[str, dict]]:
+        version = file_version(self.path)
+        if self._main is None or version != self._main_version:
+            self._main = self.read() if version else RestaurantIndex(build_index([]))
+            self._main_version = version
+            self._journal_position = (None, 0)  # compacted: the journal was replaced too
+        self._read_journal_tail()
+        return self._main, self._journal
+
+    def _read_journal_tail(self) -> None:
+        """Read the lines appended to the journal since the last call; a replaced journal is read from the start."""
+        try:
+            f = open(self.journal_path, "rb")
+        except FileNotFoundError:
+            self._journal, self._journal_lines, self._journal_position = {}, 0, (None, 0)
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            inode, position = self._journal_position
+            if stat.st_ino != inode or stat.st_size < position:
+                self._journal, self._journal_lines, position = {}, 0, 0
+            f.seek(position)
+            data = f.read()
+        # A line still being written is picked up on the next read
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a torn line from an interrupted write
+            self._journal[record["key"]] = record
+            self._journal_lines += 1
+        self._journal_position = (stat.st_ino, position + end)
+
+    def index(self) -> RestaurantIndex:
+        """Every record, journaled ones included, as one index."""
+        with self._lock:
+            main, journal = self._refresh()
+            if not journal:
+                return main
+            version = (self._main_version, self._journal_position)
+            if self._merged is None or self._merged[0] != version:
+                records = {record["key"]: record for record in main.records()}
+                records.update(journal)
+                self._merged = version, RestaurantIndex(build_index(records.values()))
+            return self._merged[1]
+
+    def read(self) -> RestaurantIndex:
+        """The index file, or an empty index when it is unreadable or from an older version (it is rebuilt as restaurants are analyzed)."""
+        try:
+            return RestaurantIndex.open(self.path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"⚠️ Restaurant index unreadable ({e}); starting a new one.")
+            return RestaurantIndex(build_index([]))
+
+    def lookup(self, name: str) -> Optional[dict]:
+        main, journal = self.refresh()
+        return journal.get(name_key(name)) or main.lookup(name)
+
+    def suggest(self, name: str, limit: int = 3) -> list[str]:
+        main, journal = self.refresh()
+        names = [*suggest_among(journal.values(), name, limit), *main.suggest(name, limit)]
+        return list(dict.fromkeys(names))[:limit]
+
+    @contextmanager
+    def write_lock(self):
+        """Hold the index for a read-modify-write, against other threads and other processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(f"{self.path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def record(
+        self,
+        name: str,
+        pdf_url: Optional[str] = None,
+        html_url: Optional[str] = None,
+        items: Iterable[str] = (),
+    ) -> dict:
+        """Add or update a restaurant; known items are merged with the new ones."""
+        key = name_key(name)
+        if not key:
+            raise ValueError(f"Cannot index restaurant name: {name!r}")
+        with self.write_lock():
+            main, journal = self._refresh()
+            existing = journal.get(key) or main.get(name) or {}
+            record = {
+                "name": existing.get("name", name.strip()),
+                "key": key,
+                "pdf_url": pdf_url or existing.get("pdf_url"),
+                "html_url": html_url or existing.get("html_url"),
+                "items": list(dict.fromkeys([*existing.get("items", []), *items])),
+                "updated_at": time.time(),
+            }
+            unchanged = all(record[field] == existing.get(field) for field in ("pdf_url", "html_url", "items"))
+            if unchanged and record["updated_at"] - existing.get("updated_at", 0) < REWRITE_AFTER:
+                return existing
+
+            if self._journal_lines + 1 >= COMPACT_EVERY:
+                self.compact(main, {**journal, key: record})
+            else:
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        return record
+
+    def compact(self, main: RestaurantIndex, journal: dict[str, dict]) -> None:
+        """Write main's records and the journaled ones as a new index file, and start an empty journal. Call with write_lock held."""
+        records = {record["key"]: record for record in main.records()}
+        records.update(journal)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(build_index(records.values()))
+        os.replace(tmp_path, self.path)
+        # A crash before the journal is replaced only folds its records in again next time
+        open(tmp_path, "wb").close()
+        os.replace(tmp_path, self.journal_path)
+
+
+def suggest_among(records: Iterable[dict], name: str, limit: int = 3) -> list[str]:
+    """RestaurantIndex.suggest over a few records not in an index file (the journal)."""
+    key = name_key(name)
+    if not key:
+        return []
+    query = trigrams(key)
+    numbers = re.findall(r"\d+", key)
+    scored = []
+    for record in records:
+        grams = trigrams(record["key"])
+        score = 2 * len(query & grams) / (len(query) + len(grams))
+        if score >= FUZZY_THRESHOLD and record["key"] != key and re.findall(r"\d+", record["key"]) == numbers:
+            scored.append((score, record["name"]))
+    return [name for _, name in sorted(scored, reverse=True)[:limit]]
+
+
+def file_version(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+_default_store: Optional[RestaurantIndexStore] = None
+_default_lock = threading.Lock()
+
+
+def get_restaurant_index() -> Optional[RestaurantIndexStore]:
+    """The process-wide index at FOODLENS_INDEX_PATH, or None when disabled (FOODLENS_INDEX=off)."""
+    global _default_store
+    path = get_settings().restaurant_index_path
+    if not path:
+        return None
+    with _default_lock:
+        if _default_store is None or _default_store.path != path:
+            _default_store = RestaurantIndexStore(path)
+        return _default_store
@@ -0,0 +1,410 @@
+# food_lens/service.py
+
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+from food_lens.agent import iter_analyze_restaurant_allergens
+from food_lens.allergen_matrix import parse_allergens
+from food_lens.batch import BatchPipeline, STAGE_LIMITS
+from food_lens.cache import BaseCache, get_default_cache, query_key
+from food_lens.config import get_context, get_settings
+from food_lens.events import ResultEvent, event_to_dict
+from food_lens.http_client import get_session
+from food_lens.instrumentation import metrics
+from food_lens.logging_config import setup_logging
+from food_lens.refresh import RefreshScheduler, set_refresh_scheduler
+
+DEFAULT_PORT = 8765
+# Finished jobs kept for status lookups before the oldest are dropped
+MAX_FINISHED_JOBS = 1000
+# Longest a client may wait on one GET /jobs/<id> for new events
+MAX_WAIT_SECONDS = 30
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    """One queued analysis or batch run, with the events it has produced so far."""
+
+    def __init__(self, kind: str, params: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.events: list[dict] = []
+        self.result = None
+        self.error: Optional[str] = None
+        self.requests = 1  # callers sharing this job through coalescing
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.waiters: list[asyncio.Future] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in {"done", "failed"}
+
+    def wake(self) -> None:
+        """Release clients long-polling for new events. Runs on the event loop."""
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.waiters.clear()
+
+    def to_dict(self, since: int = 0) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            **self.params,
+            "events": self.events[since:],
+            "next": len(self.events),
+            "result": self.result,
+            "error": self.error,
+            "requests": self.requests,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Runs analyses on a bounded worker pool shared by every client.
+
+    Requests for a restaurant and allergen set that is already queued or
+    running join the existing job instead of starting another pipeline run.
+    Workers report progress back to the event loop, which wakes clients
+    waiting on the job.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        cache: Optional[BaseCache] = None,
+        stage_limits: Optional[dict] = None,
+    ):
+        settings = get_settings()
+        self.workers = workers or settings.service_workers
+        self.max_queue = max_queue or settings.service_max_queue
+        self.cache = cache or get_default_cache()
+        self.stage_limits = stage_limits
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="foodlens-job")
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self.inflight: dict[str, Job] = {}
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.scheduler: Optional[RefreshScheduler] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        if get_settings().refresh:
+            # Analyses answer from, and keep refreshing, results tracked in the service's cache
+            self.scheduler = RefreshScheduler(self.cache)
+            set_refresh_scheduler(self.scheduler)
+            self.scheduler.start()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            set_refresh_scheduler(None)
+
+    def warm_up(self) -> None:
+        """Create shared clients and import the PDF/HTML/LLM libraries before the first request."""
+        get_session()
+        try:
+            get_context().openai_client
+        except EnvironmentError as e:
+            logging.warning(f"⚠️ {e}; LLM fallback will fail until it is set.")
+        import fitz  # noqa: F401
+        import pdfplumber  # noqa: F401
+        try:
+            from lxml import etree  # noqa: F401
+        except ImportError:
+            pass  # HTML is parsed with html.parser instead
+        logging.info("🔥 Service clients warmed up.")
+
+    def pending(self) -> int:
+        return sum(1 for job in self.jobs.values() if not job.finished)
+
+    def submit_analysis(self, restaurant: str, allergens: list[str]) -> tuple[Job, bool]:
+        """Queue an analysis, or join the identical one in flight. Returns (job, coalesced)."""
+        key = query_key(restaurant, allergens)
+        with self.lock:
+            job = self.inflight.get(key)
+            if job is not None:
+                job.requests += 1
+                metrics.counter("service.coalesced").inc()
+                return job, True
+            job = self.add_job("analyze", {"restaurant": restaurant, "allergens": allergens})
+            self.inflight[key] = job
+
+        self.executor.submit(self.run_analysis, job, key)
+        return job, False
+
+    def submit_batch(self, jobs: list[dict]) -> Job:
+        with self.lock:
+            job = self.add_job("batch", {"jobs": len(jobs)})
+        self.executor.submit(self.run_batch, job, jobs)
+        return job
+
+    def add_job(self, kind: str, params: dict) -> Job:
+        """Register a job. Caller holds self.lock."""
+        if self.pending() >= self.max_queue:
+            metrics.counter("service.rejected").inc()
+            raise QueueFullError(f"{self.pending()} jobs pending; try again later")
+        job = Job(kind, params)
+        self.jobs[job.id] = job
+        finished = [job_id for job_id, old in self.jobs.items() if old.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+        metrics.counter(f"service.{kind}").inc()
+        return job
+
+    def publish(self, job: Job, event: Optional[dict] = None) -> None:
+        """Record an event from a worker thread and wake waiting clients."""
+        if event is not None:
+            job.events.append(event)
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(job.wake)
+
+    def run_analysis(self, job: Job, key: str) -> None:
+        job.status, job.started_at = "running", time.time()
+        self.publish(job)
+        try:
+            for event in iter_analyze_restaurant_allergens(
+                job.params["restaurant"], job.params["allergens"], cache=self.cache
+            ):
+                if isinstance(event, ResultEvent):
+                    job.result = event.result
+                self.publish(job, event_to_dict(event))
+            job.status = "done"
+        except Exception as e:
+            logging.error(f"❌ Job {job.id} failed: {e}", exc_info=True)
+            job.status, job.error = "failed", str(e)
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            job.finished_at = time.time()
+            self.publish(job)
+
+    def run_batch(self, job: Job, jobs: list[dict]) -> None:
+        job.status, job.started_at = "running", time.time()
+        self.publish(job)
+        try:
+            pipeline = BatchPipeline(cache=self.cache, stage_limits=self.stage_limits)
+            records = []
+            for i, record in enumerate(pipeline.run(jobs), start=1):
+                records.append(record)
+                self.publish(job, {"type": "record", "current": i, "total": len(jobs), "record": record})
+            job.result = records
+            job.status = "done"
+        except Exception as e:
+            logging.error(f"❌ Batch job {job.id} failed: {e}", exc_info=True)
+            job.status, job.error = "failed", str(e)
+        finally:
+            job.finished_at = time.time()
+            self.publish(job)
+
+    async def wait_for_events(self, job: Job, since: int, timeout: float) -> None:
+        """Return once the job has events after `since`, has finished, or `timeout` passes."""
+        if len(job.events) > since or job.finished or timeout <= 0:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        job.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def status(self) -> dict:
+        with self.lock:
+            jobs = list(self.jobs.values())
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "jobs": counts,
+            "inflight": len(self.inflight),
+            "cache": self.cache.stats.as_dict(),
+            "refresh": self.scheduler.status() if self.scheduler else None,
+            "metrics": metrics.snapshot(),
+        }
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, manager: JobManager):
+        self.manager = manager
+
+    def write_json(self, data: dict, status: int = 200) -> None:
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(data))
+
+    def write_error(self, status_code: int, **kwargs) -> None:
+        message = self._reason
+        if "exc_info" in kwargs and isinstance(kwargs["exc_info"][1], tornado.web.HTTPError):
+            message = kwargs["exc_info"][1].log_message or message
+        self.write_json({"error": message}, status_code)
+
+    def json_body(self) -> dict:
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except json.JSONDecodeError:
+            raise tornado.web.HTTPError(400, "Request body must be JSON")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, "Request body must be a JSON object")
+        return body
+
+    def wait_seconds(self, default: float = 0) -> float:
+        try:
+            wait = float(self.get_argument("wait", default))
+        except ValueError:
+            raise tornado.web.HTTPError(400, "wait must be a number of seconds")
+        return min(max(wait, 0), MAX_WAIT_SECONDS)
+
+
+class AnalyzeHandler(BaseHandler):
+    async def post(self):
+        """Queue an analysis: {"restaurant": "panera", "allergens": ["dairy", "egg"]}."""
+        body = self.json_body()
+        restaurant = (body.get("restaurant") or "").strip()
+        if not restaurant:
+            raise tornado.web.HTTPError(400, "restaurant is required")
+        try:
+            allergens = parse_allergens(body.get("allergens") or "dairy")
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, str(e))
+
+        try:
+            job, coalesced = self.manager.submit_analysis(restaurant, allergens)
+        except QueueFullError as e:
+            raise tornado.web.HTTPError(503, str(e))
+
+        # ?wait=N holds the response until the job finishes (or N seconds pass)
+        wait = self.wait_seconds()
+        deadline = time.monotonic() + wait
+        while not job.finished and time.monotonic() < deadline:
+            await self.manager.wait_for_events(job, len(job.events), deadline - time.monotonic())
+
+        self.write_json({**job.to_dict(), "coalesced": coalesced}, 200 if job.finished else 202)
+
+
+class BatchHandler(BaseHandler):
+    async def post(self):
+        """Queue a batch: {"jobs": [{"restaurant": ..., "allergens": [...]}, ...]}."""
+        body = self.json_body()
+        jobs = []
+        for entry in body.get("jobs") or []:
+            restaurant = (entry.get("restaurant") or "").strip()
+            if not restaurant:
+                continue
+            try:
+                jobs.append({"restaurant": restaurant, "allergens": parse_allergens(entry.get("allergens") or "dairy")})
+            except ValueError as e:
+                raise tornado.web.HTTPError(400, str(e))
+        if not jobs:
+            raise tornado.web.HTTPError(400, "jobs must list at least one restaurant")
+
+        try:
+            job = self.manager.submit_batch(jobs)
+        except QueueFullError as e:
+            raise tornado.web.HTTPError(503, str(e))
+        self.write_json(job.to_dict(), 202)
+
+
+class JobHandler(BaseHandler):
+    async def get(self, job_id: str):
+        """Job state and events after ?since=N; ?wait=S long-polls for new events."""
+        job = self.manager.jobs.get(job_id)
+        if job is None:
+            raise tornado.web.HTTPError(404, f"Unknown job: {job_id}")
+        try:
+            since = max(0, int(self.get_argument("since", 0)))
+        except ValueError:
+            raise tornado.web.HTTPError(400, "since must be an integer")
+
+        await self.manager.wait_for_events(job, since, self.wait_seconds())
+        self.write_json(job.to_dict(since))
+
+
+class StatusHandler(BaseHandler):
+    def get(self):
+        self.write_json(self.manager.status())
+
+
+def make_app(manager: JobManager) -> tornado.web.Application:
+    args = {"manager": manager}
+    return tornado.web.Application([
+        (r"/analyze", AnalyzeHandler, args),
+        (r"/batch", BatchHandler, args),
+        (r"/jobs/([0-9a-f]+)", JobHandler, args),
+        (r"/status", StatusHandler, args),
+    ])
+
+
+async def serve(manager: JobManager, host: str = "127.0.0.1", port: int = DEFAULT_PORT, ready=None) -> None:
+    """Serve until cancelled. `ready(port)` is called once the socket is listening."""
+    manager.start(asyncio.get_running_loop())
+    sockets = bind_sockets(port, host)
+    server = HTTPServer(make_app(manager))
+    server.add_sockets(sockets)
+    bound_port = sockets[0].getsockname()[1]
+    logging.info(f"🚀 FoodLens service listening on http://{host}:{bound_port}")
+    if ready:
+        ready(bound_port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.stop()
+        manager.shutdown()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Run the FoodLens analysis service.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--workers", type=int, default=settings.service_workers,
+                        help=f"Analyses run at once (default: {settings.service_workers})")
+    parser.add_argument("--max-queue", type=int, default=settings.service_max_queue,
+                        help=f"Pending jobs before new ones are refused (default: {settings.service_max_queue})")
+    for stage, limit in STAGE_LIMITS.items():
+        parser.add_argument(f"--{stage}-workers", type=int, default=limit,
+                            help=f"Concurrent {stage} operations in batch jobs (default: {limit})")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose logging")
+    args = parser.parse_args(argv)
+
+    setup_logging(level=logging.DEBUG if args.verbose else logging.INFO)
+    manager = JobManager(
+        workers=args.workers,
+        max_queue=args.max_queue,
+        stage_limits={stage: getattr(args, f"{stage}_workers") for stage in STAGE_LIMITS},
+    )
+    manager.warm_up()
+    try:
+        asyncio.run(serve(manager, args.host, args.port))
+    except KeyboardInterrupt:
+        logging.info("👋 Service stopped.")
+
+
+if __name__ == "__main__":
+    main()
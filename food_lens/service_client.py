@@ -0,0 +1,84 @@
+# food_lens/service_client.py
+
+from typing import Iterator, Optional, Union
+
+from food_lens.allergen_matrix import parse_allergens
+from food_lens.config import get_settings
+from food_lens.events import ResultEvent, event_from_dict
+from food_lens.http_client import get_session
+
+# Seconds each long-poll for new events may wait on the service
+POLL_SECONDS = 10
+
+
+class ServiceClient:
+    """Thin client for a running `food_lens.service`, used by the CLI and web UI."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.session = get_session()
+
+    def request(self, method: str, path: str, **kwargs) -> dict:
+        response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        if not response.ok:
+            try:
+                message = response.json().get("error")
+            except ValueError:
+                message = response.text
+            raise RuntimeError(f"FoodLens service error {response.status_code}: {message}")
+        return response.json()
+
+    def submit(self, restaurant: str, allergens: Union[str, list[str]] = "dairy") -> dict:
+        return self.request("POST", "/analyze", json={"restaurant": restaurant, "allergens": parse_allergens(allergens)})
+
+    def job(self, job_id: str, since: int = 0, wait: float = 0) -> dict:
+        # The read timeout has to outlast the long-poll
+        return self.request("GET", f"/jobs/{job_id}", params={"since": since, "wait": wait}, timeout=(5, wait + 30))
+
+    def iter_analyze_restaurant_allergens(
+        self,
+        restaurant: str,
+        allergen: Union[str, list[str]] = "dairy",
+    ) -> Iterator:
+        """Same events as agent.iter_analyze_restaurant_allergens, produced by the service."""
+        job = self.submit(restaurant, allergen)
+        since = 0
+        while True:
+            job = self.job(job["id"], since=since, wait=POLL_SECONDS)
+            for event in job["events"]:
+                yield event_from_dict(event)
+            since = job["next"]
+            if job["status"] == "failed":
+                raise RuntimeError(f"Analysis failed on the service: {job['error']}")
+            if job["status"] == "done":
+                return
+
+    def analyze_restaurant_allergens(self, restaurant: str, allergen: Union[str, list[str]] = "dairy"):
+        result = None
+        for event in self.iter_analyze_restaurant_allergens(restaurant, allergen):
+            if isinstance(event, ResultEvent):
+                result = event.result
+        return result
+
+    def submit_batch(self, jobs: list[dict]) -> dict:
+        return self.request("POST", "/batch", json={"jobs": jobs})
+
+    def run_batch(self, jobs: list[dict]) -> list[dict]:
+        """Run a batch on the service and return its records once it finishes."""
+        job = self.submit_batch(jobs)
+        since = 0
+        while job["status"] not in {"done", "failed"}:
+            job = self.job(job["id"], since=since, wait=POLL_SECONDS)
+            since = job["next"]
+        if job["status"] == "failed":
+            raise RuntimeError(f"Batch failed on the service: {job['error']}")
+        return job["result"]
+
+    def status(self) -> dict:
+        return self.request("GET", "/status")
+
+
+def get_service_client() -> Optional[ServiceClient]:
+    """A client for the service at FOODLENS_SERVICE_URL, or None to analyze in-process."""
+    service_url = get_settings().service_url
+    return ServiceClient(service_url) if service_url else None
@@ -3,6 +3,7 @@
 from typing import List, Tuple
 
 SAFE_VALUES = {"", "no", "none", "no major allergens present"}
+FULL_ITEM_KEYWORDS = ["salad", "bowl", "soup", "sandwich", "entree", "wrap", "pizza", "mac", "chili"]
 
 def find_allergen_column(headers: List[str], allergen: str) -> int:
     for i, col in enumerate(headers):
@@ -12,13 +13,14 @@ def find_allergen_column(headers: List[str], allergen: str) -> int:
 
 def categorize_item(name: str) -> str:
     name = name.lower()
-    if any(kw in name for kw in [
-        "salad", "bowl", "soup", "sandwich", "entree", "wrap", "pizza", "mac", "chili"
-    ]):
+    if any(kw in name for kw in FULL_ITEM_KEYWORDS):
         return "full"
     return "sub"
 
 def extract_safe_items_from_tables(tables: List[List[List[str]]], allergen: str = "milk") -> Tuple[List[str], List[str]]:
+    from food_lens.table_normalizer import normalize_tables
+
+    tables = normalize_tables(tables)
     full_items, sub_items = [], []
 
     for table in tables:
@@ -46,3 +48,4 @@ def extract_safe_items_from_tables(tables: List[List[List[str]]], allergen: str
                     sub_items.append(name)
 
     return list(dict.fromkeys(full_items)), list(dict.fromkeys(sub_items))
+
@@ -0,0 +1,177 @@
+# food_lens/speculative.py
+
+import math
+import time
+import queue
+import logging
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Generator, Optional, TypeVar
+from food_lens.events import ProgressEvent
+from food_lens.instrumentation import span, metrics, in_current_context
+
+RACE_POLICIES = ("latency", "balanced", "cost")
+
+T = TypeVar("T")
+
+
+@dataclass
+class Candidate:
+    """What one strategy found: the result, and which allergens its source actually reports on."""
+    url: str
+    sha256: Optional[str]
+    result: tuple[list[str], list[str]]
+    covered: set[str] = field(default_factory=set)
+    cached: bool = False
+
+    @property
+    def item_count(self) -> int:
+        return len(self.result[0]) + len(self.result[1])
+
+
+@dataclass
+class Strategy:
+    """One way to answer a query; `run` returns an event generator whose return value is a Candidate."""
+    name: str
+    run: Callable[[], Generator]
+    # Costly strategies send LLM requests; cheap ones only download and parse
+    costly: bool = False
+
+
+def shared(fetch: Callable[[], T]) -> Callable[[], T]:
+    """
+    `fetch` run at most once, for strategies racing on the same source: the
+    first caller runs it, and the others wait for and share its result (or
+    its exception).
+    """
+    future: Future = Future()
+    lock = threading.Lock()
+    started = False
+
+    def call() -> T:
+        nonlocal started
+        with lock:
+            first, started = not started, True
+        if first:
+            try:
+                future.set_result(fetch())
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    return call
+
+
+def passes_quality(candidate: Candidate, allergens: list[str], min_items: int) -> bool:
+    """Enough items, from a source that reports on every queried allergen."""
+    if candidate.cached:
+        return True
+    return candidate.item_count >= min_items and set(allergens) <= candidate.covered
+
+
+def start_delay(strategy: Strategy, policy: str, hedge_ms: float) -> float:
+    """
+    Seconds after the race starts before `strategy` may start. "latency"
+    starts everything at once; "balanced" gives cheap strategies a head
+    start of hedge_ms; "cost" starts a costly strategy only once the cheap
+    ones have failed.
+    """
+    if not strategy.costly or policy == "latency":
+        return 0.0
+    if policy == "balanced":
+        return hedge_ms / 1000
+    return math.inf
+
+
+def run_strategy(strategy: Strategy, events: queue.Queue, cancel: threading.Event) -> None:
+    """Drive one strategy on a worker thread, stopping between steps once cancelled."""
+    steps = strategy.run()
+    try:
+        while True:
+            if cancel.is_set():
+                steps.close()
+                events.put((strategy.name, "cancelled", None))
+                return
+            try:
+                event = next(steps)
+            except StopIteration as stop:
+                events.put((strategy.name, "done", stop.value))
+                return
+            events.put((strategy.name, "event", event))
+    except Exception as e:
+        events.put((strategy.name, "error", e))
+
+
+def iter_race(
+    strategies: list[Strategy],
+    accept: Callable[[Candidate], bool],
+    policy: str = "balanced",
+    hedge_ms: float = 1500,
+):
+    """
+    Run strategies concurrently, according to `policy`, and return
+    (name, candidate) for the first candidate that `accept`s; the others
+    are cancelled. A strategy is also started early when nothing else is
+    running. If none is accepted, the candidate with the most items is
+    returned, or None when every strategy failed. Progress events of
+    running strategies are passed through.
+    """
+    if policy not in RACE_POLICIES:
+        raise ValueError(f"Unknown race policy: {policy} (expected one of {', '.join(RACE_POLICIES)})")
+
+    events: queue.Queue = queue.Queue()
+    cancel = threading.Event()
+    delays = {strategy.name: start_delay(strategy, policy, hedge_ms) for strategy in strategies}
+    pending = list(strategies)
+    running: set[str] = set()
+    finished: list[tuple[str, Candidate]] = []
+    executor = ThreadPoolExecutor(max_workers=max(1, len(strategies)))
+    started = time.monotonic()
+
+    with span("race", strategies=[strategy.name for strategy in strategies], policy=policy) as race:
+        try:
+            while pending or running:
+                elapsed = time.monotonic() - started
+                for strategy in list(pending):
+                    if delays[strategy.name] <= elapsed or not running:
+                        pending.remove(strategy)
+                        running.add(strategy.name)
+                        logging.info(f"🏁 Starting {strategy.name} after {elapsed * 1000:.0f} ms")
+                        executor.submit(in_current_context(run_strategy), strategy, events, cancel)
+                    else:
+                        break  # strategies start in the order given
+
+                waits = [delays[strategy.name] - elapsed for strategy in pending if delays[strategy.name] < math.inf]
+                try:
+                    name, kind, value = events.get(timeout=max(0.0, min(waits)) if waits else None)
+                except queue.Empty:
+                    continue
+
+                if kind == "event":
+                    # Items are only reported for the winner, so a strategy that loses streams nothing
+                    if isinstance(value, ProgressEvent):
+                        yield value
+                    continue
+
+                running.discard(name)
+                if kind == "error":
+                    metrics.counter("race.errors").inc()
+                    logging.warning(f"⚠️ {name} failed: {value}")
+                elif kind == "done" and value is not None:
+                    if accept(value):
+                        metrics.counter(f"race.won.{name}").inc()
+                        metrics.counter("race.cancelled").inc(len(running) + len(pending))
+                        race.set(winner=name, ms=(time.monotonic() - started) * 1000, cancelled=len(running))
+                        logging.info(f"🏁 {name} won the race with {value.item_count} items")
+                        return name, value
+                    logging.info(f"🏁 {name} finished with {value.item_count} items, below the quality bar")
+                    finished.append((name, value))
+
+            race.set(winner=None)
+            if finished:
+                return max(finished, key=lambda pair: pair[1].item_count)
+            return None
+        finally:
+            cancel.set()
+            executor.shutdown(wait=False, cancel_futures=True)
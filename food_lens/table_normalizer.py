@@ -0,0 +1,212 @@
+# food_lens/table_normalizer.py
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+from food_lens.allergen_matrix import ALLERGEN_SYNONYMS, canonical_allergen
+from food_lens.smart_table_parser import SAFE_VALUES
+
+# Cell text meaning "contains" besides Yes; icon-font glyphs count as marks too
+CONTAINS_MARKS = {
+    "yes", "y", "x", "✓", "✔", "✔️", "☑", "✗", "✘", "●", "•", "◆", "■", "★", "+",
+    "contains", "may contain",
+}
+# Cell text meaning "not present" besides SAFE_VALUES
+ABSENT_MARKS = {"n", "-", "–", "—", "○", "◯"}
+
+# Header rows are looked for among the first rows of a table
+MAX_HEADER_ROWS = 3
+NAME_LABEL = re.compile(r"\b(item|name|product|menu|dish|food|beverage|drink)s?\b", re.IGNORECASE)
+EXACT_LABELS = {synonym for synonyms in ALLERGEN_SYNONYMS.values() for synonym in synonyms}
+
+Table = List[List[str]]
+
+
+def is_icon(text: str) -> bool:
+    """Glyphs from an icon font land in the Unicode private use area."""
+    return bool(text) and all(unicodedata.category(char) == "Co" for char in text)
+
+
+def is_mark(cell: str) -> bool:
+    text = cell.strip().lower()
+    return text in CONTAINS_MARKS or text in ABSENT_MARKS or text in {"no", "none"} or is_icon(text)
+
+
+def normalize_mark(cell: str) -> str:
+    """'✓', 'X', '●' -> 'Yes'; '-', '○' -> ''; anything else is kept as written."""
+    text = (cell or "").strip()
+    lowered = text.lower()
+    if lowered in SAFE_VALUES or lowered in ABSENT_MARKS:
+        return ""
+    if lowered in CONTAINS_MARKS or is_icon(text):
+        return "Yes"
+    return text
+
+
+@lru_cache(maxsize=4096)
+def allergen_label(text: str) -> Optional[str]:
+    """
+    The header label naming an allergen, or None. Rotated header text comes
+    out with a line break between letters ('M\\ni\\nl\\nk') or reversed
+    ('kliM'), and words can be split across header rows ('Shell' 'fish'),
+    so the label is also read without spaces and backwards.
+    """
+    text = " ".join(text.split())
+    joined = text.replace(" ", "")
+    as_written = canonical_allergen(text)
+    if canonical_allergen(joined) not in (None, as_written):
+        return joined  # 'Shell fish' is shellfish, not fish
+    if as_written:
+        return text
+    if canonical_allergen(joined):
+        return joined
+    if canonical_allergen(text[::-1]):
+        return text[::-1]
+    return None
+
+
+def marks_below(body: Table, col: int, labels: List[str]) -> bool:
+    """Whether `col` of the body holds Yes/X/✓ marks while the other header cells are text, not numbers."""
+    others = [label for i, label in enumerate(labels) if i != col and label]
+    if any(label.replace(".", "").isdigit() for label in others):
+        return False
+    cells = [row[col].strip() for row in body if col < len(row) and row[col] and row[col].strip()]
+    return bool(cells) and all(is_mark(cell) for cell in cells)
+
+
+def find_header(table: Table) -> Optional[Tuple[int, List[str]]]:
+    """
+    (number of header rows, one label per column) if the table starts with
+    a header. Labels of multi-row headers are joined top to bottom, so
+    'Tree' above 'Nuts' reads 'Tree Nuts'. The shallowest header naming the
+    most allergens wins; a row with Yes/X/✓ cells ends the search.
+    """
+    width = max((len(row) for row in table), default=0)
+    labels = [""] * width
+    best, best_count = None, 0
+    for depth, row in enumerate(table[:MAX_HEADER_ROWS], 1):
+        if any(is_mark(cell or "") for cell in row):
+            break
+        for i, cell in enumerate(row):
+            if cell and cell.strip():
+                labels[i] = f"{labels[i]} {cell.strip()}".strip()
+        found = [i for i, label in enumerate(labels) if allergen_label(label)]
+        # A single allergen column is labelled with just the allergen, or has
+        # marks below it, so a data row such as 'Egg Sandwich' is not taken for a header
+        if len(found) == 1 and " ".join(labels[found[0]].lower().split()) not in EXACT_LABELS \
+                and not marks_below(table[depth:], found[0], labels):
+            continue
+        if len(found) > best_count:
+            best, best_count = (depth, list(labels)), len(found)
+    return best
+
+
+class TableLayout:
+    """Where the name and allergen columns are in one guide's tables."""
+
+    def __init__(self, labels: List[str], body: Table):
+        self.width = len(labels)
+        self.allergen_cols = []
+        self.header = []
+        for i, label in enumerate(labels):
+            matched = allergen_label(label)
+            if matched:
+                self.allergen_cols.append(i)
+                self.header.append(matched)
+        others = [i for i in range(self.width) if i not in self.allergen_cols]
+        named = [i for i in others if NAME_LABEL.search(labels[i])]
+        if named:
+            self.name_col = named[0]
+        elif others:
+            # The column with the most text (not marks or numbers) holds the item names
+            def filled(i):
+                return sum(
+                    1 for row in body
+                    if i < len(row) and row[i] and row[i].strip()
+                    and not is_mark(row[i]) and not row[i].strip().replace(".", "").isdigit()
+                )
+            self.name_col = max(others, key=lambda i: (filled(i), -i))
+        else:
+            self.name_col = None
+        self.name_label = labels[self.name_col] if self.name_col is not None and labels[self.name_col] else "Item"
+
+    def matches(self, table: Table) -> bool:
+        """Whether a headerless table continues this layout: same width, marks where the allergens are."""
+        if self.name_col is None or max((len(row) for row in table), default=0) != self.width:
+            return False
+        cells = [row[i] for row in table for i in self.allergen_cols if i < len(row) and row[i] and row[i].strip()]
+        return all(is_mark(cell) for cell in cells) or (
+            bool(cells) and sum(is_mark(cell) for cell in cells) >= 0.8 * len(cells)
+        )
+
+    def apply(self, body: Table) -> Table:
+        """The body as [name, mark per allergen] rows, without category rows."""
+        rows: Table = []
+        last_col = max([self.name_col, *self.allergen_cols])
+        names = [(row[self.name_col] or "").strip() for row in body if len(row) > self.name_col]
+        # Category headings are told apart by capitals, unless every item is in capitals
+        upper_names = sum(1 for name in names if name.isupper())
+        caps_are_categories = upper_names <= len(names) / 2
+
+        for row in body:
+            if len(row) <= last_col:
+                continue
+            name = (row[self.name_col] or "").strip()
+            marks = [normalize_mark(row[i]) for i in self.allergen_cols]
+            if not name:
+                # A name cell merged across rows: the extra row belongs to the item above
+                if rows and any(marks):
+                    previous = rows[-1]
+                    for j, mark in enumerate(marks, 1):
+                        previous[j] = previous[j] or mark
+                continue
+            if any(mark not in ("", "Yes") for mark in marks) and all(allergen_label(mark) for mark in marks):
+                continue  # the header repeated inside the table
+            others_blank = all(not (cell or "").strip() for i, cell in enumerate(row) if i != self.name_col)
+            if others_blank and (name.endswith(":") or (caps_are_categories and name.isupper())):
+                continue  # a category row such as 'SALADS'
+            rows.append([name, *marks])
+        return rows
+
+
+class TableNormalizer:
+    """
+    Rewrites extracted tables as [header, rows...] with the item name first
+    and one column per allergen holding 'Yes' or ''. Feed it the tables of
+    each page in order: a headerless table with the same column signature
+    as the previous allergen table continues it on the next page.
+    Tables without allergen columns are dropped.
+    """
+
+    def __init__(self):
+        self.layout: Optional[TableLayout] = None
+
+    def feed(self, tables: Iterable[Table]) -> List[Table]:
+        normalized = []
+        for table in tables:
+            table = [[cell or "" for cell in row] for row in table if row]
+            if not table:
+                continue
+            header = find_header(table)
+            strong = header is not None and sum(1 for label in header[1] if allergen_label(label)) >= 2
+            if header and (strong or not (self.layout and self.layout.matches(table))):
+                depth, labels = header
+                body = table[depth:]
+                self.layout = TableLayout(labels, body)
+            elif self.layout and self.layout.matches(table):
+                body = table
+            else:
+                continue
+            if self.layout.name_col is None:
+                continue
+            rows = self.layout.apply(body)
+            if rows:
+                normalized.append([[self.layout.name_label, *self.layout.header], *rows])
+        return normalized
+
+
+def normalize_tables(tables: Iterable[Table]) -> List[Table]:
+    """Normalize all tables of one guide, in page order; see TableNormalizer."""
+    return TableNormalizer().feed(tables)
@@ -1,21 +1,22 @@
 # food_lens/utils.py
 
-import os
 import re
-import requests
+import time
+import zlib
+import logging
+from typing import Iterable, Iterator, Optional
+from dataclasses import dataclass
 from urllib.parse import urlparse
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from food_lens.config import get_settings
+from food_lens.http_client import get_session
+from food_lens.allergen_matrix import find_allergens
+from food_lens.restaurant_index import normalize_name
+from food_lens.instrumentation import span, in_current_context
 
-load_dotenv()
-
-SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
-SERPAPI_URL = "https://serpapi.com/search"
 KEYWORDS = ["allergen", "nutrition", "menu", "pdf"]
 
 
-print(f"[DEBUG] SerpAPI key loaded: {SERPAPI_API_KEY[:6]}...")  # Don't print full key
-
-
 # --- Normalize user input ---
 def normalize_restaurant_name(name: str) -> str:
     alias_map = {
@@ -24,7 +25,9 @@ def normalize_restaurant_name(name: str) -> str:
         "panera bread": "panera",
         "mcd": "mcdonald's",
     }
-    return alias_map.get(name.lower(), name.lower())
+    # "Chick-fil-A", "chick fil a" and "chickfila " all reach the same alias
+    normalized = normalize_name(name)
+    return alias_map.get(normalized, alias_map.get(normalized.replace(" ", ""), normalized))
 
 
 # --- Identify PDF URLs ---
@@ -32,64 +35,116 @@ def is_pdf_url(url: str) -> bool:
     return url.lower().endswith(".pdf")
 
 
-# --- Download PDF to local file ---
-def download_file(url: str, filename: str) -> str:
-    response = requests.get(url)
-    if response.status_code != 200:
-        raise RuntimeError(f"Failed to download file: {url}")
-
-    # Check if file starts with '%PDF' (magic number for PDF files)
-    if not response.content.startswith(b"%PDF"):
-        raise RuntimeError("Downloaded file is not a valid PDF — server may be returning an HTML page")
+# --- Probe a search result ---
+def probe_link(link: str, timeout: float = 5) -> Optional[str]:
+    """Return "pdf" or "html" if the link serves a usable allergen source, else None."""
+    session = get_session()
+    with span("probe", url=link) as probe:
+        try:
+            head = session.head(link, allow_redirects=True, timeout=timeout)
+            content_type = head.headers.get("Content-Type", "").lower()
+            probe.set(status=head.status_code, content_type=content_type)
 
-    with open(filename, "wb") as f:
-        f.write(response.content)
+            if is_pdf_url(link) and "pdf" in content_type:
+                probe.set(kind="pdf")
+                return "pdf"
+            if "html" in content_type:
+                # Test HTML body to avoid maintenance pages
+                with session.get(link, timeout=timeout, stream=True) as response:
+                    first_chunk = next(response.iter_content(chunk_size=2048), b"")
+                preview = first_chunk.decode("utf-8", errors="ignore")[:500].lower()
+                if "we're working on it" not in preview and "unavailable" not in preview:
+                    probe.set(kind="html")
+                    return "html"
+        except Exception as e:
+            probe.set(error=str(e))
+            logging.debug(f"❌ Skipping broken link: {link} ({e})")
+        return None
+
+
+def pick_allergen_sources(links: list[str], kinds: dict[int, Optional[str]]) -> tuple[Optional[str], Optional[str]]:
+    """
+    Choose (pdf_url, html_url) from probe results, keeping search ranking:
+    the first valid PDF wins, and an HTML page is only kept if it ranks above it.
+    """
+    pdf_index = next((i for i in sorted(kinds) if kinds[i] == "pdf"), None)
+    html_index = next(
+        (i for i in sorted(kinds) if kinds[i] == "html" and (pdf_index is None or i < pdf_index)),
+        None,
+    )
+    pdf_url = links[pdf_index] if pdf_index is not None else None
+    html_url = links[html_index] if html_index is not None else None
+    return pdf_url, html_url
+
+
+def probe_links(links: list[str], max_workers: int = 8, timeout: float = 5, deadline: float = 15) -> dict[int, Optional[str]]:
+    """
+    Probe links concurrently. Stops early once the best-ranked valid PDF is
+    known (every higher-ranked link has been probed), or when the deadline hits;
+    outstanding probes are cancelled.
+    """
+    kinds: dict[int, Optional[str]] = {}
+    if not links:
+        return kinds
+
+    stop_at = time.monotonic() + deadline
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(links)))
+    run_probe = in_current_context(probe_link)
+    futures = {executor.submit(run_probe, link, timeout): i for i, link in enumerate(links)}
+    pending = set(futures)
+
+    try:
+        while pending:
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                logging.debug(f"⏱️ Probe deadline reached with {len(pending)} links unchecked")
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                kinds[futures[future]] = future.result()
+
+            # A PDF wins as soon as every link ranked above it has been probed
+            for i in range(len(links)):
+                if i not in kinds:
+                    break
+                if kinds[i] == "pdf":
+                    return kinds
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return kinds
 
-    return filename
 
 # --- Search allergen page via SerpAPI ---
-def search_allergen_page(restaurant_name: str, max_results: int = 10) -> dict:
-    if not SERPAPI_API_KEY:
+def search_allergen_page(restaurant_name: str, max_results: int = 10, deadline: float = 15) -> dict:
+    settings = get_settings()
+    if not settings.serpapi_api_key:
         raise EnvironmentError("SERPAPI_API_KEY not set in .env")
 
     query = f"{restaurant_name} allergen site:.com"
     params = {
         "engine": "google",
         "q": query,
-        "api_key": SERPAPI_API_KEY,
+        "api_key": settings.serpapi_api_key,
         "num": max_results,
     }
 
-    response = requests.get(SERPAPI_URL, params=params)
-    if not response.ok:
-        raise RuntimeError(f"SerpAPI failed: {response.status_code}")
+    with span("search.serpapi"):
+        response = get_session().get(settings.serpapi_url, params=params, timeout=(5, deadline))
+        if not response.ok:
+            raise RuntimeError(f"SerpAPI failed: {response.status_code}")
 
-    results = response.json().get("organic_results", [])
+        results = response.json().get("organic_results", [])
+    links = [result.get("link", "") for result in results if result.get("link")]
 
-    pdf_url, html_url = None, None
+    with span("search.probes", links=len(links)):
+        kinds = probe_links(links, deadline=deadline)
+    pdf_url, html_url = pick_allergen_sources(links, kinds)
 
-    for result in results:
-        link = result.get("link", "")
-        title = result.get("title", "")
-        if not link:
-            continue
-
-        try:
-            head = requests.head(link, allow_redirects=True, timeout=5)
-            content_type = head.headers.get("Content-Type", "").lower()
-
-            if is_pdf_url(link) and "pdf" in content_type:
-                print(f"[DEBUG] ✅ Valid PDF found: {link}")
-                pdf_url = link
-                break  # Prefer first valid PDF
-            elif not html_url and "html" in content_type:
-                # Test HTML body to avoid maintenance pages
-                preview = requests.get(link, timeout=5).text[:500].lower()
-                if "we're working on it" not in preview and "unavailable" not in preview:
-                    print(f"[DEBUG] ⚠️ Valid HTML fallback found: {link}")
-                    html_url = link
-        except Exception as e:
-            print(f"[DEBUG] ❌ Skipping broken link: {link} ({e})")
+    if pdf_url:
+        logging.debug(f"✅ Valid PDF found: {pdf_url}")
+    if html_url:
+        logging.debug(f"⚠️ Valid HTML fallback found: {html_url}")
 
     return {
         "restaurant": restaurant_name,
@@ -102,47 +157,173 @@ def search_allergen_page(restaurant_name: str, max_results: int = 10) -> dict:
 # Text preprocessing helpers
 
 def merge_multiline_items(lines: list[str]) -> list[str]:
-    merged = []
+    return list(iter_merge_multiline_items(lines))
+
+
+def iter_merge_multiline_items(lines: Iterable[str]) -> Iterator[str]:
     current = ""
 
     for line in lines:
         # If line starts with an uppercase word and has no allergen indicators, it might be a name
         if re.match(r"^[A-Z][\w\s,&-]+$", line) and not any(word in line for word in ["Yes", "No", "Contain"]):
             if current:
-                merged.append(current)
+                yield current
             current = line
         elif any(kw in line for kw in ["Yes", "No Major Allergens Present", "May Contain"]):
             current = f"{current} {line}".strip()
-            merged.append(current)
+            yield current
             current = ""
         else:
             current += f" {line}"
-    
+
     if current:
-        merged.append(current)
-    
-    return merged
+        yield current
 
 
-def chunk_text(text: str, size: int = 3000, overlap: int = 200) -> list[str]:
-    paragraphs = text.split('\n\n')
-    chunks = []
-    current_chunk = []
-    current_length = 0
+# --- Token counting ---
+_encoder = None
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Count tokens with tiktoken when it is installed, else estimate ~4 characters per token."""
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.encoding_for_model(model)
+        except Exception:
+            _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text))
+    return (len(text) + 3) // 4
+
+
+def is_header_row(line: str) -> bool:
+    """A row naming several allergens is a table header (e.g. 'Item Milk Egg Wheat Soy')."""
+    return len(find_allergens(line)) >= 3
+
+
+def split_long_row(row: str, max_tokens: int) -> list[str]:
+    """Split a single row that alone exceeds the budget on word boundaries."""
+    pieces, current = [], []
+    for word in row.split():
+        if current and count_tokens(" ".join(current + [word])) > max_tokens:
+            pieces.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+@dataclass
+class Chunk:
+    text: str
+    tokens: int
 
-    for para in paragraphs:
-        para = para.strip()
-        if not para:
-            continue
-        if current_length + len(para) + 2 > size:
-            chunks.append('\n\n'.join(current_chunk))
-            current_chunk = current_chunk[-overlap:] if overlap else []
-            current_length = sum(len(p) + 2 for p in current_chunk)
 
-        current_chunk.append(para)
-        current_length += len(para) + 2
+def split_chunk(chunk: Chunk) -> list[Chunk]:
+    """Halve a chunk between rows, keeping its table header at the top of both halves; [] for a single row."""
+    rows = chunk.text.splitlines()
+    header = rows[:1] if rows and is_header_row(rows[0]) else []
+    body = rows[len(header):]
+    if len(body) < 2:
+        return []
+    middle = len(body) // 2
+    halves = ["\n".join(header + body[:middle]), "\n".join(header + body[middle:])]
+    return [Chunk(text, count_tokens(text)) for text in halves]
+
+
+def chunk_rows(text: str, max_tokens: int = 1500, overlap_rows: int = 0) -> list[Chunk]:
+    """
+    Split text into chunks of at most max_tokens, breaking only between rows
+    (one menu item per line, as produced by merge_multiline_items). The most
+    recent table header row is repeated at the top of each chunk so the model
+    always knows which column is which. overlap_rows repeats the last rows of
+    a chunk at the start of the next one.
+    """
+    return list(iter_chunk_rows(text.splitlines(), max_tokens, overlap_rows))
+
+
+def iter_chunk_rows(lines: Iterable[str], max_tokens: int = 1500, overlap_rows: int = 0) -> Iterator[Chunk]:
+    """chunk_rows over lines arriving one at a time; each chunk is yielded as soon as it is full."""
+    header = None
+    current: list[str] = []
+    current_tokens = 0
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        rows = split_long_row(line, max_tokens) if count_tokens(line) > max_tokens else [line]
+        for row in rows:
+            if is_header_row(row):
+                header = row
+            row_tokens = count_tokens(row) + 1  # +1 for the newline
+
+            if current and current_tokens + row_tokens > max_tokens:
+                yield Chunk("\n".join(current), current_tokens)
+                carried = current[-overlap_rows:] if overlap_rows else []
+                current = [header] if header and row != header else []
+                current += [r for r in carried if r != header]
+                current_tokens = sum(count_tokens(r) + 1 for r in current)
+
+            current.append(row)
+            current_tokens += row_tokens
+
+    # A trailing header with no rows under it is not worth a request
+    if current and not all(is_header_row(r) for r in current):
+        yield Chunk("\n".join(current), current_tokens)
+
+
+# On average one section in this many ends a chunk (see chunk_sections)
+SECTION_BREAK_EVERY = 4
+
+
+def chunk_sections(sections: list[str], max_tokens: int = 1500) -> list[Chunk]:
+    """
+    Chunk text made of sections (PDF pages, the parts of an HTML page under
+    each heading) so that editing one section only changes the chunks
+    around it. Chunks end after sections picked by their content, or when
+    the next section would not fit, never by position, so boundaries after
+    an edit line up with the previous version's again. The last table
+    header seen is carried into chunks that start without one.
+    """
+    return list(iter_chunk_sections(sections, max_tokens))
+
+
+def iter_section_groups(sections: Iterable[str], max_tokens: int) -> Iterator[list[str]]:
+    current, current_tokens = [], 0
+    for section in sections:
+        tokens = count_tokens(section)
+        if current and current_tokens + tokens > max_tokens:
+            yield current
+            current, current_tokens = [], 0
+        current.append(section)
+        current_tokens += tokens
+        if zlib.crc32(section.encode("utf-8")) % SECTION_BREAK_EVERY == 0:
+            yield current
+            current, current_tokens = [], 0
+    if current:
+        yield current
+
+
+def iter_chunk_sections(sections: Iterable[str], max_tokens: int = 1500) -> Iterator[Chunk]:
+    """
+    chunk_sections over sections arriving one at a time (e.g. pages as they
+    are extracted). Only the group of sections being filled is held, so
+    memory does not grow with the length of the guide.
+    """
+    header = None
+    for group in iter_section_groups(sections, max_tokens):
+        rows = [row.strip() for section in group for row in section.splitlines() if row.strip()]
+        if not rows:
+            continue
+        if header and not is_header_row(rows[0]):
+            rows.insert(0, header)
+        yield from iter_chunk_rows(rows, max_tokens)
+        header = next((row for row in reversed(rows) if is_header_row(row)), header)
 
-    if current_chunk:
-        chunks.append('\n\n'.join(current_chunk))
 
-    return chunks
\ No newline at end of file
+def chunk_text(text: str, max_tokens: int = 1500, overlap_rows: int = 0) -> list[str]:
+    return [chunk.text for chunk in chunk_rows(text, max_tokens, overlap_rows)]
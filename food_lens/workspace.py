@@ -0,0 +1,120 @@
+# food_lens/workspace.py
+
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Optional, Union
+from food_lens.config import get_settings
+
+
+class WorkspaceFile:
+    """
+    A file being written into a workspace. It is kept in memory until it
+    grows past `spill_bytes`, then moved to a file of its own in the
+    workspace directory. `source` is what PdfDocument and pdfplumber open:
+    the bytes, or the path once spilled.
+    """
+
+    def __init__(self, workspace: "Workspace", suffix: str = ""):
+        self.workspace = workspace
+        self.suffix = suffix
+        self.size = 0
+        self.path: Optional[str] = None
+        self._buffer: Optional[bytearray] = bytearray()
+        self._file = None
+        self._digest = hashlib.sha256()
+
+    @property
+    def spilled(self) -> bool:
+        return self.path is not None
+
+    def write(self, data: bytes) -> None:
+        self._digest.update(data)
+        self.size += len(data)
+        if self._buffer is not None and self.size > self.workspace.spill_bytes:
+            self.path, self._file = self.workspace.create_file(self.suffix)
+            self._file.write(self._buffer)
+            self._buffer = None
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._buffer.extend(data)
+
+    def finish(self) -> "WorkspaceFile":
+        """Flush and close the spilled file; the file stays readable until the workspace closes."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        return self
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    def head(self, n: int) -> bytes:
+        if self._buffer is not None:
+            return bytes(self._buffer[:n])
+        if self._file is not None:
+            self._file.flush()
+        with open(self.path, "rb") as f:
+            return f.read(n)
+
+    @property
+    def content(self) -> Optional[bytes]:
+        """The bytes while the file is in memory, None once spilled."""
+        return bytes(self._buffer) if self._buffer is not None else None
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        self.finish()
+        return self.path if self.spilled else self.content
+
+
+class Workspace:
+    """
+    Scratch space for one analysis. Files are written in memory and only
+    spilled to disk when large; spilled files go in a directory created for
+    this workspace alone (so concurrent analyses, in threads or processes,
+    never share a path) and removed with it on close.
+    """
+
+    def __init__(self, spill_bytes: Optional[int] = None, parent_dir: Optional[str] = None):
+        settings = get_settings()
+        self.spill_bytes = settings.spill_bytes if spill_bytes is None else spill_bytes
+        self.parent_dir = parent_dir or settings.workspace_dir
+        self.directory: Optional[str] = None
+        self._files: list[WorkspaceFile] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def file(self, suffix: str = "") -> WorkspaceFile:
+        workspace_file = WorkspaceFile(self, suffix)
+        with self._lock:
+            self._files.append(workspace_file)
+        return workspace_file
+
+    def create_file(self, suffix: str = ""):
+        """A new uniquely named file in the workspace directory, open for writing."""
+        with self._lock:
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix="foodlens-", dir=self.parent_dir)
+            fd, path = tempfile.mkstemp(suffix=suffix, dir=self.directory)
+        logging.debug(f"Spilling a workspace file to {path}")
+        return path, os.fdopen(fd, "wb")
+
+    def close(self) -> None:
+        with self._lock:
+            files, self._files = self._files, []
+            directory, self.directory = self.directory, None
+        for workspace_file in files:
+            workspace_file.finish()
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
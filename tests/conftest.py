@@ -0,0 +1,17 @@
+import sys
+import os
+from dataclasses import replace
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from food_lens.config import AppContext, Settings, set_context
+
+
+@pytest.fixture(autouse=True)
+def isolated_restaurant_index(tmp_path):
+    """Keep each test's restaurant index out of the user's cache directory."""
+    settings = replace(Settings.from_env(), restaurant_index_path=str(tmp_path / "restaurants.idx"))
+    previous = set_context(AppContext(settings))
+    yield
+    set_context(previous)
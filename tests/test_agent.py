@@ -2,7 +2,11 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from food_lens.agent import analyze_restaurant_allergens
+from food_lens import agent
+from food_lens.agent import analyze_restaurant_allergens, iter_analyze_restaurant_allergens
+from food_lens.cache import MemoryCache
+from food_lens.events import ProgressEvent, ItemsEvent, ResultEvent
+from test_pdf_parser import make_guide, ALLERGEN_PAGE, NUTRITION_PAGE
 
 
 def test_agent_basic():
@@ -19,5 +23,34 @@ def test_agent_basic():
     print("✅ test_agent_basic passed.")
 
 
+def test_agent_streams_events_offline(tmp_path, monkeypatch):
+    path = make_guide(tmp_path / "guide.pdf", [ALLERGEN_PAGE, NUTRITION_PAGE])
+    with open(path, "rb") as f:
+        data = f.read()
+
+    monkeypatch.setattr(agent, "search_allergen_page", lambda name: {
+        "restaurant": name, "pdf_url": "https://example.com/allergens.pdf", "html_url": None,
+    })
+    monkeypatch.setattr(agent, "fetch_pdf", lambda url, **options: {"content": data, "etag": None, "last_modified": None})
+
+    cache = MemoryCache()
+    events = list(iter_analyze_restaurant_allergens("Example", "dairy", cache=cache))
+
+    stages = [event.stage for event in events if isinstance(event, ProgressEvent)]
+    assert stages == ["search", "download", "pages", "pages"]
+    assert [event.full_items for event in events if isinstance(event, ItemsEvent)] == [["Greek Salad"]]
+    assert isinstance(events[-1], ResultEvent)
+    assert events[-1].result == (["Greek Salad"], [])
+
+    # A repeat lookup is answered from the cache
+    assert analyze_restaurant_allergens("example ", "dairy", cache=cache) == (["Greek Salad"], [])
+    assert cache.stats.as_dict()["result"] == {"hits": 1, "misses": 1}
+
+    # The order allergens are given in does not matter
+    analyze_restaurant_allergens("Example", "dairy, egg", cache=cache)
+    analyze_restaurant_allergens("Example", ["egg", "dairy"], cache=cache)
+    assert cache.stats.as_dict()["result"] == {"hits": 2, "misses": 2}
+
+
 if __name__ == "__main__":
     test_agent_basic()
@@ -0,0 +1,58 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from food_lens.allergen_matrix import AllergenMatrix, canonical_allergen, parse_allergens
+
+TABLES = [
+    [
+        ["Item", "Milk", "Egg", "Wheat", "Sesame"],
+        ["Greek Salad", "", "", "", ""],
+        ["Mac & Cheese", "Yes", "", "Yes", ""],
+        ["Sesame Bagel", "", "", "Yes", "Yes"],
+        ["Balsamic Dressing", "", "", "", ""],
+        ["Egg Sandwich", "", "Contains", "Yes", ""],
+    ],
+    # Second table without a sesame column
+    [
+        ["Beverage", "Milk", "Egg"],
+        ["Lemonade", "", ""],
+        ["Latte", "Yes", ""],
+    ],
+]
+
+
+def test_header_synonyms():
+    assert canonical_allergen("Milk") == "dairy"
+    assert canonical_allergen("Gluten") == "wheat"
+    assert canonical_allergen("Tree Nuts") == "tree nuts"
+    assert canonical_allergen("Peanuts") == "peanuts"
+    assert canonical_allergen("Shellfish") == "shellfish"
+    assert canonical_allergen("Calories") is None
+
+
+def test_parse_allergens():
+    assert parse_allergens("dairy, egg and sesame") == ["dairy", "egg", "sesame"]
+    assert parse_allergens(["Milk", "dairy"]) == ["dairy"]
+    with pytest.raises(ValueError):
+        parse_allergens("glitter")
+
+
+def test_single_and_multi_allergen_queries():
+    matrix = AllergenMatrix.from_tables(TABLES)
+    assert matrix.allergens == ["dairy", "egg", "wheat", "sesame"]
+
+    assert matrix.safe_items("dairy") == (
+        ["Greek Salad", "Egg Sandwich"],
+        ["Sesame Bagel", "Balsamic Dressing", "Lemonade"],
+    )
+    assert matrix.safe_items(["dairy", "egg"]) == (
+        ["Greek Salad"],
+        ["Sesame Bagel", "Balsamic Dressing", "Lemonade"],
+    )
+    # Lemonade's table has no sesame column, so it cannot be confirmed sesame-free
+    assert matrix.safe_items("dairy, egg, sesame") == (["Greek Salad"], ["Balsamic Dressing"])
+    # No guide column at all for peanuts
+    assert matrix.safe_items("peanuts") == ([], [])
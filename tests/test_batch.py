@@ -0,0 +1,115 @@
+import sys
+import os
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from food_lens import agent
+from food_lens.batch import run_batch
+from food_lens.cache import MemoryCache
+from test_pdf_parser import make_guide, ALLERGEN_PAGE
+
+
+def test_batch_dedupes_downloads_and_resumes(tmp_path, monkeypatch):
+    path = make_guide(tmp_path / "guide.pdf", [ALLERGEN_PAGE])
+    with open(path, "rb") as f:
+        data = f.read()
+
+    searches, downloads = [], []
+
+    def fake_search(name):
+        searches.append(name)
+        # Both chains publish the same franchise guide
+        return {"restaurant": name, "pdf_url": "https://example.com/guide.pdf", "html_url": None}
+
+    def fake_fetch(url, **options):
+        downloads.append(url)
+        return {"content": data, "etag": None, "last_modified": None}
+
+    monkeypatch.setattr(agent, "search_allergen_page", fake_search)
+    monkeypatch.setattr(agent, "fetch_pdf", fake_fetch)
+
+    input_path = tmp_path / "jobs.csv"
+    input_path.write_text(
+        "restaurant,allergens\n"
+        "Alpha Cafe,dairy\n"
+        "alpha cafe,egg\n"
+        "Beta Bistro,dairy;egg\n"
+        "beta bistro,egg;dairy\n"
+    )
+    output_path = str(tmp_path / "out.jsonl")
+
+    summary = run_batch(str(input_path), output_path, cache=MemoryCache())
+    assert summary == {"jobs": 4, "completed": 3, "failed": 0, "output": output_path}
+    assert sorted(searches) == ["Alpha Cafe", "Beta Bistro"]
+    assert downloads == ["https://example.com/guide.pdf"]
+
+    with open(output_path) as f:
+        records = [json.loads(line) for line in f]
+    assert [(r["restaurant"], r["allergens"]) for r in records] == [
+        ("Alpha Cafe", ["dairy"]), ("Alpha Cafe", ["egg"]), ("Beta Bistro", ["dairy", "egg"]),
+    ]
+    assert records[0]["full_items"] == ["Greek Salad"]
+    assert records[1]["sub_items"] == ["Latte"]
+    assert records[0]["method"] == "tables"
+    # The same allergens in another order are one job, analyzed once
+    with open(f"{output_path}.checkpoint.jsonl") as f:
+        assert len(f.readlines()) == 3
+
+    # A rerun resumes from the checkpoint and does no new work
+    summary = run_batch(str(input_path), output_path, cache=MemoryCache())
+    assert summary["completed"] == 3
+    assert len(searches) == 2
+
+
+def test_batch_writes_parquet(tmp_path, monkeypatch):
+    import pyarrow.parquet as pq
+
+    monkeypatch.setattr(agent, "search_allergen_page", lambda name: {
+        "restaurant": name, "pdf_url": None, "html_url": None,
+    })
+    input_path = tmp_path / "jobs.jsonl"
+    input_path.write_text(json.dumps({"restaurant": "Nowhere", "allergens": ["sesame"]}) + "\n")
+    output_path = str(tmp_path / "out.parquet")
+
+    run_batch(str(input_path), output_path, cache=MemoryCache())
+    table = pq.read_table(output_path)
+    assert table.column("restaurant").to_pylist() == ["Nowhere"]
+    assert table.column("method").to_pylist() == ["none"]
+
+
+def test_batch_releases_downloads_as_restaurants_finish(tmp_path, monkeypatch):
+    from dataclasses import replace
+    from food_lens.batch import BatchPipeline
+    from food_lens.config import AppContext, get_settings, set_context
+
+    path = make_guide(tmp_path / "guide.pdf", [ALLERGEN_PAGE])
+    with open(path, "rb") as f:
+        data = f.read()
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+
+    def fake_fetch(url, workspace=None, **options):
+        body = workspace.file(".pdf")
+        body.write(data)
+        body.finish()
+        return {"content": body.content, "path": body.path, "sha256": body.sha256, "etag": None, "last_modified": None}
+
+    monkeypatch.setattr(agent, "search_allergen_page", lambda name: {
+        "restaurant": name, "pdf_url": f"https://example.com/{name}.pdf", "html_url": None,
+    })
+    monkeypatch.setattr(agent, "fetch_pdf", fake_fetch)
+    previous = set_context(AppContext(replace(get_settings(), spill_bytes=100, workspace_dir=str(scratch))))
+    try:
+        pipeline = BatchPipeline(cache=MemoryCache())
+        jobs = [{"restaurant": name, "allergens": ["dairy"]} for name in ["Alpha", "Beta", "Gamma"]]
+        records = []
+        for record in pipeline.run(jobs):
+            # Spilled guides of finished restaurants are already gone
+            assert sum(len(files) for _, _, files in os.walk(scratch)) <= len(jobs) - len(records) - 1
+            records.append(record)
+    finally:
+        set_context(previous)
+
+    assert [record["full_items"] for record in records] == [["Greek Salad"]] * 3
+    assert pipeline._downloads == {}
+    assert os.listdir(scratch) == []
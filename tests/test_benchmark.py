@@ -0,0 +1,22 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.run_benchmark import run_benchmark, format_report
+from food_lens.config import get_context
+
+
+def test_offline_benchmark_matches_golden(tmp_path):
+    context = get_context()
+    report = run_benchmark(corpus_dir=str(tmp_path), restaurants=3, menu_size=40, concurrency=2)
+
+    assert report["accuracy"]["exact"] == 3
+    assert set(report["accuracy_by_kind"]) == {"pdf_table", "pdf_text", "html"}
+    assert report["stages"]["analyze"]["count"] == 3
+    assert report["stages"]["llm.chunk"]["count"] >= 2
+    assert report["peak_rss_mb"]["self"] > 0
+    assert "Accuracy" in format_report(report)
+
+    # The corpus is reused from its manifest, and the real endpoints are restored
+    assert run_benchmark(corpus_dir=str(tmp_path))["restaurants"] == 3
+    assert get_context() is context
@@ -0,0 +1,52 @@
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from food_lens.cache import DiskCache, MemoryCache, make_key, normalize_cache_name
+
+
+def test_disk_cache_roundtrip_and_stats(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    key = make_key(normalize_cache_name(" Panera  Bread "), "dairy")
+
+    assert cache.get("result", key) is None
+    cache.set("result", key, (["Salad"], ["Apple"]))
+    assert cache.get("result", key) == (["Salad"], ["Apple"])
+
+    # A second instance pointed at the same directory shares the store
+    other = DiskCache(str(tmp_path))
+    assert other.get("result", key) == (["Salad"], ["Apple"])
+
+    assert cache.stats.as_dict() == {"result": {"hits": 1, "misses": 1}}
+
+
+def test_disk_cache_ttl_expiry(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.set("search", "k", {"pdf_url": "x"}, ttl=0.01)
+    time.sleep(0.05)
+    assert cache.get("search", "k") is None
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    blob = b"x" * 1000
+    cache = DiskCache(str(tmp_path), max_bytes=2500)
+    cache.set("download", "a", blob)
+    cache.set("download", "b", blob)
+    cache.get("download", "a")  # "b" is now least recently used
+    cache.set("download", "c", blob)
+
+    assert cache.get("download", "a") == blob
+    assert cache.get("download", "b") is None
+    assert cache.get("download", "c") == blob
+
+
+def test_memory_cache_lru():
+    cache = MemoryCache(max_entries=2)
+    cache.set("ns", "a", 1)
+    cache.set("ns", "b", 2)
+    cache.get("ns", "a")
+    cache.set("ns", "c", 3)
+
+    assert cache.get("ns", "a") == 1
+    assert cache.get("ns", "b") is None
@@ -0,0 +1,63 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from food_lens import html_parser
+from food_lens.html_parser import extract_sections_from_html, extract_text_from_html
+
+PAGE = """
+<html><body><nav>Menu</nav><main>
+  <p>Allergen information</p>
+  <h2>Salads</h2><ul><li>Greek Salad</li><li>Caesar Salad</li></ul>
+  <h2>Drinks</h2><p>Latte</p>
+</main></body></html>
+"""
+
+
+def test_sections_split_at_headings(monkeypatch):
+    monkeypatch.setattr(html_parser, "fetch_page", lambda url: {"text": PAGE, "etag": None, "last_modified": None})
+
+    sections = extract_sections_from_html("https://example.com/allergens")
+
+    assert sections == ["Allergen information", "Salads\nGreek Salad\nCaesar Salad", "Drinks\nLatte"]
+    assert extract_text_from_html("https://example.com/allergens") == "\n".join(sections)
+
+
+TABLE_PAGE = """
+<html><head><script>var cell = "<td>Yes</td>";</script></head><body>
+<header><h1>Example Grill</h1></header>
+<main><h2>Allergens</h2>
+<table>
+  <tr><th rowspan="2">Item</th><th colspan="2">Allergens</th></tr>
+  <tr><th>Milk</th><th>Egg</th></tr>
+  <tr><td>Greek <b>Salad</b></td><td></td><td></td></tr>
+  <tr><td>Latte</td><td>&#10003;</td><td></td></tr>
+</table>
+</main><footer>© Example</footer></body></html>
+"""
+
+
+def test_tables_are_extracted_as_rows(monkeypatch):
+    monkeypatch.setattr(html_parser, "fetch_page", lambda url: {"text": TABLE_PAGE, "etag": None, "last_modified": None})
+
+    sections, tables = html_parser.extract_page_from_html("https://example.com/allergens")
+
+    assert tables == [[
+        ["Item", "Allergens", "Allergens"],
+        ["Item", "Milk", "Egg"],
+        ["Greek Salad", "", ""],
+        ["Latte", "✓", ""],
+    ]]
+    assert sections == ["Allergens\nItem | Allergens | Allergens\nItem | Milk | Egg\nGreek Salad |  | \nLatte | ✓ | "]
+
+
+def test_html_tables_skip_gpt(monkeypatch):
+    from food_lens import agent, llm_client
+    from food_lens.cache import MemoryCache
+
+    monkeypatch.setattr(html_parser, "fetch_page", lambda url: {"text": TABLE_PAGE, "etag": None, "last_modified": None})
+    monkeypatch.setattr(llm_client, "send_prompt", lambda *args, **kwargs: pytest.fail("GPT was called"))
+
+    assert agent.analyze_html("https://example.com/allergens", ["dairy"], MemoryCache()) == (["Greek Salad"], [])
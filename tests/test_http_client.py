@@ -0,0 +1,94 @@
+import sys
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from food_lens.cache import content_hash
+from food_lens.http_client import check_modified, fetch_pdf, fetch_text
+from food_lens.workspace import Workspace
+
+PDF_BODY = b"%PDF-1.4\n" + b"0" * 200_000
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/guide.pdf":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(PDF_BODY)))
+            self.end_headers()
+            self.wfile.write(PDF_BODY)
+        elif self.path == "/maintenance.pdf":
+            body = b"<html>We're working on it</html>"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def test_fetch_pdf_and_conditional_get(server):
+    download = fetch_pdf(f"{server}/guide.pdf")
+    assert download["content"] == PDF_BODY
+    assert download["etag"] == '"v1"'
+    assert not download["not_modified"]
+
+    revalidated = fetch_pdf(f"{server}/guide.pdf", etag=download["etag"])
+    assert revalidated["not_modified"]
+    assert revalidated["content"] is None
+
+
+def test_check_modified_without_downloading(server):
+    # The test server has no HEAD, so this also covers the GET fallback
+    changed = check_modified(f"{server}/guide.pdf")
+    assert changed == {"modified": True, "etag": '"v1"', "last_modified": None}
+    assert not check_modified(f"{server}/guide.pdf", etag='"v1"')["modified"]
+    assert check_modified(f"{server}/guide.pdf", etag='"v0"')["modified"]
+
+
+def test_fetch_pdf_into_workspace(server, tmp_path):
+    with Workspace(spill_bytes=1000, parent_dir=str(tmp_path)) as workspace:
+        download = fetch_pdf(f"{server}/guide.pdf", workspace=workspace)
+        assert download["content"] is None
+        with open(download["path"], "rb") as f:
+            assert f.read() == PDF_BODY
+        assert download["sha256"] == content_hash(PDF_BODY)
+        with pytest.raises(RuntimeError, match="not a valid PDF"):
+            fetch_pdf(f"{server}/maintenance.pdf", workspace=workspace)
+    assert os.listdir(tmp_path) == []
+
+
+def test_fetch_pdf_rejects_html_and_oversized(server):
+    with pytest.raises(RuntimeError, match="not a valid PDF"):
+        fetch_pdf(f"{server}/maintenance.pdf")
+    with pytest.raises(RuntimeError, match="too large"):
+        fetch_pdf(f"{server}/guide.pdf", max_bytes=1000)
+    with pytest.raises(RuntimeError, match="Failed to download"):
+        fetch_pdf(f"{server}/missing.pdf")
+
+
+def test_fetch_text(server):
+    assert "working on it" in fetch_text(f"{server}/maintenance.pdf")
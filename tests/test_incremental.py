@@ -0,0 +1,75 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dataclasses import replace
+
+from food_lens import agent, llm_client
+from food_lens.agent import ItemTracker, iter_analyze_pdf, ask_gpt_for_all_allergens
+from food_lens.cache import MemoryCache, content_hash
+from food_lens.config import AppContext, get_settings, set_context
+from food_lens.events import ChangesEvent
+from food_lens.incremental import diff_results
+from food_lens.instrumentation import metrics
+from food_lens.utils import chunk_sections
+from test_pdf_parser import make_guide, ALLERGEN_PAGE, NUTRITION_PAGE
+
+BREAKFAST_PAGE = [["Item", "Milk", "Egg"], ["Oatmeal", "", ""], ["Omelet", "", "Yes"]]
+
+
+def analyze_version(tmp_path, monkeypatch, name, pages, cache):
+    with open(make_guide(tmp_path / name, pages), "rb") as f:
+        data = f.read()
+    monkeypatch.setattr(agent, "cached_fetch_pdf", lambda url, cache, workspace=None: {"content": data, "sha256": content_hash(data)})
+    return list(iter_analyze_pdf("https://example.com/allergens.pdf", ["dairy"], cache, ItemTracker()))
+
+
+def test_updated_guide_only_reparses_changed_pages(tmp_path, monkeypatch):
+    cache = MemoryCache()
+    metrics.reset()
+    analyze_version(tmp_path, monkeypatch, "v1.pdf", [ALLERGEN_PAGE, BREAKFAST_PAGE, NUTRITION_PAGE], cache)
+    assert metrics.histogram("tables.page.ms").count == 3
+
+    # The chain republishes with one changed page: Oatmeal now contains milk
+    updated = [["Item", "Milk", "Egg"], ["Oatmeal", "Yes", ""], ["Omelet", "", "Yes"]]
+    events = analyze_version(tmp_path, monkeypatch, "v2.pdf", [ALLERGEN_PAGE, updated, NUTRITION_PAGE], cache)
+
+    assert metrics.histogram("tables.page.ms").count == 4
+    changes = [event for event in events if isinstance(event, ChangesEvent)]
+    assert changes == [ChangesEvent([], ["Oatmeal"], "https://example.com/allergens.pdf")]
+
+
+def test_unchanged_sections_keep_their_chunks():
+    sections = [f"Section {i}\n" + "\n".join(f"Dish {i}-{j} | Milk: No" for j in range(15)) for i in range(30)]
+    edited = list(sections)
+    edited[12] = edited[12].replace("Dish 12-3 | Milk: No", "Dish 12-3 | Milk: Yes")
+
+    before = {chunk.text for chunk in chunk_sections(sections, max_tokens=300)}
+    after = [chunk.text for chunk in chunk_sections(edited, max_tokens=300)]
+
+    assert sum(text not in before for text in after) <= 2
+
+
+def test_gpt_only_classifies_changed_chunks(monkeypatch):
+    prompts = []
+
+    def fake_send(prompt, max_tokens, **options):
+        prompts.append(prompt)
+        return {"text": '{"allergens_listed": ["milk"], "items": [{"name": "Greek Salad", "contains": []}]}'}
+
+    monkeypatch.setattr(llm_client, "send_prompt", fake_send)
+    set_context(AppContext(replace(get_settings(), chunk_tokens=300)))
+    cache = MemoryCache()
+    sections = [f"Page {i}\n" + "\n".join(f"Dish {i}-{j} | Milk: No" for j in range(40)) for i in range(6)]
+    ask_gpt_for_all_allergens(sections, ["dairy"], cache)
+    first_run = len(prompts)
+
+    sections[3] += "\nNew Dish | Milk: No"
+    ask_gpt_for_all_allergens(sections, ["dairy"], cache)
+    assert 1 <= len(prompts) - first_run < first_run
+
+
+def test_diff_results():
+    old = (["Greek Salad", "Oatmeal"], ["Latte"])
+    new = (["Greek Salad"], ["Latte", "Tea"])
+    assert diff_results(old, new) == {"became_safe": ["Tea"], "became_unsafe": ["Oatmeal"]}
@@ -0,0 +1,69 @@
+import sys
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from food_lens.instrumentation import (
+    Histogram, JsonLinesExporter, add_exporter, remove_exporter, span, in_current_context, metrics,
+)
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for value in range(1, 101):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 100
+    assert snapshot["min"] == 1 and snapshot["max"] == 100
+    assert 49 <= snapshot["p50"] <= 51
+    assert 94 <= snapshot["p95"] <= 96
+
+
+def test_spans_nest_across_threads_and_export(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    exporter = JsonLinesExporter(str(path))
+    add_exporter(exporter)
+    metrics.reset()
+
+    def work(i):
+        with span("child", index=i):
+            pass
+
+    try:
+        with span("parent") as parent:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(in_current_context(work), range(3)))
+        try:
+            with span("failing"):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+    finally:
+        remove_exporter(exporter)
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    children = [s for s in spans if s["name"] == "child"]
+    assert len(children) == 3
+    assert all(s["parent_id"] == parent.span_id and s["trace_id"] == parent.trace_id for s in children)
+    assert [s for s in spans if s["name"] == "failing"][0]["error"] == "ValueError: boom"
+
+    snapshot = metrics.snapshot()
+    assert snapshot["histograms"]["child.ms"]["count"] == 3
+    assert snapshot["counters"]["failing.errors"] == 1
+
+
+def test_trace_file_setting_is_read_when_spans_finish(tmp_path):
+    from dataclasses import replace
+    from food_lens.config import AppContext, get_settings, set_context
+
+    path = tmp_path / "settings-trace.jsonl"
+    previous = set_context(AppContext(replace(get_settings(), trace_file=str(path))))
+    try:
+        with span("configured"):
+            pass
+    finally:
+        set_context(previous)
+    with span("unconfigured"):
+        pass
+    assert [json.loads(line)["name"] for line in path.read_text().splitlines()] == ["configured"]
@@ -0,0 +1,90 @@
+import sys
+import os
+from dataclasses import replace
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from food_lens import llm_client
+from food_lens.cache import DiskCache
+from food_lens.config import AppContext, get_settings, set_context
+from food_lens.instrumentation import metrics
+from food_lens.llm_client import ask_gpt_for_safe_items, completion_key, iter_gpt_matrix, token_usage
+
+ANSWER = "--- FULL MENU ITEMS ---\nGreek Salad\n--- INDIVIDUAL SAFE INGREDIENTS ---\nLemonade\n"
+
+
+def fake_api(monkeypatch):
+    prompts = []
+
+    def fake_send(prompt, max_tokens, **options):
+        prompts.append(prompt)
+        return {"text": ANSWER, "prompt_tokens": 100, "completion_tokens": 10}
+
+    monkeypatch.setattr(llm_client, "send_prompt", fake_send)
+    return prompts
+
+
+def test_identical_pages_are_sent_once(monkeypatch):
+    prompts = fake_api(monkeypatch)
+    set_context(AppContext(replace(get_settings(), chunk_tokens=200)))
+    metrics.reset()
+    page = "\n".join(f"Dish {i} | Milk: No" for i in range(30))
+
+    result = ask_gpt_for_safe_items([page, page, page], "dairy")
+
+    assert result == (["Greek Salad"], ["Lemonade"])
+    assert len(prompts) == 1
+    assert token_usage()["dedup_hits"] == 2
+
+
+def test_answers_persist_across_runs(tmp_path, monkeypatch):
+    prompts = fake_api(monkeypatch)
+    metrics.reset()
+    text = "Greek Salad | No Major Allergens Present\nLemonade | No Major Allergens Present"
+
+    first = ask_gpt_for_safe_items(text, "dairy", cache=DiskCache(str(tmp_path)))
+    # A new process (a fresh cache object on the same directory) reuses the answer
+    second = ask_gpt_for_safe_items(text, "dairy", cache=DiskCache(str(tmp_path)))
+
+    assert first == second == (["Greek Salad"], ["Lemonade"])
+    assert len(prompts) == 1
+    usage = token_usage()
+    assert (usage["prompt_tokens"], usage["saved_prompt_tokens"], usage["cache_hits"]) == (100, 100, 1)
+
+
+def test_completion_key_covers_model_and_parameters():
+    key = completion_key("prompt", 1000)
+    assert completion_key("prompt", 500) != key
+    set_context(AppContext(replace(get_settings(), model="gpt-4o-mini")))
+    assert completion_key("prompt", 1000) != key
+
+
+def test_cut_off_matrix_answers_are_split_not_dropped(monkeypatch):
+    prompts = []
+
+    def fake_send(prompt, max_tokens, **options):
+        prompts.append(prompt)
+        body = prompt.split("----------------------")[1]
+        dishes = [line.split(" |")[0] for line in body.strip().splitlines()]
+        if len(dishes) > 2:
+            # More items than fit in max_tokens: the JSON stops mid-way
+            return {"text": '{"allergens_listed": ["dairy"], "items": [{"na', "finish_reason": "length"}
+        items = ", ".join(f'{{"name": "{dish}", "contains": []}}' for dish in dishes)
+        return {"text": f'{{"allergens_listed": ["dairy"], "items": [{items}]}}', "finish_reason": "stop"}
+
+    monkeypatch.setattr(llm_client, "send_prompt", fake_send)
+    text = "\n".join(f"Dish {i} | Milk: No" for i in range(8))
+
+    matrices = [matrix for _, _, matrix in iter_gpt_matrix(text)]
+
+    assert len(matrices) == 1
+    assert matrices[0].items == [f"Dish {i}" for i in range(8)]
+    assert len(prompts) == 7  # the chunk, its halves and their halves
+
+
+def test_unusable_answer_for_a_single_row_is_an_error(monkeypatch):
+    monkeypatch.setattr(llm_client, "send_prompt", lambda prompt, max_tokens, **options: {"text": "Sorry, no."})
+
+    with pytest.raises(ValueError):
+        list(iter_gpt_matrix("Greek Salad | Milk: No"))
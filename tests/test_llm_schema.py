@@ -0,0 +1,57 @@
+import sys
+import os
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from food_lens import llm_client
+from food_lens.agent import ask_gpt_for_all_allergens
+from food_lens.cache import MemoryCache
+from food_lens.llm_schema import parse_matrix_result
+
+ANSWER = {
+    "allergens_listed": ["Milk", "Egg", "Wheat"],
+    "items": [
+        {"name": "Greek Salad", "category": "Full", "contains": ["milk"]},
+        {"name": "Oatmeal", "category": "full", "contains": []},
+        {"name": "Lemonade", "contains": []},
+        {"name": "Egg Bites", "category": "sub", "contains": ["Eggs", "Dairy"]},
+    ],
+}
+
+
+def test_parse_matrix_result():
+    matrix = parse_matrix_result(f"```json\n{json.dumps(ANSWER)}\n```").to_matrix()
+
+    assert matrix.allergens == ["dairy", "egg", "wheat"]
+    assert matrix.safe_items("dairy") == (["Oatmeal"], ["Lemonade"])
+    assert matrix.safe_items(["dairy", "egg"]) == (["Oatmeal"], ["Lemonade"])
+    assert matrix.safe_items("wheat") == (["Greek Salad", "Oatmeal"], ["Lemonade", "Egg Bites"])
+    # Not listed in the guide, so nothing is known to be free of it
+    assert matrix.safe_items("soy") == ([], [])
+
+
+def test_invalid_items_are_dropped():
+    answer = {"allergens_listed": ["milk"], "items": [{"name": ""}, {"contains": []}, {"name": "Tea"}]}
+    assert [item.name for item in parse_matrix_result(json.dumps(answer)).items] == ["Tea"]
+    with pytest.raises(ValueError):
+        parse_matrix_result("--- FULL MENU ITEMS ---\nGreek Salad")
+
+
+def test_one_pass_answers_every_allergen(monkeypatch):
+    prompts = []
+
+    def fake_send(prompt, max_tokens, **options):
+        prompts.append(prompt)
+        assert options["json_mode"]
+        return {"text": json.dumps(ANSWER), "prompt_tokens": 100, "completion_tokens": 50}
+
+    monkeypatch.setattr(llm_client, "send_prompt", fake_send)
+    cache = MemoryCache()
+    text = "Item | Milk | Egg | Wheat\nGreek Salad | Yes | |\nOatmeal | | |"
+
+    assert ask_gpt_for_all_allergens(text, ["dairy", "egg"], cache) == (["Oatmeal"], ["Lemonade"])
+    assert ask_gpt_for_all_allergens(text, ["wheat"], cache) == (["Greek Salad", "Oatmeal"], ["Lemonade", "Egg Bites"])
+    # The prompt does not depend on the query, so the second one reuses the answer
+    assert len(prompts) == 1
@@ -0,0 +1,93 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import fitz
+
+from food_lens import pdf_parser
+from food_lens.pdf_parser import extract_tables_from_pdf
+from food_lens.document import PdfDocument
+
+
+def draw_table(page, rows, x=50, y=50, col_width=90, row_height=20):
+    """Draw a ruled table so pdfplumber can detect it."""
+    cols = len(rows[0])
+    for r in range(len(rows) + 1):
+        page.draw_line((x, y + r * row_height), (x + cols * col_width, y + r * row_height))
+    for c in range(cols + 1):
+        page.draw_line((x + c * col_width, y), (x + c * col_width, y + len(rows) * row_height))
+    for r, row in enumerate(rows):
+        for c, cell in enumerate(row):
+            page.insert_text((x + c * col_width + 3, y + r * row_height + 14), cell, fontsize=9)
+
+
+def make_guide(path, pages):
+    doc = fitz.open()
+    for rows in pages:
+        page = doc.new_page()
+        if rows:
+            draw_table(page, rows)
+        else:
+            page.insert_text((50, 50), "Nutrition facts and legal text", fontsize=9)
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+ALLERGEN_PAGE = [["Item", "Milk", "Egg"], ["Greek Salad", "", ""], ["Latte", "Yes", ""]]
+CONTINUATION_PAGE = [["Oatmeal", "", ""], ["Omelet", "", "Yes"]]
+NUTRITION_PAGE = [["Item", "Calories"], ["Greek Salad", "320"]]
+
+
+def test_extract_tables_serial_and_parallel_match(tmp_path):
+    path = make_guide(tmp_path / "guide.pdf", [ALLERGEN_PAGE, CONTINUATION_PAGE] * 5)
+
+    serial = extract_tables_from_pdf(path)
+    parallel = extract_tables_from_pdf(path, workers=2)
+
+    assert serial == parallel
+    assert serial[0] == ALLERGEN_PAGE
+    assert serial[1] == CONTINUATION_PAGE
+    assert len(serial) == 10
+
+
+def test_early_exit_after_allergen_tables(tmp_path):
+    pages = [ALLERGEN_PAGE, CONTINUATION_PAGE, NUTRITION_PAGE, None, NUTRITION_PAGE, ALLERGEN_PAGE]
+    path = make_guide(tmp_path / "guide.pdf", pages)
+
+    tables = extract_tables_from_pdf(path, stop_after_allergen_tables=True)
+
+    # Stops after two non-allergen pages; the last page is never read
+    assert tables == [ALLERGEN_PAGE, CONTINUATION_PAGE, NUTRITION_PAGE]
+    assert len(extract_tables_from_pdf(path)) == 5
+
+
+def test_document_fast_and_precise_tables_match(tmp_path):
+    path = make_guide(tmp_path / "guide.pdf", [ALLERGEN_PAGE, CONTINUATION_PAGE, None])
+    with open(path, "rb") as f:
+        data = f.read()
+
+    with PdfDocument(data) as fast, PdfDocument(data, precise_tables=True) as precise:
+        assert fast.tables() == precise.tables() == [ALLERGEN_PAGE, CONTINUATION_PAGE]
+        assert "Nutrition facts" in fast.text
+        assert fast.page_count == 3
+
+
+def test_workers_get_the_pdf_once_for_either_table_finder(tmp_path, monkeypatch):
+    path = make_guide(tmp_path / "guide.pdf", [ALLERGEN_PAGE, CONTINUATION_PAGE] * 5)
+    with open(path, "rb") as f:
+        data = f.read()
+    submitted = []
+
+    class RecordingPool(pdf_parser.ProcessPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            submitted.append(args)
+            return super().submit(fn, *args, **kwargs)
+
+    monkeypatch.setattr(pdf_parser, "ProcessPoolExecutor", RecordingPool)
+    for precise in (False, True):
+        with PdfDocument(data, precise_tables=precise, workers=2) as document:
+            assert document.tables() == [ALLERGEN_PAGE, CONTINUATION_PAGE] * 5
+    # Three shards of four pages per document, each sent as page numbers only
+    assert len(submitted) == 6
+    assert all(not isinstance(arg, bytes) for args in submitted for arg in args)
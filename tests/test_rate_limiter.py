@@ -0,0 +1,24 @@
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from food_lens.rate_limiter import TokenBucket, RateLimiter
+
+
+def test_token_bucket_blocks_until_refilled():
+    bucket = TokenBucket(rate_per_minute=600, capacity=2)  # 10 tokens/second
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() > 0
+
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.05
+
+
+def test_oversized_request_is_clamped_to_capacity():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1000)
+    start = time.monotonic()
+    limiter.acquire(5000)
+    assert time.monotonic() - start < 0.1
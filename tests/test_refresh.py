@@ -0,0 +1,141 @@
+import sys
+import os
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from food_lens import agent, refresh
+from food_lens.agent import iter_analyze_restaurant_allergens
+from food_lens.cache import MemoryCache
+from food_lens.events import ResultEvent
+from food_lens.refresh import RefreshScheduler, set_refresh_scheduler
+
+GUIDE = "https://example.com/allergens.pdf"
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = RefreshScheduler(MemoryCache(), interval=3600, workers=1)
+    previous = set_refresh_scheduler(scheduler)
+    yield scheduler
+    scheduler.stop()
+    set_refresh_scheduler(previous)
+
+
+@pytest.fixture
+def guide(monkeypatch):
+    """A fake guide whose analysis returns guide["result"], blocking while guide["gate"] is clear."""
+    state = {"result": (["Greek Salad"], []), "analyses": 0, "gate": threading.Event(), "modified": True, "checks": []}
+    state["gate"].set()
+
+    def fake_analyze(pdf_url, allergens, cache, tracker):
+        state["gate"].wait(5)
+        state["analyses"] += 1
+        return state["result"]
+        yield
+
+    def fake_check(url, etag=None, last_modified=None):
+        state["checks"].append(url)
+        return {"modified": state["modified"], "etag": '"v2"', "last_modified": None}
+
+    monkeypatch.setattr(agent, "cached_search", lambda name, cache: {"restaurant": name, "pdf_url": GUIDE, "html_url": None})
+    monkeypatch.setattr(agent, "iter_analyze_pdf", fake_analyze)
+    monkeypatch.setattr(refresh, "check_modified", fake_check)
+    return state
+
+
+def final(restaurant, cache):
+    return [event for event in iter_analyze_restaurant_allergens(restaurant, "dairy", cache) if isinstance(event, ResultEvent)][-1]
+
+
+def test_stale_result_is_served_while_it_is_refreshed(scheduler, guide):
+    assert final("Example", scheduler.cache).result == (["Greek Salad"], [])
+    assert guide["analyses"] == 1
+
+    # Past the refresh interval, the guide changed and its analysis is slow
+    scheduler.interval = 0
+    guide["result"], guide["gate"] = (["Oatmeal"], []), threading.Event()
+    stale = final("Example", scheduler.cache)
+    assert (stale.result, stale.stale) == ((["Greek Salad"], []), True)
+    assert scheduler.status()["refreshing"] == 1
+
+    guide["gate"].set()
+    assert scheduler.wait(5)
+    assert guide["analyses"] == 2
+    scheduler.interval = 3600
+    fresh = final("Example", scheduler.cache)
+    assert (fresh.result, fresh.stale) == ((["Oatmeal"], []), False)
+    assert scheduler.load(refresh.query_key("Example", ["dairy"])).etag == '"v2"'
+
+
+def test_unchanged_guide_is_not_analyzed_again(scheduler, guide):
+    final("Example", scheduler.cache)
+    scheduler.interval = 0
+    guide["modified"] = False
+
+    final("Example", scheduler.cache)
+    assert scheduler.wait(5)
+    assert guide["analyses"] == 1
+    assert guide["checks"] == [GUIDE]
+
+
+def test_popular_queries_are_refreshed_first(scheduler, guide):
+    gate = threading.Event()
+    order = []
+    scheduler.interval = 0
+    scheduler.record("Quiet Cafe", ["dairy"], "https://example.com/quiet.pdf", ([], []))
+    scheduler.record("Busy Diner", ["dairy"], "https://example.com/busy.pdf", ([], []))
+    scheduler.tracked[refresh.query_key("Busy Diner", ["dairy"])].hits = 10
+
+    def blocking_refresh(key):
+        gate.wait(5)
+        order.append(scheduler.tracked[key].restaurant)
+        with scheduler.lock:
+            scheduler.refreshing.discard(key)
+
+    scheduler.refresh = blocking_refresh
+    assert scheduler.refresh_due() == 2
+    # Already refreshing, so not started twice
+    assert scheduler.refresh_due() == 0
+    gate.set()
+    assert scheduler.wait(5)
+    assert order == ["Busy Diner", "Quiet Cafe"]
+
+
+def test_queries_nobody_asks_for_are_forgotten(scheduler, guide):
+    final("Example", scheduler.cache)
+    key = refresh.query_key("Example", ["dairy"])
+    scheduler.interval = 0
+    scheduler.tracked[key].last_requested_at -= refresh.TRACKED_TTL
+
+    assert scheduler.refresh_due() == 0
+    assert key not in scheduler.tracked
+    assert scheduler.cache.get("refresh", key) is None
+    assert guide["checks"] == []
+
+
+def test_refreshes_do_not_extend_a_querys_life(scheduler, guide):
+    final("Example", scheduler.cache)
+    key = refresh.query_key("Example", ["dairy"])
+    scheduler.interval = 0
+    requested_at = scheduler.tracked[key].last_requested_at - 60
+    scheduler.tracked[key].last_requested_at = requested_at
+
+    for modified in (False, True):
+        guide["modified"] = modified
+        assert scheduler.refresh_due() == 1
+        assert scheduler.wait(5)
+        assert scheduler.tracked[key].last_requested_at == requested_at
+    assert guide["analyses"] == 2
+
+
+def test_html_guides_are_tracked_with_their_validators(scheduler, monkeypatch):
+    url = "https://example.com/allergens.html"
+    monkeypatch.setattr(agent, "extract_guide_from_html", lambda url: {
+        "sections": ["Greek Salad: none"], "tables": [], "etag": '"h1"', "last_modified": None,
+    })
+
+    agent.fetch_html_guide(url, scheduler.cache)
+    agent.track_result(scheduler, "Example", ["dairy"], {"pdf_url": None, "html_url": url}, (["Greek Salad"], []), scheduler.cache)
+    assert scheduler.load(refresh.query_key("Example", ["dairy"])).etag == '"h1"'
@@ -0,0 +1,122 @@
+import sys
+import os
+import time
+import subprocess
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from food_lens import agent
+from food_lens.agent import analyze_restaurant_allergens
+from food_lens.cache import MemoryCache
+from food_lens import restaurant_index
+from food_lens.restaurant_index import RestaurantIndexStore
+from test_pdf_parser import make_guide, ALLERGEN_PAGE
+
+CHAINS = ["Chick-fil-A", "Panera Bread", "McDonald's", "Taco Bell", "Five Guys", "Store 1"]
+
+
+def make_store(tmp_path):
+    store = RestaurantIndexStore(str(tmp_path / "index.idx"))
+    for name in CHAINS:
+        store.record(name, pdf_url=f"https://example.com/{len(name)}.pdf", items=["Greek Salad", "Latte"])
+    return store
+
+
+def test_lookup_matches_spellings(tmp_path):
+    store = make_store(tmp_path)
+
+    for query in ["chick fil a", "chickfila ", "Chick-Fil-A®", "CHICK FIL A"]:
+        assert store.lookup(query)["name"] == "Chick-fil-A"
+    assert store.lookup("mcdonalds")["name"] == "McDonald's"
+    assert store.lookup("Pizza Hut") is None
+    assert store.lookup("Store 12") is None
+
+    # Typos and partial names are only suggested, never resolved
+    assert store.lookup("Chik-fil-a") is None
+    assert store.suggest("Chik-fil-a") == ["Chick-fil-A"]
+    assert store.lookup("panera") is None
+
+    # Recording again merges items into the existing entry
+    store.record("chickfila", items=["Waffle Fries"])
+    record = store.lookup("Chick-fil-A")
+    assert record["items"] == ["Greek Salad", "Latte", "Waffle Fries"]
+    assert len(store.index()) == len(CHAINS)
+
+
+def test_similar_names_of_other_chains_are_not_resolved(tmp_path):
+    store = RestaurantIndexStore(str(tmp_path / "index.idx"))
+    for name in ["BurgerFi", "Church's Chicken", "Del Taco", "Smoothie King"]:
+        store.record(name, pdf_url="https://example.com/guide.pdf")
+
+    for query in ["Burger Kitchen", "Church's Texas Chicken", "Del Taco Loco", "Smoothie"]:
+        assert store.lookup(query) is None, query
+    assert store.lookup("del taco")["name"] == "Del Taco"
+
+
+def test_updates_are_journaled_and_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(restaurant_index, "COMPACT_EVERY", 4)
+    path = tmp_path / "index.idx"
+    store = RestaurantIndexStore(str(path))
+    for i in range(10):
+        store.record(f"Chain {i}", pdf_url=f"https://example.com/{i}.pdf")
+
+    # Two compactions wrote the index file; the last two updates are only appended
+    assert len(RestaurantIndexStore(str(path)).read()) == 8
+    assert len((tmp_path / "index.idx.log").read_text().splitlines()) == 2
+    reader = RestaurantIndexStore(str(path))
+    assert [reader.lookup(f"chain {i}")["pdf_url"] for i in (0, 9)] == ["https://example.com/0.pdf", "https://example.com/9.pdf"]
+    assert len(reader.index()) == 10
+
+    # A journaled update wins over the compacted record
+    store.record("Chain 0", items=["Latte"])
+    assert reader.lookup("Chain 0")["items"] == ["Latte"]
+    assert reader.lookup("Chain 0")["pdf_url"] == "https://example.com/0.pdf"
+
+
+def test_writers_in_other_processes_keep_each_others_records(tmp_path):
+    path = str(tmp_path / "index.idx")
+    script = (
+        "import sys; from food_lens.restaurant_index import RestaurantIndexStore; "
+        "store = RestaurantIndexStore(sys.argv[1]); "
+        "[store.record(f'{sys.argv[2]} {i}', pdf_url='https://example.com/g.pdf') for i in range(15)]"
+    )
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    writers = [
+        subprocess.Popen([sys.executable, "-c", script, path, f"Chain {letter}"], cwd=root)
+        for letter in "abcd"
+    ]
+    assert all(writer.wait(60) == 0 for writer in writers)
+    assert len(RestaurantIndexStore(path).index()) == 60
+
+
+def test_lookups_take_well_under_a_millisecond(tmp_path):
+    index = make_store(tmp_path).index()
+    started = time.perf_counter()
+    for _ in range(1000):
+        index.lookup("Chick fil a")
+        index.suggest("Chik fil a")
+    assert (time.perf_counter() - started) / 1000 < 0.001
+
+
+def test_known_restaurant_spellings_share_one_search(tmp_path, monkeypatch):
+    path = make_guide(tmp_path / "guide.pdf", [ALLERGEN_PAGE])
+    with open(path, "rb") as f:
+        data = f.read()
+
+    searches = []
+
+    def fake_search(name):
+        searches.append(name)
+        return {"restaurant": name, "pdf_url": "https://example.com/allergens.pdf", "html_url": None}
+
+    monkeypatch.setattr(agent, "search_allergen_page", fake_search)
+    monkeypatch.setattr(agent, "fetch_pdf", lambda url, **options: {"content": data, "etag": None, "last_modified": None})
+
+    cache = MemoryCache()
+    assert analyze_restaurant_allergens("Chick-fil-A", "dairy", cache=cache) == (["Greek Salad"], [])
+    assert analyze_restaurant_allergens("chickfila ", "dairy", cache=cache) == (["Greek Salad"], [])
+    assert analyze_restaurant_allergens("CHICK FIL A", "dairy, egg", cache=cache) == (["Greek Salad"], [])
+    assert searches == ["Chick-fil-A"]
+
+    # A similar name may be another chain, so it gets a search of its own
+    analyze_restaurant_allergens("Chik fil a", "dairy", cache=cache)
+    assert searches == ["Chick-fil-A", "Chik fil a"]
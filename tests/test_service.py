@@ -0,0 +1,99 @@
+import sys
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from food_lens import service
+from food_lens.cache import MemoryCache
+from food_lens.events import ProgressEvent, ItemsEvent, ResultEvent
+from food_lens.service import JobManager, serve
+from food_lens.service_client import ServiceClient
+
+
+@pytest.fixture
+def running_service():
+    manager = JobManager(workers=2, max_queue=50, cache=MemoryCache())
+    loop = asyncio.new_event_loop()
+    state = {}
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        state["task"] = loop.create_task(serve(manager, port=0, ready=lambda port: (state.update(port=port), ready.set())))
+        try:
+            loop.run_until_complete(state["task"])
+        except asyncio.CancelledError:
+            pass
+        loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert ready.wait(5)
+    yield manager, f"http://127.0.0.1:{state['port']}"
+    loop.call_soon_threadsafe(state["task"].cancel)
+    thread.join(5)
+
+
+def test_identical_requests_share_one_run(running_service, monkeypatch):
+    manager, url = running_service
+    release = threading.Event()
+    calls = []
+
+    def fake_analyze(restaurant, allergens, cache=None):
+        calls.append(restaurant)
+        yield ProgressEvent("search", "Searching")
+        release.wait(5)
+        yield ItemsEvent(["Greek Salad"], [], "tables")
+        yield ResultEvent((["Greek Salad"], ["Latte"]))
+
+    monkeypatch.setattr(service, "iter_analyze_restaurant_allergens", fake_analyze)
+    client = ServiceClient(url)
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        jobs = list(executor.map(lambda _: client.submit("Panera", "dairy"), range(10)))
+    assert len({job["id"] for job in jobs}) == 1
+    assert sum(job["coalesced"] for job in jobs) == 9
+
+    # A streaming client joins the same run and receives all of its events
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        streamed = executor.submit(lambda: list(client.iter_analyze_restaurant_allergens("panera ", ["dairy"])))
+        while client.job(jobs[0]["id"])["requests"] < 11:
+            pass
+        release.set()
+        events = streamed.result(timeout=10)
+
+    assert calls == ["Panera"]
+    assert [type(event) for event in events] == [ProgressEvent, ItemsEvent, ResultEvent]
+    assert events[-1].result == (["Greek Salad"], ["Latte"])
+    assert client.status()["jobs"]["done"] >= 1
+
+
+def test_allergen_order_does_not_split_jobs(monkeypatch):
+    release = threading.Event()
+
+    def fake_analyze(restaurant, allergens, cache=None):
+        release.wait(5)
+        yield ResultEvent(([], []))
+
+    monkeypatch.setattr(service, "iter_analyze_restaurant_allergens", fake_analyze)
+    manager = JobManager(workers=1, max_queue=10, cache=MemoryCache())
+    try:
+        first, _ = manager.submit_analysis("Panera", ["dairy", "egg"])
+        second, coalesced = manager.submit_analysis("panera", ["egg", "dairy"])
+        assert coalesced and second is first
+    finally:
+        release.set()
+        manager.shutdown()
+
+
+def test_invalid_requests_are_rejected(running_service):
+    _, url = running_service
+    client = ServiceClient(url)
+    with pytest.raises(RuntimeError, match="Unsupported allergen"):
+        client.request("POST", "/analyze", json={"restaurant": "Panera", "allergens": ["gravel"]})
+    with pytest.raises(RuntimeError, match="404"):
+        client.job("0123456789ab")
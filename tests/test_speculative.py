@@ -0,0 +1,97 @@
+import sys
+import os
+import time
+from dataclasses import replace
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from food_lens import agent
+from food_lens.agent import drain
+from food_lens.cache import MemoryCache
+from food_lens.config import AppContext, get_settings, set_context
+from food_lens.events import ProgressEvent
+from food_lens.speculative import Candidate, Strategy, iter_race, passes_quality
+
+ITEMS = (["Greek Salad", "Oatmeal"], ["Lemonade", "Tea"])
+
+
+def strategy(name, result, covered=("dairy",), delay=0.0, costly=False, log=None):
+    def run():
+        log.append(f"{name} started")
+        try:
+            deadline = time.monotonic() + delay
+            while time.monotonic() < deadline:
+                yield ProgressEvent(name, "working")
+                time.sleep(0.01)
+            return Candidate(f"https://example.com/{name}", "sha", result, set(covered))
+        finally:
+            log.append(f"{name} stopped")
+
+    return Strategy(name, run, costly=costly)
+
+
+def accept(candidate):
+    return passes_quality(candidate, ["dairy"], min_items=3)
+
+
+def test_first_good_result_wins_and_the_rest_are_cancelled():
+    log = []
+    strategies = [
+        strategy("tables", ITEMS, delay=0.05, log=log),
+        strategy("html", ITEMS, delay=5, costly=True, log=log),
+    ]
+    name, candidate = drain(iter_race(strategies, accept, policy="latency"))
+
+    assert (name, candidate.result) == ("tables", ITEMS)
+    deadline = time.monotonic() + 2
+    while "html stopped" not in log and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "html stopped" in log
+
+
+def test_cost_policy_only_pays_for_llm_when_tables_fail():
+    log = []
+    good = [strategy("tables", ITEMS, log=log), strategy("html", ITEMS, costly=True, log=log)]
+    assert drain(iter_race(good, accept, policy="cost"))[0] == "tables"
+    assert "html started" not in log
+
+    # Tables without a milk column fail the quality check, so the text path runs
+    log = []
+    bad_tables = [strategy("tables", ITEMS, covered=("egg",), log=log), strategy("html", ITEMS, costly=True, log=log)]
+    assert drain(iter_race(bad_tables, accept, policy="cost"))[0] == "html"
+
+
+def test_balanced_policy_hedges_a_slow_table_path():
+    log = []
+    strategies = [
+        strategy("tables", ITEMS, delay=5, log=log),
+        strategy("html", ITEMS, delay=0.02, costly=True, log=log),
+    ]
+    started = time.monotonic()
+    name, _ = drain(iter_race(strategies, accept, policy="balanced", hedge_ms=100))
+
+    assert name == "html"
+    assert 0.1 <= time.monotonic() - started < 2
+
+
+def test_html_strategies_share_one_fetch_of_the_page(monkeypatch):
+    fetches = []
+
+    def fake_extract(url):
+        fetches.append(url)
+        time.sleep(0.05)
+        return {"sections": ["Item Milk Egg\nGreek Salad"], "tables": [[["Item", "Milk"], ["Greek Salad", ""]]],
+                "etag": None, "last_modified": None}
+
+    def fake_gpt(sections, allergens, tracker, cache):
+        return ITEMS
+        yield
+
+    monkeypatch.setattr(agent, "extract_guide_from_html", fake_extract)
+    monkeypatch.setattr(agent, "iter_gpt_for_all_allergens", fake_gpt)
+    set_context(AppContext(replace(get_settings(), race_policy="latency", race_min_items=3)))
+
+    result = drain(agent.iter_race_sources(None, "https://example.com/allergens.html", ["dairy"], MemoryCache()))
+
+    # The page's one table has too few items, so GPT's reading of the same download wins
+    assert result == ITEMS
+    assert fetches == ["https://example.com/allergens.html"]
@@ -0,0 +1,43 @@
+import sys
+import os
+import re
+import subprocess
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from food_lens.config import AppContext, Settings
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Cumulative import time allowed for food_lens.agent in a fresh interpreter
+IMPORT_BUDGET_MS = float(os.getenv("FOODLENS_IMPORT_BUDGET_MS", 600))
+HEAVY_MODULES = ["fitz", "pdfplumber", "pdfminer", "bs4", "openai", "tenacity", "dotenv"]
+
+
+def import_in_subprocess(module):
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    env = {k: v for k, v in os.environ.items() if k not in {"OPENAI_API_KEY", "SERPAPI_API_KEY"}}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    match = re.search(rf"\|\s*(\d+) \| {re.escape(module)}$", result.stderr, re.MULTILINE)
+    return int(match.group(1)) / 1000, [m for m in result.stdout.strip().split(",") if m]
+
+
+def test_agent_import_is_light_and_within_budget():
+    # Importing needs no API keys and defers PDF, HTML and OpenAI libraries to first use
+    import_ms, loaded = import_in_subprocess("food_lens.agent")
+    assert loaded == []
+    assert import_ms < IMPORT_BUDGET_MS, f"food_lens.agent took {import_ms:.0f} ms to import"
+
+
+def test_clients_are_created_on_first_use():
+    missing_key = AppContext(Settings())
+    with pytest.raises(EnvironmentError):
+        missing_key.openai_client
+
+    context = AppContext(Settings(openai_api_key="test", openai_base_url="http://127.0.0.1:9/v1"))
+    assert context.openai_client is context.openai_client
+    assert str(context.openai_client.base_url).startswith("http://127.0.0.1:9")
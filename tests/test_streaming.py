@@ -0,0 +1,84 @@
+import sys
+import os
+import json
+import subprocess
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import fitz
+import pytest
+
+from food_lens.utils import chunk_sections, iter_chunk_sections, iter_merge_multiline_items, merge_multiline_items
+
+# Runs the GPT text path over a guide in a fresh process and prints how much its peak RSS grew
+PIPELINE = """
+import sys, json
+from dataclasses import replace
+from food_lens import llm_client
+from food_lens.agent import ask_gpt_for_all_allergens, gpt_pages
+from food_lens.config import AppContext, Settings, set_context
+from food_lens.document import PdfDocument
+
+set_context(AppContext(replace(Settings(), streaming=sys.argv[2] == "1", restaurant_index_path=None)))
+llm_client.send_prompt = lambda prompt, max_tokens, **options: {"text": '{"items": []}'}
+
+def peak_kb():
+    # VmHWM starts afresh with the process; ru_maxrss would carry over pytest's own peak
+    with open("/proc/self/status") as status:
+        return next(int(line.split()[1]) for line in status if line.startswith("VmHWM"))
+
+before = peak_kb()
+with PdfDocument(sys.argv[1]) as document:
+    ask_gpt_for_all_allergens(gpt_pages(document), ["dairy"])
+print(json.dumps({"growth_mb": (peak_kb() - before) / 1024}))
+"""
+
+
+def make_text_guide(path, pages, lines_per_page=160):
+    doc = fitz.open()
+    for p in range(pages):
+        lines = [
+            f"Roasted Chipotle Sandwich {p}-{i} with a long descriptive name | Milk: Yes | Egg: Yes"
+            for i in range(lines_per_page)
+        ]
+        doc.new_page().insert_text((10, 10), lines, fontsize=3, lineheight=1.6)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def peak_growth_mb(path, streaming):
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    output = subprocess.run(
+        [sys.executable, "-c", PIPELINE, path, "1" if streaming else "0"],
+        capture_output=True, text=True, check=True, cwd=root, env={**os.environ, "PYTHONPATH": root},
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])["growth_mb"]
+
+
+def test_streamed_chunks_match_and_are_lazy():
+    sections = [f"Page {i}\n" + "\n".join(f"Dish {i}-{j} | Milk: No" for j in range(30)) for i in range(40)]
+    assert list(iter_chunk_sections(iter(sections), max_tokens=300)) == chunk_sections(sections, max_tokens=300)
+    assert list(iter_merge_multiline_items(["Greek Salad", "Milk: Yes"])) == merge_multiline_items(["Greek Salad", "Milk: Yes"])
+
+    read = []
+
+    def pages():
+        for section in sections:
+            read.append(section)
+            yield section
+
+    first = next(iter_chunk_sections(pages(), max_tokens=300))
+    assert first.text.startswith("Page 0")
+    assert len(read) < 5
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="reads peak RSS from /proc")
+def test_streaming_peak_memory_does_not_grow_with_pages(tmp_path):
+    short = make_text_guide(tmp_path / "short.pdf", 30)
+    long = make_text_guide(tmp_path / "long.pdf", 300)
+
+    streamed = peak_growth_mb(long, streaming=True)
+
+    # Ten times the pages may cost a little more, but nowhere near ten times the text
+    assert streamed < peak_growth_mb(short, streaming=True) + 12
+    assert streamed < peak_growth_mb(long, streaming=False)
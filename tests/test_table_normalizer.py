@@ -0,0 +1,64 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from food_lens.allergen_matrix import AllergenMatrix
+from food_lens.smart_table_parser import extract_safe_items_from_tables
+from food_lens.table_normalizer import TableNormalizer, find_header, normalize_mark, normalize_tables
+
+
+def test_two_row_and_rotated_headers():
+    table = [
+        ["Allergen Guide", "", "", ""],
+        ["Menu Item", "Tree", "Shell", "M\ni\nl\nk"],
+        ["", "Nuts", "fish", ""],
+        ["Pecan Pie", "●", "", ""],
+    ]
+    assert find_header(table) == (3, ["Allergen Guide Menu Item", "Tree Nuts", "Shell fish", "M\ni\nl\nk"])
+    assert normalize_tables([table]) == [
+        [["Allergen Guide Menu Item", "Tree Nuts", "Shellfish", "Milk"], ["Pecan Pie", "Yes", "", ""]],
+    ]
+    # A data row naming an allergen is not a header
+    assert find_header([["Egg Sandwich", "", ""], ["Oatmeal", "", ""]]) is None
+
+
+def test_single_allergen_column_with_a_longer_label():
+    for label in ["Contains Milk", "Milk (Dairy)"]:
+        table = [["Item", label], ["Greek Salad", ""], ["Latte", "Yes"]]
+        assert find_header(table) == (1, ["Item", label])
+        assert extract_safe_items_from_tables([table], "milk") == (["Greek Salad"], [])
+        assert AllergenMatrix.from_tables([table]).safe_items("dairy") == (["Greek Salad"], [])
+    # Without marks below it, a cell naming an allergen is still data
+    assert find_header([["Egg Sandwich", "450"], ["Oatmeal", "160"]]) is None
+
+
+def test_mark_encodings():
+    assert [normalize_mark(cell) for cell in ["✓", "X", "●", "", "-", "○", "no", " ", "May Contain"]] == [
+        "Yes", "Yes", "Yes", "Yes", "", "", "", "", "Yes",
+    ]
+    # Unknown text is kept, and the matrix treats it as present
+    assert normalize_mark("Traces") == "Traces"
+
+
+def test_categories_merged_names_and_continued_tables():
+    page_one = [
+        ["Item", "Milk", "Egg", "Calories"],
+        ["SALADS", "", "", ""],
+        ["Greek Salad", "", "", "320"],
+        ["Cobb Salad", "", "✓", "540"],
+        ["", "✓", "", ""],
+        ["Drinks:", "", "", ""],
+    ]
+    # The table goes on, without its header, on the next page
+    page_two = [["Lemonade", "", "", "120"], ["Latte", "X", "", "190"]]
+    nutrition = [["Item", "Calories"], ["Greek Salad", "320"]]
+
+    normalizer = TableNormalizer()
+    first = normalizer.feed([page_one])
+    second = normalizer.feed([page_two, nutrition])
+
+    assert first == [[["Item", "Milk", "Egg"], ["Greek Salad", "", ""], ["Cobb Salad", "Yes", "Yes"]]]
+    assert second == [[["Item", "Milk", "Egg"], ["Lemonade", "", ""], ["Latte", "Yes", ""]]]
+
+    matrix = AllergenMatrix.from_tables([page_one, page_two, nutrition])
+    assert matrix.safe_items("dairy") == (["Greek Salad"], ["Lemonade"])
@@ -0,0 +1,72 @@
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from food_lens import utils
+
+
+def test_probe_links_prefers_best_ranked_pdf(monkeypatch):
+    links = [
+        "https://a.com/menu",
+        "https://b.com/slow.pdf",
+        "https://c.com/fast.pdf",
+        "https://d.com/hang",
+    ]
+    delays = {links[0]: 0.05, links[1]: 0.2, links[2]: 0.0, links[3]: 5}
+    kinds = {links[0]: "html", links[1]: "pdf", links[2]: "pdf", links[3]: None}
+
+    def fake_probe(link, timeout=5):
+        time.sleep(delays[link])
+        return kinds[link]
+
+    monkeypatch.setattr(utils, "probe_link", fake_probe)
+
+    start = time.monotonic()
+    probed = utils.probe_links(links, deadline=3)
+    elapsed = time.monotonic() - start
+
+    # The faster, lower-ranked PDF does not beat the higher-ranked one,
+    # and the hanging link does not hold up the result
+    assert utils.pick_allergen_sources(links, probed) == (links[1], links[0])
+    assert elapsed < 1
+
+
+def test_probe_links_deadline(monkeypatch):
+    links = ["https://a.com/x.pdf", "https://b.com/y.pdf"]
+
+    def fake_probe(link, timeout=5):
+        time.sleep(0.0 if link == links[1] else 2)
+        return "pdf"
+
+    monkeypatch.setattr(utils, "probe_link", fake_probe)
+
+    probed = utils.probe_links(links, deadline=0.3)
+    assert utils.pick_allergen_sources(links, probed) == (links[1], None)
+
+
+def test_chunk_rows_respects_budget_and_carries_header():
+    header = "Menu Item Milk Egg Wheat Soy Sesame"
+    rows = [f"Menu item number {i} with a fairly long descriptive name No Major Allergens Present" for i in range(60)]
+    text = "\n".join([header] + rows)
+
+    chunks = utils.chunk_rows(text, max_tokens=200)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        lines = chunk.text.splitlines()
+        assert lines[0] == header
+        assert chunk.tokens <= 200
+        assert chunk.tokens == sum(utils.count_tokens(line) + 1 for line in lines)
+
+    # Every row appears exactly once, in order
+    body = [line for chunk in chunks for line in chunk.text.splitlines() if line != header]
+    assert body == rows
+
+
+def test_chunk_rows_splits_oversized_rows():
+    text = " ".join(f"word{i}" for i in range(500))
+    chunks = utils.chunk_rows(text, max_tokens=100)
+    assert len(chunks) > 1
+    assert all(chunk.tokens <= 101 for chunk in chunks)
+    assert utils.chunk_text(text, max_tokens=100) == [chunk.text for chunk in chunks]
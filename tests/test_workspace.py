@@ -0,0 +1,48 @@
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from food_lens.document import PdfDocument
+from food_lens.workspace import Workspace
+from test_pdf_parser import make_guide, ALLERGEN_PAGE, NUTRITION_PAGE
+
+
+def test_small_files_stay_in_memory_and_large_ones_spill(tmp_path):
+    with Workspace(spill_bytes=100, parent_dir=str(tmp_path)) as workspace:
+        small = workspace.file()
+        small.write(b"x" * 100)
+        assert small.source == b"x" * 100
+        assert os.listdir(tmp_path) == []
+
+        large = workspace.file(".pdf")
+        for _ in range(3):
+            large.write(b"y" * 60)
+        assert large.content is None
+        assert large.source.endswith(".pdf")
+        with open(large.source, "rb") as f:
+            assert f.read() == b"y" * 180
+    assert os.listdir(tmp_path) == []
+
+
+def test_concurrent_workspaces_do_not_share_files(tmp_path):
+    guides = {
+        "allergens": open(make_guide(tmp_path / "a.pdf", [ALLERGEN_PAGE]), "rb").read(),
+        "nutrition": open(make_guide(tmp_path / "b.pdf", [NUTRITION_PAGE]), "rb").read(),
+    }
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+
+    def analyze(name):
+        with Workspace(spill_bytes=0, parent_dir=str(scratch)) as workspace:
+            body = workspace.file(".pdf")
+            body.write(guides[name])
+            with PdfDocument(body.source) as document:
+                return name, document.text
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(analyze, ["allergens", "nutrition"] * 8))
+
+    for name, text in results:
+        assert ("Latte" in text) == (name == "allergens")
+    assert os.listdir(scratch) == []